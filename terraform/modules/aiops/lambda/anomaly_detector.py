@@ -1,77 +1,313 @@
 """Anomaly Detector - Detect anomalies in real-time metrics using statistical methods"""
-import os, json, boto3, base64
+import os, json, math, time, boto3, base64
+from array import array
 from datetime import datetime
-from statistics import mean, stdev
+
+import detector_state
+import metric_records
+import series_registry
+from rolling_stats import RollingStats
+
+try:
+    import series_scoring
+except ImportError:  # NumPy layer not attached; score each datapoint with the rolling z-score
+    series_scoring = None
 
 sns = boto3.client('sns')
 cloudwatch = boto3.client('cloudwatch')
+s3 = boto3.client('s3')
 
 PROJECT_NAME = os.environ['PROJECT_NAME']
 ENVIRONMENT = os.environ['ENVIRONMENT']
 SNS_TOPIC_ARN = os.environ['SNS_TOPIC_ARN']
 ANOMALY_THRESHOLD = float(os.environ.get('ANOMALY_THRESHOLD', '0.8'))
+HISTORY_WINDOW = int(os.environ.get('HISTORY_WINDOW', '100'))
+STATE_BUCKET = os.environ.get('STATE_BUCKET', '')
+STATE_PREFIX = 'detector-state'
+DEAD_LETTER_PREFIX = 'dead-letter'
+SPILL_PREFIX = 'detector-spill'
+SERIES_MEMORY_MB = int(os.environ.get('SERIES_MEMORY_MB', '256'))
+SERIES_TTL_HOURS = float(os.environ.get('SERIES_TTL_HOURS', '24'))
+SPILL_EVICTED = os.environ.get('SPILL_EVICTED', 'true').lower() == 'true'
+SPILL_RETENTION_DAYS = float(os.environ.get('SPILL_RETENTION_DAYS', '7'))
+# Metric name -> detector (zscore, ewma, robust, holt_winters) for the batch path
+METRIC_DETECTORS = json.loads(os.environ.get('METRIC_DETECTORS') or '{}')
+MIN_HISTORY = 10
+
+# Snapshot key -> shard state, least recently loaded first; each shard's 'series'
+# maps (instance id, metric name) to RollingStats over the last HISTORY_WINDOW values
+shard_history = {}
 
-# In-memory cache for historical data (simplified)
-metrics_history = {}
+# Bounds the series held across shard_history to SERIES_MEMORY_MB
+registry = series_registry.new_registry(SERIES_MEMORY_MB * 1024 * 1024, HISTORY_WINDOW, SERIES_TTL_HOURS * 3600)
 
 def handler(event, context):
-    """Process Kinesis stream records and detect anomalies"""
+    """
+    Process Kinesis stream records and detect anomalies. Reports the first
+    record of each shard that could not be processed in batchItemFailures,
+    so only that shard's tail is retried.
+    """
+    by_shard = {}
+    for record in event['Records']:
+        by_shard.setdefault(record['eventID'].split(':')[0], []).append(record)
+    
     anomalies = []
+    failures = []
+    before = series_registry.counts(registry, list(shard_history.values()))
+    for shard_id, records in by_shard.items():
+        try:
+            anomalies.extend(process_shard(shard_id, records))
+        except Exception as e:
+            print(f"Error processing {shard_id}: {str(e)}")
+            # Retry from the shard's first record; its checkpoints skip whatever was already saved
+            failures.append({'itemIdentifier': records[0]['kinesis']['sequenceNumber']})
     
-    for record in event['Records']:
-        # Decode Kinesis data
-        payload = json.loads(base64.b64decode(record['kinesis']['data']))
-        
-        # Check for anomaly
-        if is_anomaly(payload):
-            anomalies.append(payload)
-            
-            # Publish custom metric
-            cloudwatch.put_metric_data(
-                Namespace=f'{PROJECT_NAME}/{ENVIRONMENT}/AIOps',
-                MetricData=[{
-                    'MetricName': 'AnomaliesDetected',
-                    'Value': 1,
-                    'Unit': 'Count',
-                    'Timestamp': datetime.now()
-                }]
-            )
-    
-    # Send alert if anomalies detected
+    # Publish custom metrics: anomalies and this invocation's series evictions and resurrections
+    series = series_registry.counts(registry, list(shard_history.values()))
+    now = datetime.now()
+    metric_data = [{'MetricName': 'AnomaliesDetected', 'Value': len(anomalies), 'Unit': 'Count', 'Timestamp': now}] if anomalies else []
+    for metric_name, count in (
+        ('LiveSeries', series['live']),
+        ('EvictedSeries', series['evicted'] - before['evicted']),
+        ('ExpiredSeries', series['expired'] - before['expired']),
+        ('ResurrectedSeries', series['resurrected'] - before['resurrected'])
+    ):
+        metric_data.append({'MetricName': metric_name, 'Value': count, 'Unit': 'Count', 'Timestamp': now})
+    try:
+        cloudwatch.put_metric_data(Namespace=f'{PROJECT_NAME}/{ENVIRONMENT}/AIOps', MetricData=metric_data)
+    except Exception as e:
+        print(f"Error publishing metrics: {str(e)}")
+    
+    # The records are checkpointed by now, so a retry would not raise these alerts again
     if anomalies:
-        send_alert(anomalies)
+        try:
+            # Send alert if anomalies detected
+            send_alert(anomalies)
+        except Exception as e:
+            print(f"Error sending alert: {str(e)}")
+    
+    return {'statusCode': 200, 'anomalies_detected': len(anomalies), 'series': series, 'batchItemFailures': failures}
+
+def process_shard(shard_id, records):
+    """Score a shard's new records, dead-letter its poison records and persist its state"""
+    stream = records[0]['eventSourceARN'].split('/')[-1]
+    shard = load_shard(stream, shard_id)
     
-    return {'statusCode': 200, 'anomalies_detected': len(anomalies)}
+    try:
+        # Skip records an earlier attempt already applied to the series
+        new_records = [
+            r for r in records
+            if not detector_state.is_applied(shard, r['kinesis']['partitionKey'], r['kinesis']['sequenceNumber'])
+        ]
+        if not new_records:
+            return []
+        
+        # Decode Kinesis data (aggregated records hold many datapoints); undecodable records are poison
+        batch, decoded_records, poison = [], [], []
+        for record in new_records:
+            try:
+                batch.append((shard_id, base64.b64decode(record['kinesis']['data'], validate=True)))
+                decoded_records.append(record)
+            except ValueError as e:
+                poison.append((record, str(e)))
+        
+        # Check for anomalies, the whole batch at once when NumPy is available
+        shards = {shard_id: shard}
+        if series_scoring is not None:
+            anomalies, rejected = score_batch(shards, batch)
+        else:
+            anomalies, rejected = score_records(shards, batch)
+        poison.extend((decoded_records[position], error) for position, error in rejected)
+        
+        if poison:
+            dead_letter(stream, shard_id, poison)
+        for record in new_records:
+            detector_state.advance(shard, record['kinesis']['partitionKey'], record['kinesis']['sequenceNumber'])
+        
+        # Keep the cached series within the memory budget
+        bound_series(shard)
+        
+        # Persist the updated series and checkpoints
+        if STATE_BUCKET:
+            detector_state.flush(s3, STATE_BUCKET, shard)
+    except Exception:
+        # The cached copy holds updates that were not persisted; reload it on the retry
+        shard_history.pop(shard['key'], None)
+        raise
+    
+    return anomalies
 
-def is_anomaly(metric_data):
-    """Simple statistical anomaly detection using Z-score"""
-    key = f"{metric_data['instance_id']}_{metric_data['metric_name']}"
-    value = metric_data['value']
+def bound_series(current):
+    """
+    Keep the cached series within the memory budget. Other cached shards may
+    be stale (another container may own them now), so they are never evicted
+    from or written: idle ones, then the least recently loaded while over
+    budget, are dropped and reloaded from their snapshots when next seen.
+    The current shard's idle and least recently updated series are then
+    evicted, spilling them to S3 when enabled; the caller writes it back.
+    """
+    now = time.time()
+    cutoff = now - registry['ttl']
+    for key, shard in list(shard_history.items()):
+        if shard is not current and (not shard['updated'] or max(shard['updated'].values()) < cutoff):
+            del shard_history[key]
     
-    # Initialize history
-    if key not in metrics_history:
-        metrics_history[key] = []
+    live = sum(len(shard['series']) for shard in shard_history.values())
+    for key, shard in list(shard_history.items()):
+        if live <= registry['capacity']:
+            break
+        if shard is not current:
+            live -= len(shard['series'])
+            del shard_history[key]
     
-    # Add to history
-    metrics_history[key].append(value)
+    for shard, evicted in series_registry.evict(registry, [current], now):
+        if not STATE_BUCKET:
+            shard['removed'] = {}
+        elif SPILL_EVICTED:
+            detector_state.spill(s3, STATE_BUCKET, shard, evicted, now)
     
-    # Keep last 100 data points
-    if len(metrics_history[key]) > 100:
-        metrics_history[key].pop(0)
+    # Spilled series past their retention have expired from S3
+    detector_state.expire_spilled(current, now - SPILL_RETENTION_DAYS * 86400)
+
+def resurrect(shard, keys):
+    """Restore spilled series among keys (not in the shard's series) before they are scored"""
+    spilled = [key for key in keys if key in shard['spilled']]
+    if not spilled or not STATE_BUCKET:
+        return
     
-    # Need at least 10 data points
-    if len(metrics_history[key]) < 10:
+    now = time.time()
+    restored = detector_state.restore(s3, STATE_BUCKET, shard, spilled)
+    for key, stats in restored.items():
+        series_registry.touch(shard, key, stats, now)
+    registry['resurrected'] += len(restored)
+
+def dead_letter(stream, shard_id, poison):
+    """Store poison records as NDJSON under dead-letter/, keyed by their first sequence number"""
+    poison = sorted(poison, key=lambda p: int(p[0]['kinesis']['sequenceNumber']))
+    lines = [json.dumps({
+        'sequence_number': record['kinesis']['sequenceNumber'],
+        'partition_key': record['kinesis']['partitionKey'],
+        'approximate_arrival_timestamp': record['kinesis'].get('approximateArrivalTimestamp'),
+        'event_source_arn': record['eventSourceARN'],
+        'error': error,
+        'data': record['kinesis']['data']
+    }) for record, error in poison]
+    print(f"Dead-lettering {len(poison)} records from {shard_id}: {poison[0][1]}")
+    
+    if STATE_BUCKET:
+        key = f"{DEAD_LETTER_PREFIX}/{stream}/{shard_id}/{poison[0][0]['kinesis']['sequenceNumber']}.json"
+        s3.put_object(Bucket=STATE_BUCKET, Key=key, Body='\n'.join(lines).encode(), ContentType='application/x-ndjson')
+
+def score_batch(shards, batch):
+    """
+    Decode the whole batch, group it by series and score every datapoint in
+    one NumPy pass with its metric's detector
+    """
+    decoded = series_scoring.decode_batch(batch)
+    keys = decoded['keys']
+    if not keys:
+        return [], decoded['rejected']
+    
+    missing = {}
+    for shard_id, instance_id, metric_name in keys:
+        if (instance_id, metric_name) not in shards[shard_id]['series']:
+            missing.setdefault(shard_id, []).append((instance_id, metric_name))
+    for shard_id, series_keys in missing.items():
+        resurrect(shards[shard_id], series_keys)
+    
+    histories = []
+    for shard_id, instance_id, metric_name in keys:
+        stats = shards[shard_id]['series'].get((instance_id, metric_name))
+        histories.append(stats.ordered() if stats is not None else array('d'))
+    
+    matrix, columns, counts = series_scoring.build_matrix(histories, decoded['series'], decoded['values'], HISTORY_WINDOW)
+    detectors = series_scoring.detectors_for([metric_name for _, _, metric_name in keys], METRIC_DETECTORS)
+    scores = series_scoring.score_matrix(matrix, HISTORY_WINDOW, detectors, MIN_HISTORY)
+    
+    # Keep the last HISTORY_WINDOW values of each series for the next batch
+    tails, sizes, means, m2s = series_scoring.window_tails(matrix, HISTORY_WINDOW, counts)
+    now = time.time()
+    for (shard_id, instance_id, metric_name), tail, size, mean, m2 in zip(keys, tails, sizes.tolist(), means.tolist(), m2s.tolist()):
+        stats = RollingStats(HISTORY_WINDOW)
+        stats.replace(array('d', tail[HISTORY_WINDOW - size:].tobytes()), mean, m2)
+        series_registry.touch(shards[shard_id], (instance_id, metric_name), stats, now)
+    
+    # Anomaly if score > threshold (default 3 = 99.7% confidence)
+    point_scores = scores[decoded['series'], columns - HISTORY_WINDOW]
+    anomalies = []
+    for i in (abs(point_scores) > ANOMALY_THRESHOLD * 3).nonzero()[0].tolist():
+        series = int(decoded['series'][i])
+        anomalies.append({
+            'instance_id': keys[series][1],
+            'metric_name': keys[series][2],
+            'value': float(decoded['values'][i]),
+            'unit': decoded['units'][series],
+            'timestamp': float(decoded['timestamps'][i]),
+            'detector': detectors[series],
+            'score': round(float(point_scores[i]), 2)
+        })
+    return anomalies, decoded['rejected']
+
+def score_records(shards, batch):
+    """Score datapoints one at a time as they are decoded; returns anomalies and (position, error) of malformed records"""
+    anomalies = []
+    rejected = []
+    for position, (shard_id, data) in enumerate(batch):
+        shard = shards[shard_id]
+        try:
+            datapoints = list(metric_records.decode(data))
+            if not all(math.isfinite(float(d[4])) for d in datapoints):
+                raise ValueError('Non-finite metric value')
+        except metric_records.DECODE_ERRORS as e:
+            rejected.append((position, str(e) or type(e).__name__))
+            continue
+        
+        resurrect(shard, {(d[0], d[1]) for d in datapoints if (d[0], d[1]) not in shard['series']})
+        for instance_id, metric_name, unit, timestamp, value in datapoints:
+            if is_anomaly(shard, instance_id, metric_name, value):
+                anomalies.append({
+                    'instance_id': instance_id,
+                    'metric_name': metric_name,
+                    'value': value,
+                    'unit': unit,
+                    'timestamp': timestamp
+                })
+    return anomalies, rejected
+
+def load_shard(stream, shard_id):
+    """Detector state of a shard, loaded on first use and revalidated once per batch"""
+    key = detector_state.snapshot_key(STATE_PREFIX, stream, shard_id)
+    # Reinsert so shard_history stays least recently loaded first
+    shard = shard_history.pop(key, None)
+    if shard is None:
+        shard = detector_state.new_shard(key, f"{SPILL_PREFIX}/{stream}/{shard_id}")
+    shard_history[key] = shard
+    
+    if STATE_BUCKET:
+        detector_state.refresh(s3, STATE_BUCKET, shard)
+    return shard
+
+def is_anomaly(shard, instance_id, metric_name, value):
+    """Simple statistical anomaly detection using Z-score, in O(1) per datapoint"""
+    key = (instance_id, metric_name)
+    
+    # Add to history (the window drops the oldest value once full)
+    stats = shard['series'].get(key)
+    if stats is None:
+        stats = RollingStats(HISTORY_WINDOW)
+    stats.push(value)
+    series_registry.touch(shard, key, stats, time.time())
+    
+    # Need at least MIN_HISTORY data points
+    if len(stats) < MIN_HISTORY:
         return False
     
     # Calculate Z-score
-    hist = metrics_history[key]
-    avg = mean(hist)
-    std = stdev(hist) if len(hist) > 1 else 0
-    
+    std = stats.stdev()
     if std == 0:
         return False
     
-    z_score = abs((value - avg) / std)
+    z_score = abs((value - stats.mean) / std)
     
     # Anomaly if Z-score > threshold (default 3 = 99.7% confidence)
     return z_score > (ANOMALY_THRESHOLD * 3)
@@ -0,0 +1,281 @@
+"""
+Detector State - Durable per-shard snapshots of anomaly detector series
+Each Kinesis shard's series (rolling windows) are stored as one compact
+binary snapshot in S3, loaded the first time a container sees the shard
+and written back at the end of every batch that changed it.
+
+Writes are conditional on the ETag that was read (If-Match, or
+If-None-Match for a new snapshot). With a parallelization factor above 1,
+several invocations process one shard concurrently, each owning a
+disjoint set of partition keys. The one that loses the race reloads the
+snapshot, overlays the series it changed and retries, so no invocation
+overwrites another's updates. A container that already holds a shard
+revalidates it with If-None-Match and reuses its copy when unchanged.
+
+The snapshot also records, per partition key, the sequence number of the
+last record applied to the series. A retried batch skips those records,
+so a retry never feeds the same values into the windows twice.
+
+Series are kept least recently updated first, with their update times, so
+series_registry can evict from the front. Evicted series may be spilled to
+one small object each under the shard's spill prefix; the snapshot indexes
+them so only series known to be spilled are looked up when they reappear.
+
+Snapshot layout (zlib-compressed, little-endian):
+    header       '<4sHQI'  magic, format version, generation, series count
+    series       '<H' length + UTF-8 instance id, '<H' length + UTF-8 metric name,
+                 '<IIIddd' window, head, value count, mean, m2, updated at
+                 ('<IIIdd' without the update time before version 3),
+                 value count doubles
+    checkpoints  '<H' count, then per partition key '<H' length + UTF-8 key,
+                 '<H' length + ASCII sequence number (version 2)
+    spilled      '<I' count, then per series '<H' length + UTF-8 instance id,
+                 '<H' length + UTF-8 metric name, '<d' spilled at (version 3)
+"""
+
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+from urllib.parse import quote
+
+from botocore.exceptions import ClientError
+
+from rolling_stats import RollingStats
+
+MAGIC = b'ADS1'
+VERSION = 3
+HEADER = struct.Struct('<4sHQI')
+LENGTH = struct.Struct('<H')
+COUNT = struct.Struct('<I')
+SERIES = struct.Struct('<IIIddd')
+SERIES_V2 = struct.Struct('<IIIdd')
+TIME = struct.Struct('<d')
+MAX_WRITE_ATTEMPTS = 5
+
+SeriesKey = Tuple[str, str]
+
+def snapshot_key(prefix: str, stream: str, shard_id: str) -> str:
+    return f"{prefix}/{stream}/{shard_id}.bin"
+
+def new_shard(key: str, spill_prefix: str = '') -> Dict[str, Any]:
+    """
+    {'key', 'spill_prefix', 'series': OrderedDict {(instance id, metric):
+    RollingStats}, least recently updated first, 'updated': {series key:
+    epoch seconds}, 'spilled': {series key: epoch seconds}, 'checkpoints':
+    {partition key: sequence number}, 'etag', 'generation', 'dirty'
+    (changed series), 'removed' ({evicted series: its update time}),
+    'advanced' (changed checkpoints)}
+    """
+    return {
+        'key': key, 'spill_prefix': spill_prefix, 'series': OrderedDict(), 'updated': {}, 'spilled': {},
+        'checkpoints': {}, 'etag': None, 'generation': 0, 'dirty': set(), 'removed': {}, 'advanced': set()
+    }
+
+def is_applied(shard: Dict[str, Any], partition_key: str, sequence_number: str) -> bool:
+    """Whether the record was already applied to the shard's series"""
+    checkpoint = shard['checkpoints'].get(partition_key)
+    return checkpoint is not None and int(sequence_number) <= int(checkpoint)
+
+def advance(shard: Dict[str, Any], partition_key: str, sequence_number: str):
+    if not is_applied(shard, partition_key, sequence_number):
+        shard['checkpoints'][partition_key] = sequence_number
+        shard['advanced'].add(partition_key)
+
+def _pack_strings(parts: List[bytes], *strings: str):
+    for s in strings:
+        encoded = s.encode()
+        parts.append(LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+
+def _unpack_string(view: memoryview, offset: int) -> Tuple[str, int]:
+    (length,) = LENGTH.unpack_from(view, offset)
+    offset += LENGTH.size
+    return str(view[offset:offset + length], 'utf-8'), offset + length
+
+def serialize(state: Dict[str, Any], generation: int) -> bytes:
+    """Snapshot of a shard's (or any state dict's) series, update times, checkpoints and spill index"""
+    series, updated, checkpoints, spilled = state['series'], state['updated'], state['checkpoints'], state['spilled']
+    parts = [HEADER.pack(MAGIC, VERSION, generation, len(series))]
+    for key, stats in series.items():
+        _pack_strings(parts, *key)
+        parts.append(SERIES.pack(stats.window, stats.head, len(stats.values), stats.mean, stats.m2, updated[key]))
+        parts.append(stats.values.tobytes())
+
+    parts.append(LENGTH.pack(len(checkpoints)))
+    for partition_key, sequence_number in checkpoints.items():
+        _pack_strings(parts, partition_key, sequence_number)
+
+    parts.append(COUNT.pack(len(spilled)))
+    for key, spilled_at in spilled.items():
+        _pack_strings(parts, *key)
+        parts.append(TIME.pack(spilled_at))
+    return zlib.compress(b''.join(parts), 1)
+
+def deserialize(data: bytes) -> Dict[str, Any]:
+    """{'series', 'updated', 'checkpoints', 'spilled', 'generation'} of a snapshot"""
+    view = memoryview(zlib.decompress(data))
+    magic, version, generation, count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC or version not in (1, 2, VERSION):
+        raise ValueError('Unsupported detector state snapshot')
+
+    # Snapshots before version 3 have no update times; count their series as updated now
+    loaded_at = time.time()
+    offset = HEADER.size
+    series, updated = OrderedDict(), {}
+    for _ in range(count):
+        instance_id, offset = _unpack_string(view, offset)
+        metric_name, offset = _unpack_string(view, offset)
+        key = (instance_id, metric_name)
+
+        if version >= 3:
+            window, head, n, mean, m2, updated[key] = SERIES.unpack_from(view, offset)
+            offset += SERIES.size
+        else:
+            window, head, n, mean, m2 = SERIES_V2.unpack_from(view, offset)
+            offset += SERIES_V2.size
+            updated[key] = loaded_at
+        stats = RollingStats(window)
+        stats.values.frombytes(view[offset:offset + n * stats.values.itemsize])
+        stats.head, stats.mean, stats.m2 = head, mean, m2
+        offset += n * stats.values.itemsize
+        series[key] = stats
+
+    # Version 1 snapshots predate checkpoints
+    checkpoints = {}
+    if version >= 2:
+        (count,) = LENGTH.unpack_from(view, offset)
+        offset += LENGTH.size
+        for _ in range(count):
+            partition_key, offset = _unpack_string(view, offset)
+            checkpoints[partition_key], offset = _unpack_string(view, offset)
+
+    spilled = {}
+    if version >= 3:
+        (count,) = COUNT.unpack_from(view, offset)
+        offset += COUNT.size
+        for _ in range(count):
+            instance_id, offset = _unpack_string(view, offset)
+            metric_name, offset = _unpack_string(view, offset)
+            (spilled[(instance_id, metric_name)],) = TIME.unpack_from(view, offset)
+            offset += TIME.size
+    return {'series': series, 'updated': updated, 'checkpoints': checkpoints, 'spilled': spilled, 'generation': generation}
+
+def refresh(s3, bucket: str, shard: Dict[str, Any]) -> Dict[str, Any]:
+    """Load the shard's latest snapshot unless the cached copy is still current"""
+    params = {'Bucket': bucket, 'Key': shard['key']}
+    if shard['etag']:
+        params['IfNoneMatch'] = shard['etag']
+
+    try:
+        response = s3.get_object(**params)
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in ('304', 'NotModified'):
+            return shard
+        if code in ('NoSuchKey', '404'):
+            shard.update(series=OrderedDict(), updated={}, spilled={}, checkpoints={}, etag=None, generation=0)
+            return shard
+        raise
+
+    shard.update(deserialize(response['Body'].read()))
+    shard['etag'] = response['ETag']
+    return shard
+
+def flush(s3, bucket: str, shard: Dict[str, Any]) -> bool:
+    """
+    Write the shard's snapshot if any series or checkpoint changed. On a
+    concurrent write, reload, reapply our changed series, our evictions of
+    series nobody has updated since, and the later of each changed
+    checkpoint over the stored ones, and retry.
+    """
+    if not shard['dirty'] and not shard['removed'] and not shard['advanced']:
+        return False
+
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        params = {'Bucket': bucket, 'Key': shard['key']}
+        if shard['etag']:
+            params['IfMatch'] = shard['etag']
+        else:
+            params['IfNoneMatch'] = '*'
+
+        try:
+            response = s3.put_object(Body=serialize(shard, shard['generation'] + 1), **params)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+                raise
+            changed = {key: (shard['series'][key], shard['updated'][key]) for key in shard['dirty'] if key in shard['series']}
+            spilled = {key: shard['spilled'][key] for key in shard['removed'] if key in shard['spilled']}
+            advanced = {key: shard['checkpoints'][key] for key in shard['advanced']}
+            shard['etag'] = None
+            refresh(s3, bucket, shard)
+
+            for key, (stats, updated) in changed.items():
+                shard['series'][key] = stats
+                shard['series'].move_to_end(key)
+                shard['updated'][key] = updated
+                shard['spilled'].pop(key, None)
+            for key, updated in list(shard['removed'].items()):
+                if shard['updated'].get(key, updated) > updated:
+                    # Updated elsewhere after the copy we evicted; keep the stored series
+                    del shard['removed'][key]
+                    spilled.pop(key, None)
+                    continue
+                shard['series'].pop(key, None)
+                shard['updated'].pop(key, None)
+            shard['spilled'].update(spilled)
+            for partition_key, sequence_number in advanced.items():
+                advance(shard, partition_key, sequence_number)
+            continue
+
+        shard['etag'] = response['ETag']
+        shard['generation'] += 1
+        shard['dirty'] = set()
+        shard['removed'] = {}
+        shard['advanced'] = set()
+        return True
+
+    raise RuntimeError(f"Could not write {shard['key']} after {MAX_WRITE_ATTEMPTS} concurrent updates")
+
+def spill_key(shard: Dict[str, Any], key: SeriesKey) -> str:
+    instance_id, metric_name = key
+    return f"{shard['spill_prefix']}/{quote(instance_id, safe='')}/{quote(metric_name, safe='')}.bin"
+
+def spill(s3, bucket: str, shard: Dict[str, Any], evicted: Dict[SeriesKey, RollingStats],
+          now: float, max_workers: int = 8):
+    """Write evicted series to one object each and index them in the shard's snapshot"""
+    def store(item):
+        key, stats = item
+        body = serialize({'series': {key: stats}, 'updated': {key: now}, 'checkpoints': {}, 'spilled': {}}, 0)
+        s3.put_object(Bucket=bucket, Key=spill_key(shard, key), Body=body)
+
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(evicted)), 1)) as pool:
+        list(pool.map(store, evicted.items()))
+    for key in evicted:
+        shard['spilled'][key] = now
+
+def restore(s3, bucket: str, shard: Dict[str, Any], keys: List[SeriesKey],
+            max_workers: int = 8) -> Dict[SeriesKey, RollingStats]:
+    """Read spilled series back and drop them from the spill index (missing objects have expired)"""
+    def load(key):
+        try:
+            body = s3.get_object(Bucket=bucket, Key=spill_key(shard, key))['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return key, None
+            raise
+        return key, deserialize(body)['series'].get(key)
+
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(keys)), 1)) as pool:
+        restored = dict(pool.map(load, keys))
+    for key in keys:
+        shard['spilled'].pop(key, None)
+    return {key: stats for key, stats in restored.items() if stats is not None}
+
+def expire_spilled(shard: Dict[str, Any], cutoff: float):
+    """Forget spilled series older than the cutoff (their objects expire by lifecycle)"""
+    expired = [key for key, spilled_at in shard['spilled'].items() if spilled_at < cutoff]
+    for key in expired:
+        del shard['spilled'][key]
@@ -0,0 +1,123 @@
+"""
+Kinesis Producer - Batched PutRecords with partial-failure retry
+Packs records into PutRecords requests within the service limits (500
+records and 5 MiB per request, 1 MiB per record including the partition
+key). PutRecords can accept part of a request, so only the entries that
+failed are resent, with jittered exponential backoff.
+
+Stats count requests, retries and failures by error code, and records and
+bytes per shard (failed entries carry no shard id, so failures are counted
+per stream).
+"""
+
+import random
+import time
+from typing import Any, Dict, Iterable, Iterator, List
+
+MAX_RECORDS_PER_REQUEST = 500
+MAX_REQUEST_BYTES = 5 * 1024 * 1024
+MAX_RECORD_BYTES = 1024 * 1024
+
+# Record = {'Data': bytes, 'PartitionKey': str}
+Record = Dict[str, Any]
+
+def new_stats() -> Dict[str, Any]:
+    return {
+        'started': time.monotonic(),
+        'records': 0,
+        'bytes': 0,
+        'requests': 0,
+        'retried': 0,
+        'failed': 0,
+        'errors': {},
+        'shards': {}
+    }
+
+def record_size(record: Record) -> int:
+    return len(record['Data']) + len(record['PartitionKey'].encode())
+
+def batches(records: Iterable[Record]) -> Iterator[List[Record]]:
+    """Group records into PutRecords-sized batches, preserving order"""
+    batch, size = [], 0
+    for record in records:
+        n = record_size(record)
+        if batch and (len(batch) == MAX_RECORDS_PER_REQUEST or size + n > MAX_REQUEST_BYTES):
+            yield batch
+            batch, size = [], 0
+        batch.append(record)
+        size += n
+    if batch:
+        yield batch
+
+def put_records(kinesis, stream: str, records: Iterable[Record], stats: Dict[str, Any] = None,
+                max_attempts: int = 5, base_delay: float = 0.1, max_delay: float = 2.0) -> List[Record]:
+    """
+    Send records to the stream. Returns the records still failing after
+    max_attempts (oversized records fail without being sent).
+    """
+    stats = stats if stats is not None else new_stats()
+    failed = []
+
+    def fail(record, code):
+        stats['failed'] += 1
+        stats['errors'][code] = stats['errors'].get(code, 0) + 1
+        failed.append(record)
+
+    sendable = []
+    for record in records:
+        if record_size(record) > MAX_RECORD_BYTES:
+            fail(record, 'RecordTooLarge')
+        else:
+            sendable.append(record)
+
+    for batch in batches(sendable):
+        pending = batch
+        for attempt in range(max_attempts):
+            response = kinesis.put_records(StreamName=stream, Records=pending)
+            stats['requests'] += 1
+
+            retry = []
+            for record, result in zip(pending, response['Records']):
+                if 'ErrorCode' in result:
+                    retry.append((record, result['ErrorCode']))
+                    continue
+                size = record_size(record)
+                shard = stats['shards'].setdefault(result['ShardId'], {'records': 0, 'bytes': 0})
+                shard['records'] += 1
+                shard['bytes'] += size
+                stats['records'] += 1
+                stats['bytes'] += size
+
+            if not retry:
+                break
+            if attempt == max_attempts - 1:
+                for record, code in retry:
+                    fail(record, code)
+                break
+
+            stats['retried'] += len(retry)
+            pending = [record for record, _ in retry]
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+    return failed
+
+def summarize(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Totals plus per-shard records/sec and bytes/sec since new_stats()"""
+    elapsed = max(time.monotonic() - stats['started'], 1e-6)
+    return {
+        'records': stats['records'],
+        'bytes': stats['bytes'],
+        'requests': stats['requests'],
+        'retried': stats['retried'],
+        'failed': stats['failed'],
+        'errors': stats['errors'],
+        'shards': {
+            shard_id: {
+                'records': shard['records'],
+                'bytes': shard['bytes'],
+                'records_per_second': round(shard['records'] / elapsed, 1),
+                'bytes_per_second': round(shard['bytes'] / elapsed, 1)
+            }
+            for shard_id, shard in sorted(stats['shards'].items())
+        }
+    }
@@ -1,7 +1,12 @@
 """Metrics Collector - Collect CloudWatch metrics for ML training"""
-import os, json, boto3
+import os, json, uuid, boto3
 from datetime import datetime, timedelta
 
+import kinesis_producer
+import metric_fetch
+import metric_records
+import metrics_lake
+
 cloudwatch = boto3.client('cloudwatch')
 kinesis = boto3.client('kinesis')
 s3 = boto3.client('s3')
@@ -11,69 +16,92 @@ PROJECT_NAME = os.environ['PROJECT_NAME']
 ENVIRONMENT = os.environ['ENVIRONMENT']
 KINESIS_STREAM = os.environ['KINESIS_STREAM']
 S3_BUCKET = os.environ['S3_BUCKET']
+COMPACTION_LOOKBACK_HOURS = int(os.environ.get('COMPACTION_LOOKBACK_HOURS', '24'))
+
+METRIC_NAMES = ['CPUUtilization', 'NetworkIn', 'NetworkOut', 'DiskReadBytes', 'DiskWriteBytes']
 
 def handler(event, context):
-    """Collect metrics from CloudWatch and send to Kinesis + S3"""
+    """Collect metrics from CloudWatch and send to Kinesis + S3, or compact the S3 lake"""
+    if event.get('action') == 'compact':
+        return compact_lake()
+    
     print(f"Collecting metrics for {PROJECT_NAME}-{ENVIRONMENT}")
     
     try:
         # Get EC2 instances
         instances = ec2.describe_instances(Filters=[{'Name': 'instance-state-name', 'Values': ['running']}])['Reservations']
         
-        metrics_data = []
+        instance_ids = [instance['InstanceId'] for reservation in instances for instance in reservation['Instances']]
         
-        for reservation in instances:
-            for instance in reservation['Instances']:
-                instance_id = instance['InstanceId']
-                
-                # Collect CPU, Network, Disk metrics
-                for metric_name in ['CPUUtilization', 'NetworkIn', 'NetworkOut', 'DiskReadBytes', 'DiskWriteBytes']:
-                    metric_value = get_metric(instance_id, metric_name)
-                    
-                    if metric_value is not None:
-                        metrics_data.append({
-                            'timestamp': datetime.now().isoformat(),
-                            'instance_id': instance_id,
-                            'metric_name': metric_name,
-                            'value': metric_value,
-                            'unit': get_metric_unit(metric_name)
-                        })
+        # Collect CPU, Network, Disk metrics for every instance in batched requests
+        latest = get_latest_metrics(instance_ids)
+        collected_at = datetime.utcnow()
+        timestamp = collected_at.isoformat()
+        datapoints = []
+        
+        # Rows stream into the S3 lake (dt=/hour=/metric= partitions) for ML training as they are produced
+        write_row, close_lake = metrics_lake.start_writer(s3, S3_BUCKET, run_id(collected_at))
         
-        # Send to Kinesis
-        for metric in metrics_data:
-            kinesis.put_record(
-                StreamName=KINESIS_STREAM,
-                Data=json.dumps(metric),
-                PartitionKey=metric['instance_id']
-            )
+        for instance_id in instance_ids:
+            for metric_name in METRIC_NAMES:
+                metric_value = latest.get((instance_id, metric_name))
+                
+                if metric_value is not None:
+                    unit = get_metric_unit(metric_name)
+                    write_row({
+                        'timestamp': timestamp,
+                        'instance_id': instance_id,
+                        'metric_name': metric_name,
+                        'value': metric_value,
+                        'unit': unit
+                    }, collected_at)
+                    datapoints.append((instance_id, metric_name, unit, collected_at.timestamp(), metric_value))
         
-        # Save to S3 for ML training
-        s3_key = f"metrics/{datetime.now().strftime('%Y/%m/%d/%H%M%S')}.json"
-        s3.put_object(Bucket=S3_BUCKET, Key=s3_key, Body=json.dumps(metrics_data))
+        # Send to Kinesis as aggregated records in PutRecords batches, retrying only failed entries
+        stats = kinesis_producer.new_stats()
+        failed = kinesis_producer.put_records(kinesis, KINESIS_STREAM, metric_records.aggregate(datapoints), stats)
+        stream_stats = kinesis_producer.summarize(stats)
+        print(f"Kinesis: {json.dumps(stream_stats)}")
         
-        print(f"Collected {len(metrics_data)} metrics")
-        return {'statusCode': 200, 'metrics_collected': len(metrics_data)}
+        lake = close_lake()
+        print(f"Collected {len(datapoints)} metrics")
+        return {
+            'statusCode': 200,
+            'metrics_collected': len(datapoints),
+            'records_failed': len(failed),
+            'kinesis': stream_stats,
+            'lake': lake
+        }
     
     except Exception as e:
         print(f"Error: {str(e)}")
         raise
 
-def get_metric(instance_id, metric_name):
-    try:
-        response = cloudwatch.get_metric_statistics(
-            Namespace='AWS/EC2',
-            MetricName=metric_name,
-            Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-            StartTime=datetime.now() - timedelta(minutes=10),
-            EndTime=datetime.now(),
-            Period=300,
-            Statistics=['Average']
+def compact_lake():
+    """Roll settled days up into ~128 MB day parts and merge the small parts of closed hours"""
+    now = datetime.utcnow()
+    stats = metrics_lake.compact(s3, S3_BUCKET, now, run_id(now), COMPACTION_LOOKBACK_HOURS)
+    print(f"Compaction: {json.dumps(stats)}")
+    return {'statusCode': 200, 'compaction': stats}
+
+def run_id(now):
+    return f"{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+def get_latest_metrics(instance_ids):
+    """(instance id, metric name) -> latest 5-minute average of the last 10 minutes"""
+    queries = {
+        (instance_id, metric_name): metric_fetch.metric_query(
+            'AWS/EC2', metric_name, [{'Name': 'InstanceId', 'Value': instance_id}], 'Average', 300
         )
-        if response['Datapoints']:
-            return response['Datapoints'][0]['Average']
-    except:
-        pass
-    return None
+        for instance_id in instance_ids
+        for metric_name in METRIC_NAMES
+    }
+    try:
+        series = metric_fetch.fetch(cloudwatch, queries, datetime.now() - timedelta(minutes=10), datetime.now())
+    except Exception as e:
+        print(f"Error fetching metrics: {str(e)}")
+        return {}
+    return {key: metric_fetch.latest(s) for key, s in series.items()}
 
 def get_metric_unit(metric_name):
     units = {
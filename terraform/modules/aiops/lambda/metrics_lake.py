@@ -0,0 +1,283 @@
+"""
+Metrics Lake - Hive-partitioned gzip NDJSON output for ML training
+Rows are streamed into one gzip part per partition as they are produced,
+
+    metrics/dt=YYYY-MM-DD/hour=HH/metric=<name>/part-<run id>-<n>.json.gz
+
+and each partition keeps a manifest of its parts (rows, bytes, time range)
+in _manifest.json next to them. Readers wanting a consistent view should
+take the parts from the manifest rather than listing the prefix, since
+compaction writes a merged part before deleting its sources.
+
+Compaction merges the small parts of closed hours into fewer parts. One
+hour of one metric stays far below the ~128 MB target, so once a day has
+settled its hourly parts are rolled up, per metric, into parts of up to
+~128 MB in a separate day-partitioned prefix:
+
+    metrics-daily/dt=YYYY-MM-DD/metric=<name>/part-<run id>-d<n>.json.gz
+
+and the hourly partitions are deleted. Each prefix keeps one consistent
+Hive layout, so the two can be catalogued as separate tables. The daily
+manifest records the hourly parts each part was built from, so a roll-up
+interrupted before the deletes is not applied twice.
+
+Concatenated gzip members form a valid gzip stream, so parts are joined
+byte-wise through a multipart upload without recompressing.
+"""
+
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+PREFIX = 'metrics'
+DAILY_PREFIX = 'metrics-daily'
+MANIFEST = '_manifest.json'
+VERSION = 1
+# Compressed size at which a writer starts a new part
+PART_BYTES = 64 * 1024 * 1024
+TARGET_BYTES = 128 * 1024 * 1024
+# S3 multipart uploads need parts of at least 5 MiB except the last
+UPLOAD_PART_BYTES = 8 * 1024 * 1024
+
+def partition_prefix(timestamp: datetime, metric: str, prefix: str = PREFIX) -> str:
+    return f"{prefix}/dt={timestamp:%Y-%m-%d}/hour={timestamp:%H}/metric={metric}"
+
+def day_partition_prefix(day: str, metric: str, prefix: str = DAILY_PREFIX) -> str:
+    return f"{prefix}/dt={day}/metric={metric}"
+
+def load_manifest(s3, bucket: str, partition: str) -> Dict[str, Any]:
+    try:
+        manifest = json.loads(s3.get_object(Bucket=bucket, Key=f"{partition}/{MANIFEST}")['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        return {'version': VERSION, 'files': []}
+    return manifest if manifest.get('version') == VERSION else {'version': VERSION, 'files': []}
+
+def update_manifest(s3, bucket: str, partition: str, add: List[Dict[str, Any]], remove=()):
+    manifest = load_manifest(s3, bucket, partition)
+    removed = set(remove)
+    files = [f for f in manifest['files'] if f['key'] not in removed] + add
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{partition}/{MANIFEST}",
+        Body=json.dumps({
+            'version': VERSION,
+            'updated_at': datetime.utcnow().isoformat(),
+            'rows': sum(f['rows'] for f in files),
+            'bytes': sum(f['bytes'] for f in files),
+            'files': files
+        }).encode(),
+        ContentType='application/json'
+    )
+
+def start_writer(s3, bucket: str, run_id: str, prefix: str = PREFIX,
+                 part_bytes: int = PART_BYTES) -> Tuple[Callable[[Dict[str, Any], datetime], None], Callable[[], Dict[str, Any]]]:
+    """
+    Returns (write, close): write(row, timestamp) appends a row to its
+    partition's open part; close() uploads the open parts, updates the
+    manifests and returns totals.
+    """
+    partitions = {}
+    totals = {'partitions': 0, 'files': 0, 'rows': 0, 'bytes': 0}
+
+    def open_part(partition):
+        buffer = io.BytesIO()
+        state = partitions.setdefault(partition, {'files': [], 'parts': 0})
+        state.update(buffer=buffer, gzip=gzip.GzipFile(fileobj=buffer, mode='wb'), rows=0, min_ts=None, max_ts=None)
+        return state
+
+    def flush(partition):
+        state = partitions[partition]
+        state['gzip'].close()
+        if state['rows']:
+            body = state['buffer'].getvalue()
+            key = f"{partition}/part-{run_id}-{state['parts']:04d}.json.gz"
+            s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType='application/x-ndjson', ContentEncoding='gzip')
+            state['files'].append({
+                'key': key,
+                'rows': state['rows'],
+                'bytes': len(body),
+                'min_timestamp': state['min_ts'],
+                'max_timestamp': state['max_ts']
+            })
+            state['parts'] += 1
+            totals['files'] += 1
+            totals['rows'] += state['rows']
+            totals['bytes'] += len(body)
+
+    def write(row, timestamp):
+        partition = partition_prefix(timestamp, row['metric_name'], prefix)
+        state = partitions.get(partition) or open_part(partition)
+        state['gzip'].write(json.dumps(row, separators=(',', ':')).encode() + b'\n')
+        state['rows'] += 1
+        ts = timestamp.isoformat()
+        state['min_ts'] = ts if state['min_ts'] is None else min(state['min_ts'], ts)
+        state['max_ts'] = ts if state['max_ts'] is None else max(state['max_ts'], ts)
+
+        if state['buffer'].tell() >= part_bytes:
+            flush(partition)
+            open_part(partition)
+
+    def close():
+        for partition, state in partitions.items():
+            flush(partition)
+            if state['files']:
+                update_manifest(s3, bucket, partition, state['files'])
+                totals['partitions'] += 1
+        return totals
+
+    return write, close
+
+def compact_partition(s3, bucket: str, partition: str, run_id: str,
+                      target_bytes: int = TARGET_BYTES) -> Dict[str, int]:
+    """Merge the partition's parts smaller than half the target into parts of up to target_bytes"""
+    manifest = load_manifest(s3, bucket, partition)
+    small = [f for f in manifest['files'] if f['bytes'] < target_bytes // 2]
+    if len(small) < 2:
+        return {'merged': 0, 'written': 0}
+
+    groups = group_parts(small, target_bytes)
+    stats = {'merged': 0, 'written': 0}
+    for n, group in enumerate(g for g in groups if len(g) > 1):
+        key = f"{partition}/part-{run_id}-c{n:04d}.json.gz"
+        merged_bytes = concatenate(s3, bucket, [f['key'] for f in group], key)
+        update_manifest(s3, bucket, partition, [{
+            'key': key,
+            'rows': sum(f['rows'] for f in group),
+            'bytes': merged_bytes,
+            'min_timestamp': min(f['min_timestamp'] for f in group),
+            'max_timestamp': max(f['max_timestamp'] for f in group)
+        }], remove=[f['key'] for f in group])
+
+        sources = [f['key'] for f in group]
+        for i in range(0, len(sources), 1000):
+            s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': k} for k in sources[i:i + 1000]], 'Quiet': True})
+        stats['merged'] += len(group)
+        stats['written'] += 1
+    return stats
+
+def concatenate(s3, bucket: str, sources: List[str], key: str) -> int:
+    """Join gzip objects byte-wise into `key`, streaming through a multipart upload when large"""
+    buffer = bytearray()
+    upload_id, parts, total = None, [], 0
+
+    def upload(data):
+        nonlocal upload_id
+        if upload_id is None:
+            upload_id = s3.create_multipart_upload(
+                Bucket=bucket, Key=key, ContentType='application/x-ndjson', ContentEncoding='gzip'
+            )['UploadId']
+        response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=len(parts) + 1, Body=bytes(data))
+        parts.append({'PartNumber': len(parts) + 1, 'ETag': response['ETag']})
+
+    try:
+        for source in sources:
+            body = s3.get_object(Bucket=bucket, Key=source)['Body'].read()
+            buffer.extend(body)
+            total += len(body)
+            if len(buffer) >= UPLOAD_PART_BYTES:
+                upload(buffer)
+                buffer.clear()
+
+        if upload_id is None:
+            s3.put_object(Bucket=bucket, Key=key, Body=bytes(buffer), ContentType='application/x-ndjson', ContentEncoding='gzip')
+        else:
+            if buffer:
+                upload(buffer)
+            s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+    except Exception:
+        if upload_id is not None:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return total
+
+def group_parts(files: List[Dict[str, Any]], target_bytes: int) -> List[List[Dict[str, Any]]]:
+    """Consecutive runs of parts whose sizes add up to at most target_bytes (a larger part stays alone)"""
+    groups, group, size = [], [], 0
+    for f in files:
+        if group and size + f['bytes'] > target_bytes:
+            groups.append(group)
+            group, size = [], 0
+        group.append(f)
+        size += f['bytes']
+    if group:
+        groups.append(group)
+    return groups
+
+def rollup_day(s3, bucket: str, day: str, run_id: str, prefix: str = PREFIX,
+               daily_prefix: str = DAILY_PREFIX, target_bytes: int = TARGET_BYTES) -> Dict[str, int]:
+    """Roll a settled day's hourly partitions up into day partitions per metric, then delete them"""
+    hourly = {}
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/dt={day}/"):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith(f"/{MANIFEST}"):
+                partition = obj['Key'][:-len(MANIFEST) - 1]
+                metric = partition.rsplit('/metric=', 1)[1]
+                hourly.setdefault(metric, []).append(partition)
+
+    stats = {'metrics': 0, 'merged': 0, 'written': 0}
+    for metric, partitions in sorted(hourly.items()):
+        partitions.sort()
+        manifests = [load_manifest(s3, bucket, partition) for partition in partitions]
+        target = day_partition_prefix(day, metric, daily_prefix)
+
+        # Parts already rolled up by an interrupted run are only deleted
+        done = {key for f in load_manifest(s3, bucket, target)['files'] for key in f.get('sources', [])}
+        files = [f for manifest in manifests for f in manifest['files'] if f['key'] not in done]
+
+        added = []
+        for n, group in enumerate(group_parts(files, target_bytes)):
+            key = f"{target}/part-{run_id}-d{n:04d}.json.gz"
+            added.append({
+                'key': key,
+                'rows': sum(f['rows'] for f in group),
+                'bytes': concatenate(s3, bucket, [f['key'] for f in group], key),
+                'min_timestamp': min(f['min_timestamp'] for f in group),
+                'max_timestamp': max(f['max_timestamp'] for f in group),
+                'sources': [f['key'] for f in group]
+            })
+        if added:
+            update_manifest(s3, bucket, target, added)
+
+        # Readers switch to the day partition once the hourly manifests are gone
+        obsolete = [f"{partition}/{MANIFEST}" for partition in partitions]
+        obsolete += [f['key'] for manifest in manifests for f in manifest['files']]
+        for i in range(0, len(obsolete), 1000):
+            s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': k} for k in obsolete[i:i + 1000]], 'Quiet': True})
+
+        stats['metrics'] += 1
+        stats['merged'] += len(files)
+        stats['written'] += len(added)
+    return stats
+
+def compact(s3, bucket: str, now: datetime, run_id: str, lookback_hours: int = 24,
+            prefix: str = PREFIX, target_bytes: int = TARGET_BYTES, daily_prefix: str = DAILY_PREFIX,
+            settle_hours: int = 2, rollup_days: int = 3) -> Dict[str, int]:
+    """
+    Roll up the days in the last rollup_days that closed at least
+    settle_hours ago, then compact every remaining partition of the closed
+    hours in the lookback window
+    """
+    stats = {'days': 0, 'rolled_up': 0, 'daily_written': 0, 'partitions': 0, 'merged': 0, 'written': 0}
+
+    last_day = (now - timedelta(hours=settle_hours)).date() - timedelta(days=1)
+    for days_ago in range(rollup_days - 1, -1, -1):
+        result = rollup_day(s3, bucket, str(last_day - timedelta(days=days_ago)), run_id, prefix, daily_prefix, target_bytes)
+        if result['metrics']:
+            stats['days'] += 1
+        stats['rolled_up'] += result['merged']
+        stats['daily_written'] += result['written']
+
+    paginator = s3.get_paginator('list_objects_v2')
+    for hours_ago in range(1, lookback_hours + 1):
+        hour = now - timedelta(hours=hours_ago)
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/dt={hour:%Y-%m-%d}/hour={hour:%H}/"):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith(f"/{MANIFEST}"):
+                    result = compact_partition(s3, bucket, obj['Key'][:-len(MANIFEST) - 1], run_id, target_bytes)
+                    stats['partitions'] += 1
+                    stats['merged'] += result['merged']
+                    stats['written'] += result['written']
+    return stats
@@ -0,0 +1,63 @@
+#!/bin/bash
+# Script to package the AIOps Lambda functions for deployment
+# Usage: ./package.sh [function ...]
+#
+# Each <function>.zip contains the handler module plus every helper module in
+# this directory and in terraform/modules/shared/lambda, so handlers can import
+# them as top-level modules.
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+LAMBDA_DIR="$SCRIPT_DIR"
+SHARED_DIR="$SCRIPT_DIR/../../shared/lambda"
+
+# Lambda handler modules
+FUNCTIONS=(
+    "anomaly_detector"
+    "metrics_collector"
+    "predictive_scaler"
+)
+
+# Package only the functions named on the command line, if any
+if [ $# -gt 0 ]; then
+    TARGETS=("$@")
+else
+    TARGETS=("${FUNCTIONS[@]}")
+fi
+
+is_handler() {
+    local name="$1"
+    for function in "${FUNCTIONS[@]}"; do
+        [ "$function" == "$name" ] && return 0
+    done
+    return 1
+}
+
+for function in "${TARGETS[@]}"; do
+    OUTPUT_FILE="$LAMBDA_DIR/$function.zip"
+    echo "Packaging $function..."
+
+    # Remove old package if exists
+    [ -f "$OUTPUT_FILE" ] && rm "$OUTPUT_FILE"
+
+    # Create temporary directory
+    TEMP_DIR=$(mktemp -d)
+
+    # Copy handler and helper modules
+    cp "$LAMBDA_DIR/$function.py" "$TEMP_DIR/"
+    for module in "$LAMBDA_DIR"/*.py; do
+        is_handler "$(basename "$module" .py)" || cp "$module" "$TEMP_DIR/"
+    done
+    if [ -d "$SHARED_DIR" ]; then
+        cp "$SHARED_DIR"/*.py "$TEMP_DIR/" 2>/dev/null || true
+    fi
+
+    # Create zip package
+    (cd "$TEMP_DIR" && zip -r -X "$OUTPUT_FILE" . -q)
+
+    # Cleanup
+    rm -rf "$TEMP_DIR"
+
+    echo "✓ Lambda package created: $OUTPUT_FILE ($(du -h "$OUTPUT_FILE" | cut -f1))"
+done
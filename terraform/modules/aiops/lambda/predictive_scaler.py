@@ -2,6 +2,8 @@
 import os, json, boto3
 from datetime import datetime, timedelta
 
+import metric_fetch
+
 s3 = boto3.client('s3')
 autoscaling = boto3.client('autoscaling')
 sns = boto3.client('sns')
@@ -24,12 +26,13 @@ def handler(event, context):
         
         scaling_actions = []
         
+        # Predict future load (simplified linear regression)
+        predicted_loads = predict_loads([asg['AutoScalingGroupName'] for asg in asgs])
+        
         for asg in asgs:
             asg_name = asg['AutoScalingGroupName']
             current_capacity = asg['DesiredCapacity']
-            
-            # Predict future load (simplified linear regression)
-            predicted_load = predict_load(asg_name)
+            predicted_load = predicted_loads[asg_name]
             
             # Calculate recommended capacity
             recommended_capacity = calculate_capacity(predicted_load, asg)
@@ -70,27 +73,28 @@ def handler(event, context):
         print(f"Error: {str(e)}")
         raise
 
-def predict_load(asg_name):
-    """Predict future CPU load using simple trend analysis"""
+def predict_loads(asg_names):
+    """Predicted CPU load per Auto Scaling group, from one batched read of the last 24 hours"""
     try:
         # Get historical CPU metrics
-        response = cloudwatch.get_metric_statistics(
-            Namespace='AWS/EC2',
-            MetricName='CPUUtilization',
-            Dimensions=[{'Name': 'AutoScalingGroupName', 'Value': asg_name}],
-            StartTime=datetime.now() - timedelta(hours=24),
-            EndTime=datetime.now(),
-            Period=3600,
-            Statistics=['Average']
-        )
-        
-        if len(response['Datapoints']) < 3:
+        series = metric_fetch.fetch(cloudwatch, {
+            asg_name: metric_fetch.metric_query(
+                'AWS/EC2', 'CPUUtilization', [{'Name': 'AutoScalingGroupName', 'Value': asg_name}], 'Average', 3600
+            )
+            for asg_name in asg_names
+        }, datetime.now() - timedelta(hours=24), datetime.now())
+    except Exception as e:
+        print(f"Error fetching CPU metrics: {str(e)}")
+        return {asg_name: 50.0 for asg_name in asg_names}
+    
+    return {asg_name: predict_load(series[asg_name][1]) for asg_name in asg_names}
+
+def predict_load(values):
+    """Predict future CPU load from hourly values (oldest first) using simple trend analysis"""
+    try:
+        if len(values) < 3:
             return 50.0  # Default
         
-        # Sort by timestamp
-        datapoints = sorted(response['Datapoints'], key=lambda x: x['Timestamp'])
-        values = [d['Average'] for d in datapoints]
-        
         # Simple linear trend
         n = len(values)
         x_mean = n / 2
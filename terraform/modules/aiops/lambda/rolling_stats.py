@@ -0,0 +1,119 @@
+"""
+Rolling Stats - O(1) mean and standard deviation over a sliding window
+Each series keeps its last `window` values in a ring buffer of doubles and
+updates the mean and sum of squared deviations (Welford) as a value enters
+and the oldest leaves, instead of recomputing both over the whole window.
+The sums are recomputed exactly once per pass around the ring, which bounds
+floating-point drift at amortized O(1) cost.
+
+The buffer grows with the values seen, up to the window, so sparse series
+stay small.
+"""
+
+import math
+from array import array
+
+class RollingStats:
+    __slots__ = ('window', 'values', 'head', 'mean', 'm2')
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self.values = array('d')
+        self.head = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def push(self, value: float):
+        values = self.values
+        if len(values) < self.window:
+            values.append(value)
+            delta = value - self.mean
+            self.mean += delta / len(values)
+            self.m2 += delta * (value - self.mean)
+            return
+
+        # Replace the oldest value; the count stays at window
+        oldest = values[self.head]
+        values[self.head] = value
+        self.head += 1
+        if self.head == self.window:
+            self.head = 0
+            self._recompute()
+            return
+
+        previous_mean = self.mean
+        delta = value - oldest
+        self.mean += delta / self.window
+        self.m2 += delta * (value - self.mean + oldest - previous_mean)
+
+    def ordered(self) -> array:
+        """Window values, oldest first"""
+        return self.values[self.head:] + self.values[:self.head]
+
+    def replace(self, values: array, mean: float, m2: float):
+        """Set the window (oldest first, at most `window` values) with its precomputed sums"""
+        self.values = values
+        self.head = 0
+        self.mean = mean
+        self.m2 = m2
+
+    def _recompute(self):
+        n = len(self.values)
+        self.mean = math.fsum(self.values) / n
+        self.m2 = math.fsum((v - self.mean) ** 2 for v in self.values)
+
+    def stdev(self) -> float:
+        """Sample standard deviation (0 with fewer than two values)"""
+        n = len(self.values)
+        return math.sqrt(self.m2 / (n - 1)) if n > 1 and self.m2 > 0 else 0.0
+
+def benchmark(series: int = 100000, records: int = 500000, prefill: int = 200, legacy_records: int = 20000):
+    """Records/sec scoring random series, against the previous list + statistics.stdev approach"""
+    import random
+    import time
+    import tracemalloc
+    from statistics import mean, stdev
+
+    rng = random.Random(7)
+    keys = [(f"i-{i:017x}", 'CPUUtilization') for i in range(series)]
+    stream = [(rng.choice(keys), rng.gauss(50, 10)) for _ in range(records)]
+
+    for window in (100, 10000):
+        tracemalloc.start()
+        state = {}
+        for key in keys:
+            stats = state[key] = RollingStats(window)
+            for _ in range(min(window, prefill)):
+                stats.push(rng.gauss(50, 10))
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        for key, value in stream:
+            stats = state[key]
+            stats.push(value)
+            std = stats.stdev()
+            if std:
+                abs(value - stats.mean) / std
+        elapsed = time.perf_counter() - started
+
+        # The previous approach is O(window) per record, so sample fewer records at large windows
+        sampled = max(legacy_records * 100 // window, 100)
+        history = {key: [rng.gauss(50, 10) for _ in range(window)] for key in keys[:1000]}
+        started = time.perf_counter()
+        for i in range(sampled):
+            hist = history[keys[i % 1000]]
+            hist.append(50.0)
+            hist.pop(0)
+            abs(50.0 - mean(hist)) / stdev(hist)
+        legacy_elapsed = time.perf_counter() - started
+
+        print(f"window {window}: {series} series, {memory / 1e6:.0f} MB with {min(window, prefill)} values each")
+        print(f"  rolling: {records / elapsed:,.0f} records/s")
+        print(f"  list + statistics: {sampled / legacy_elapsed:,.0f} records/s")
+
+if __name__ == '__main__':
+    benchmark()
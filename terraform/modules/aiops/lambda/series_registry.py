@@ -0,0 +1,88 @@
+"""
+Series Registry - Memory budget for the anomaly detector's cached series
+Instances churn with autoscaling, so a warm container keeps meeting new
+(instance id, metric) series and would otherwise hold every one it has
+seen. The registry bounds the series a container holds: a series idle
+for longer than the TTL is evicted, and while the live count exceeds the
+budget the least recently updated series go first.
+
+Evictions change the shard's snapshot, so they only run on shards the
+current invocation has just loaded. The caller drops other cached shards
+instead (their snapshots already hold them); a stale copy of a shard that
+another container has since moved on must never be written back.
+
+Each shard keeps its series least recently updated first (see
+detector_state), so both evictions only look at the front of each shard.
+Evicted series are returned to the caller, which spills them to S3 or
+drops them; either way they leave the shard's snapshot too.
+"""
+
+import heapq
+from itertools import islice, takewhile
+from typing import Any, Dict, List, Tuple
+
+# Per-series bytes besides the window: key tuple and strings, RollingStats,
+# array header and the entries in the shard's series, updated and dirty sets
+SERIES_OVERHEAD_BYTES = 512
+
+def new_registry(memory_bytes: int, window: int, ttl_seconds: float) -> Dict[str, Any]:
+    """
+    {'capacity' (series that fit in memory_bytes with full windows), 'ttl',
+    'evicted', 'expired', 'resurrected' (running counts)}
+    """
+    return {
+        'capacity': max(memory_bytes // (SERIES_OVERHEAD_BYTES + 8 * window), 1),
+        'ttl': ttl_seconds, 'evicted': 0, 'expired': 0, 'resurrected': 0
+    }
+
+def touch(shard: Dict[str, Any], key: Tuple[str, str], stats, now: float):
+    """Store a series' updated stats and mark it most recently updated"""
+    series = shard['series']
+    series[key] = stats
+    series.move_to_end(key)
+    shard['updated'][key] = now
+    shard['dirty'].add(key)
+    shard['removed'].pop(key, None)
+
+def _remove(shard: Dict[str, Any], key: Tuple[str, str], evicted: Dict):
+    evicted[key] = shard['series'].pop(key)
+    shard['removed'][key] = shard['updated'].pop(key)
+    shard['dirty'].discard(key)
+
+def evict(registry: Dict[str, Any], shards: List[Dict[str, Any]], now: float) -> List[Tuple[Dict[str, Any], Dict]]:
+    """
+    Evict series idle for longer than the TTL, then the least recently
+    updated ones until the live count fits the capacity. Returns
+    (shard, {series key: RollingStats}) for each shard that lost series.
+    """
+    cutoff = now - registry['ttl']
+    evicted = [{} for _ in shards]
+    for shard, removed in zip(shards, evicted):
+        updated = shard['updated']
+        idle = list(takewhile(lambda key: updated[key] < cutoff, shard['series']))
+        for key in idle:
+            _remove(shard, key, removed)
+        registry['expired'] += len(idle)
+
+    # The globally oldest `excess` series are among the first `excess` of each shard
+    excess = sum(len(shard['series']) for shard in shards) - registry['capacity']
+    if excess > 0:
+        oldest = heapq.nsmallest(excess, (
+            (shard['updated'][key], i, key)
+            for i, shard in enumerate(shards) for key in islice(shard['series'], excess)
+        ))
+        for _, i, key in oldest:
+            _remove(shards[i], key, evicted[i])
+        registry['evicted'] += len(oldest)
+
+    return [(shard, removed) for shard, removed in zip(shards, evicted) if removed]
+
+def counts(registry: Dict[str, Any], shards: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Live series across the shards, with the registry's running eviction and resurrection counts"""
+    return {
+        'live': sum(len(shard['series']) for shard in shards),
+        'capacity': registry['capacity'],
+        'evicted': registry['evicted'],
+        'expired': registry['expired'],
+        'resurrected': registry['resurrected']
+    }
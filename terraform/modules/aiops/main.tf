@@ -47,6 +47,66 @@ resource "aws_s3_bucket_lifecycle_configuration" "ml_data" {
       days = var.ml_data_retention_days
     }
   }
+
+  # Compaction deletes the small parts it merged; drop their old versions
+  rule {
+    id     = "metrics-lake-compacted-parts"
+    status = "Enabled"
+
+    filter {
+      prefix = "metrics/"
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 7
+    }
+  }
+
+  # Day partition manifests are rewritten by each roll-up
+  rule {
+    id     = "metrics-lake-daily-manifests"
+    status = "Enabled"
+
+    filter {
+      prefix = "metrics-daily/"
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 7
+    }
+  }
+
+  # Detector state snapshots are rewritten on every batch
+  rule {
+    id     = "detector-state-snapshots"
+    status = "Enabled"
+
+    filter {
+      prefix = "detector-state/"
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+
+  # Series evicted by the anomaly detector, kept until they resume or their retention ends
+  rule {
+    id     = "detector-spilled-series"
+    status = "Enabled"
+
+    filter {
+      prefix = "detector-spill/"
+    }
+
+    expiration {
+      days = var.anomaly_spill_retention_days
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
 }
 
 # ============================================================
@@ -194,6 +254,32 @@ resource "aws_lambda_permission" "metrics_collection" {
   source_arn    = aws_cloudwatch_event_rule.metrics_collection.arn
 }
 
+# EventBridge rule for hourly compaction of the metrics lake
+resource "aws_cloudwatch_event_rule" "metrics_compaction" {
+  name                = "${var.project_name}-${var.environment}-metrics-compaction"
+  description         = "Compact the closed hourly partitions of the metrics lake"
+  schedule_expression = "cron(15 * * * ? *)"
+
+  tags = merge(var.tags, {
+    Name = "${var.project_name}-${var.environment}-metrics-compaction"
+  })
+}
+
+resource "aws_cloudwatch_event_target" "metrics_compaction" {
+  rule      = aws_cloudwatch_event_rule.metrics_compaction.name
+  target_id = "MetricsCollectorCompaction"
+  arn       = aws_lambda_function.metrics_collector.arn
+  input     = jsonencode({ action = "compact" })
+}
+
+resource "aws_lambda_permission" "metrics_compaction" {
+  statement_id  = "AllowCompactionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.metrics_collector.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.metrics_compaction.arn
+}
+
 # IAM role for metrics collector
 resource "aws_iam_role" "metrics_collector_lambda" {
   name = "${var.project_name}-${var.environment}-metrics-collector-lambda"
@@ -241,10 +327,20 @@ resource "aws_iam_role_policy" "metrics_collector_lambda" {
       {
         Effect = "Allow"
         Action = [
-          "s3:PutObject"
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload"
         ]
         Resource = "${aws_s3_bucket.ml_data.arn}/*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = aws_s3_bucket.ml_data.arn
+      },
       {
         Effect = "Allow"
         Action = [
@@ -280,6 +376,7 @@ resource "aws_lambda_function" "anomaly_detector" {
   runtime          = "python3.11"
   timeout          = 600
   memory_size      = 1024
+  layers           = var.numpy_layer_arn != "" ? [var.numpy_layer_arn] : []
 
   environment {
     variables = {
@@ -288,6 +385,13 @@ resource "aws_lambda_function" "anomaly_detector" {
       KINESIS_STREAM         = aws_kinesis_stream.metrics_stream.name
       SNS_TOPIC_ARN          = aws_sns_topic.aiops_alerts.arn
       ANOMALY_THRESHOLD      = var.anomaly_detection_threshold
+      HISTORY_WINDOW         = var.anomaly_history_window
+      STATE_BUCKET           = aws_s3_bucket.ml_data.id
+      METRIC_DETECTORS       = jsonencode(var.anomaly_detectors)
+      SERIES_MEMORY_MB       = var.anomaly_series_memory_mb
+      SERIES_TTL_HOURS       = var.anomaly_series_ttl_hours
+      SPILL_EVICTED          = var.anomaly_spill_evicted_series
+      SPILL_RETENTION_DAYS   = var.anomaly_spill_retention_days
       ENABLE_AUTO_REMEDIATION = var.enable_auto_remediation
     }
   }
@@ -302,7 +406,11 @@ resource "aws_lambda_event_source_mapping" "kinesis_anomaly" {
   event_source_arn  = aws_kinesis_stream.metrics_stream.arn
   function_name     = aws_lambda_function.anomaly_detector.arn
   starting_position = "LATEST"
-  batch_size        = 100
+  batch_size        = var.anomaly_batch_size
+
+  # The detector returns the first unprocessed record of a shard; poison records go to dead-letter/ instead
+  function_response_types        = ["ReportBatchItemFailures"]
+  bisect_batch_on_function_error = true
 }
 
 # IAM role for anomaly detector
@@ -356,6 +464,25 @@ resource "aws_iam_role_policy" "anomaly_detector_lambda" {
         ]
         Resource = "*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject"
+        ]
+        Resource = [
+          "${aws_s3_bucket.ml_data.arn}/detector-state/*",
+          "${aws_s3_bucket.ml_data.arn}/detector-spill/*",
+          "${aws_s3_bucket.ml_data.arn}/dead-letter/*"
+        ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = aws_s3_bucket.ml_data.arn
+      },
       {
         Effect = "Allow"
         Action = [
@@ -470,6 +597,14 @@ resource "aws_iam_role_policy" "predictive_scaler_lambda" {
         ]
         Resource = "*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "cloudwatch:GetMetricData",
+          "cloudwatch:PutMetricData"
+        ]
+        Resource = "*"
+      },
       {
         Effect = "Allow"
         Action = [
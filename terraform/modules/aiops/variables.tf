@@ -52,6 +52,79 @@ variable "anomaly_detection_threshold" {
   default     = 0.8
 }
 
+variable "anomaly_history_window" {
+  description = "Datapoints per series in the anomaly detector's rolling window"
+  type        = number
+  default     = 100
+
+  validation {
+    condition     = var.anomaly_history_window >= 10
+    error_message = "The anomaly history window must hold at least 10 datapoints."
+  }
+}
+
+variable "anomaly_detectors" {
+  description = "Detector per metric name for batch scoring (zscore, ewma, robust or holt_winters), overriding the defaults (CPU: ewma, network: holt_winters, disk: robust, other metrics: zscore)"
+  type        = map(string)
+  default     = {}
+
+  validation {
+    condition     = alltrue([for d in values(var.anomaly_detectors) : contains(["zscore", "ewma", "robust", "holt_winters"], d)])
+    error_message = "Anomaly detectors must be one of zscore, ewma, robust or holt_winters."
+  }
+}
+
+variable "anomaly_batch_size" {
+  description = "Kinesis records per anomaly detector invocation"
+  type        = number
+  default     = 100
+
+  validation {
+    condition     = var.anomaly_batch_size >= 1 && var.anomaly_batch_size <= 10000
+    error_message = "The anomaly batch size must be between 1 and 10000."
+  }
+}
+
+variable "anomaly_series_memory_mb" {
+  description = "Memory budget in MB for the series the anomaly detector keeps in a warm container; the least recently updated series beyond it are evicted"
+  type        = number
+  default     = 256
+
+  validation {
+    condition     = var.anomaly_series_memory_mb >= 1
+    error_message = "The anomaly series memory budget must be at least 1 MB."
+  }
+}
+
+variable "anomaly_series_ttl_hours" {
+  description = "Hours without datapoints after which the anomaly detector evicts a series"
+  type        = number
+  default     = 24
+}
+
+variable "anomaly_spill_evicted_series" {
+  description = "Spill evicted series to S3 so they resume their history when the instance reports again, instead of dropping them"
+  type        = bool
+  default     = true
+}
+
+variable "anomaly_spill_retention_days" {
+  description = "Days spilled series are kept in S3 before they expire"
+  type        = number
+  default     = 7
+
+  validation {
+    condition     = var.anomaly_spill_retention_days >= 1
+    error_message = "Spilled series must be kept for at least 1 day."
+  }
+}
+
+variable "numpy_layer_arn" {
+  description = "ARN of a Lambda layer providing NumPy (e.g. the AWS SDK for pandas layer). Enables batch scoring in the anomaly detector; without it each datapoint is scored with the rolling z-score"
+  type        = string
+  default     = ""
+}
+
 variable "prediction_window_hours" {
   description = "Prediction window in hours for forecasting"
   type        = number
@@ -0,0 +1,183 @@
+"""
+Cleanup Executor - Rate-limited concurrent deletion of waste resources
+Deletions run on a bounded worker pool. Each API has its own token bucket
+whose rate halves on throttling and recovers gradually on success, and
+throttled calls are retried with jittered exponential backoff.
+
+Deleting a resource that is already gone counts as success, so retries and
+re-runs are idempotent. A progress log records each resource's outcome and
+is saved as work completes; a run interrupted by the invocation deadline
+resumes from it, skipping finished resources and giving up on resources
+that failed on MAX_FAILED_ATTEMPTS previous runs.
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Tuple
+
+from botocore.exceptions import ClientError
+
+THROTTLE_CODES = {'RequestLimitExceeded', 'Throttling', 'ThrottlingException'}
+GONE_CODES = {
+    'InvalidVolume.NotFound',
+    'InvalidSnapshot.NotFound',
+    'InvalidAllocationID.NotFound',
+    'InvalidAddress.NotFound'
+}
+MAX_FAILED_ATTEMPTS = 3
+
+# category -> (API name used for rate limiting, function deleting one record)
+Actions = Dict[str, Tuple[str, Callable[[Dict[str, Any]], Any]]]
+
+def token_bucket(rate: float, burst: float = None, min_rate: float = 0.2) -> Dict[str, Any]:
+    return {
+        'rate': rate,
+        'max_rate': rate,
+        'min_rate': min(min_rate, rate),
+        'capacity': burst or max(rate, 1.0),
+        'tokens': burst or max(rate, 1.0),
+        'updated': time.monotonic(),
+        'throttled': 0,
+        'lock': threading.Lock()
+    }
+
+def acquire(bucket: Dict[str, Any]):
+    """Block until the bucket has a token, then take it"""
+    while True:
+        with bucket['lock']:
+            now = time.monotonic()
+            bucket['tokens'] = min(bucket['capacity'], bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+            bucket['updated'] = now
+            if bucket['tokens'] >= 1:
+                bucket['tokens'] -= 1
+                return
+            wait = (1 - bucket['tokens']) / bucket['rate']
+        time.sleep(wait)
+
+def slow_down(bucket: Dict[str, Any]):
+    with bucket['lock']:
+        bucket['rate'] = max(bucket['rate'] / 2, bucket['min_rate'])
+        bucket['throttled'] += 1
+
+def speed_up(bucket: Dict[str, Any]):
+    with bucket['lock']:
+        bucket['rate'] = min(bucket['rate'] + bucket['max_rate'] * 0.05, bucket['max_rate'])
+
+def call_with_backoff(bucket: Dict[str, Any], fn: Callable[[], Any], deadline: float = None,
+                      max_attempts: int = 8, base_delay: float = 0.5, max_delay: float = 20.0) -> str:
+    """
+    Call fn under the bucket's rate limit. Returns 'deleted', or
+    'already_deleted' when the resource no longer exists. Raises TimeoutError
+    if the deadline passes while backing off.
+    """
+    for attempt in range(max_attempts):
+        acquire(bucket)
+        try:
+            fn()
+            speed_up(bucket)
+            return 'deleted'
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in GONE_CODES:
+                return 'already_deleted'
+            if code not in THROTTLE_CODES or attempt == max_attempts - 1:
+                raise
+
+        slow_down(bucket)
+        delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+        if deadline is not None and time.monotonic() + delay > deadline:
+            raise TimeoutError('Invocation deadline reached while throttled')
+        time.sleep(delay)
+
+def load_progress(s3, bucket: str, key: str) -> Dict[str, Any]:
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        return {'completed': {}, 'failed': {}}
+
+def save_progress(s3, bucket: str, key: str, progress: Dict[str, Any]):
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(progress).encode(), ContentType='application/json')
+
+def start_cleanup(actions: Actions, progress: Dict[str, Any], save: Callable[[Dict[str, Any]], None] = None,
+                  max_workers: int = 8, rate: float = 5.0, deadline: float = None,
+                  save_every: int = 100) -> Tuple[Callable[[str, Dict[str, Any]], None], Callable[[], Dict[str, Any]]]:
+    """
+    Start an executor resuming from `progress`. Returns (submit, finish):
+    submit(category, record) queues a deletion, blocking while the pool is
+    full; finish() waits for queued work, saves the log and returns results.
+    Resources submitted after the deadline are counted as pending.
+    """
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    slots = threading.BoundedSemaphore(max_workers * 2)
+    buckets = {api: token_bucket(rate) for api, _ in actions.values()}
+    lock = threading.Lock()
+
+    previous_completed = progress.get('completed', {})
+    previous_failed = progress.get('failed', {})
+    log = {'completed': {}, 'failed': {}}
+    results = {'deleted': 0, 'already_deleted': 0, 'skipped': 0, 'pending': 0, 'failed': []}
+    unsaved = [0]
+
+    def record_outcome(resource_id, status=None, failure=None):
+        with lock:
+            if status == 'pending':
+                results['pending'] += 1
+                if resource_id in previous_failed:
+                    log['failed'][resource_id] = previous_failed[resource_id]
+            elif status:
+                results[status] += 1
+                log['completed'][resource_id] = status
+            else:
+                results['failed'].append({'resource': resource_id, 'error': failure['error']})
+                log['failed'][resource_id] = failure
+
+            unsaved[0] += 1
+            if save and unsaved[0] >= save_every:
+                save(dict(log, updated_at=str(datetime.now())))
+                unsaved[0] = 0
+
+    def work(category, record):
+        api, fn = actions[category]
+        resource_id = record['resource_id']
+        try:
+            record_outcome(resource_id, call_with_backoff(buckets[api], lambda: fn(record), deadline))
+        except TimeoutError:
+            record_outcome(resource_id, 'pending')
+        except Exception as e:
+            attempts = previous_failed.get(resource_id, {}).get('attempts', 0) + 1
+            record_outcome(resource_id, failure={'error': str(e), 'attempts': attempts})
+        finally:
+            slots.release()
+
+    def submit(category, record):
+        resource_id = record['resource_id']
+        prior_failure = previous_failed.get(resource_id)
+
+        if resource_id in previous_completed or (prior_failure and prior_failure['attempts'] >= MAX_FAILED_ATTEMPTS):
+            with lock:
+                results['skipped'] += 1
+                if resource_id in previous_completed:
+                    log['completed'][resource_id] = previous_completed[resource_id]
+                else:
+                    log['failed'][resource_id] = prior_failure
+            return
+
+        if deadline is not None and time.monotonic() > deadline:
+            record_outcome(resource_id, 'pending')
+            return
+
+        slots.acquire()
+        pool.submit(work, category, record)
+
+    def finish():
+        pool.shutdown(wait=True)
+        if save:
+            save(dict(log, updated_at=str(datetime.now())))
+        results['throttled'] = sum(b['throttled'] for b in buckets.values())
+        return results
+
+    return submit, finish
@@ -5,9 +5,25 @@ Performs advanced cost analysis, anomaly detection, and waste identification
 
 import os
 import json
+import threading
 import boto3
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from functools import partial
+from typing import Dict, List, Any, Tuple
+
+from ce_reader import iter_pages, iter_items, iter_cost_rows, fold_cost_rows
+from cost_history import load_cost_history
+import cur_engine
+from fanout import deadline_from_context, run_with_deadline
+
+try:
+    import cost_anomaly
+    import cost_cube
+    import cost_forecast
+except ImportError:  # NumPy layer not attached; fall back to period comparison and CE forecasts
+    cost_anomaly = None
+    cost_cube = None
+    cost_forecast = None
 
 # Initialize AWS clients
 ce_client = boto3.client('ce')
@@ -24,48 +40,105 @@ ATHENA_DATABASE = os.environ.get('ATHENA_DATABASE')
 SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN')
 WASTE_THRESHOLD_USD = float(os.environ.get('WASTE_THRESHOLD_USD', '5'))
 ANOMALY_THRESHOLD_PCT = float(os.environ.get('ANOMALY_THRESHOLD_PCT', '20'))
+COST_RESTATEMENT_DAYS = int(os.environ.get('COST_RESTATEMENT_DAYS', '3'))
+CUR_TABLE = os.environ.get('CUR_TABLE')
+ATHENA_WORKGROUP = os.environ.get('ATHENA_WORKGROUP')
+FANOUT_MAX_WORKERS = int(os.environ.get('FANOUT_MAX_WORKERS', '4'))
+DEADLINE_RESERVE_MS = int(os.environ.get('DEADLINE_RESERVE_MS', '60000'))
+FORECAST_DAYS = int(os.environ.get('FORECAST_DAYS', '30'))
+FORECAST_CE_CROSSCHECK = os.environ.get('FORECAST_CE_CROSSCHECK', 'false').lower() == 'true'
+FORECAST_MODEL_KEY = 'cost-forecast/model.json'
+CUBE_TAG_COLUMN = os.environ.get('CUBE_TAG_COLUMN', '')
+CUBE_MONTHS = int(os.environ.get('CUBE_MONTHS', '3'))
+
+# Anomaly engine windows: trailing baseline, scored days and weekday lags
+ANOMALY_BASELINE_DAYS = 35
+ANOMALY_EVAL_DAYS = 7
+ANOMALY_SEASONAL_WEEKS = 5
+
+# Days of history each analysis stage reads from the shared cost dataset
+ANALYSIS_DAYS = 30
+STAGE_LOOKBACK_DAYS = {
+    'summary': ANALYSIS_DAYS,
+    'breakdown': ANALYSIS_DAYS,
+    'anomalies': max(ANOMALY_BASELINE_DAYS, ANOMALY_SEASONAL_WEEKS * 7) + ANOMALY_EVAL_DAYS + COST_RESTATEMENT_DAYS,
+    'waste': ANALYSIS_DAYS
+}
+
+# Cost Explorer requests made by the current invocation ($0.01 each)
+ce_call_count = 0
+ce_call_lock = threading.Lock()
 
 def handler(event, context):
     """
     Main Lambda handler for cost analysis
     """
+    global ce_call_count
+    ce_call_count = 0
     print(f"Starting cost analysis for {PROJECT_NAME}-{ENVIRONMENT}")
     
     try:
         # Get date range (last 30 days)
         end_date = datetime.now().date()
-        start_date = end_date - timedelta(days=30)
+        start_date = end_date - timedelta(days=ANALYSIS_DAYS)
+        
+        # Run the independent Cost Explorer calls concurrently; any call still
+        # running at the deadline is replaced by a result marked partial
+        tasks = {
+            'dataset': (
+                partial(fetch_cost_dataset, *plan_cost_window(end_date)),
+                {'costs': {}, 'error': 'Cost Explorer dataset did not complete before the deadline'}
+            ),
+            'ri_recommendations': (get_ri_recommendations, {'count': 0, 'recommendations': []}),
+            'savings_plans_recommendations': (get_savings_plans_recommendations, {'count': 0, 'recommendations': []})
+        }
+        if cost_forecast is None or FORECAST_CE_CROSSCHECK:
+            tasks['ce_forecast'] = (partial(get_ce_forecast, end_date), {'forecasted_cost': 0})
+        
+        fetched, statuses = run_with_deadline(
+            tasks, deadline_from_context(context, reserve_ms=DEADLINE_RESERVE_MS), max_workers=FANOUT_MAX_WORKERS
+        )
+        
+        # Derive every stage from the one DAILY x SERVICE dataset
+        dataset = fetched['dataset']
+        forecast = get_cost_forecast(dataset, end_date, fetched.get('ce_forecast'))
+        ri_recommendations = fetched['ri_recommendations']
+        savings_plans_recommendations = fetched['savings_plans_recommendations']
         
         # Perform cost analysis
-        cost_summary = get_cost_and_usage(start_date, end_date)
-        cost_forecast = get_cost_forecast(end_date)
-        service_breakdown = get_service_breakdown(start_date, end_date)
-        anomalies = detect_cost_anomalies(start_date, end_date)
+        cost_summary = get_cost_and_usage(dataset, start_date, end_date)
+        service_breakdown = get_service_breakdown(dataset, start_date, end_date)
+        anomalies = detect_cost_anomalies(dataset, end_date)
         waste_resources = identify_waste(service_breakdown)
         
-        # Calculate savings opportunities
-        ri_recommendations = get_ri_recommendations()
-        savings_plans_recommendations = get_savings_plans_recommendations()
+        # Attribute waste and anomalies to individual resources from the CUR
+        resource_attribution = attribute_to_resources(waste_resources, anomalies, start_date, end_date)
+        
+        # Rebuild the slice/dice cost cube for months still receiving data
+        cube_status = refresh_cost_cube(end_date)
         
         # Publish custom metrics to CloudWatch
-        publish_cost_metrics(cost_summary, cost_forecast, waste_resources)
+        publish_cost_metrics(cost_summary, forecast, waste_resources)
         
         # Generate analysis report
         report = generate_cost_report(
             cost_summary,
-            cost_forecast,
+            forecast,
             service_breakdown,
             anomalies,
             waste_resources,
             ri_recommendations,
             savings_plans_recommendations
         )
+        report['resource_attribution'] = resource_attribution
+        report['cost_cube'] = cube_status
+        report['partial_results'] = [name for name, status in statuses.items() if status != 'ok']
         
         # Send notification if anomalies or waste detected
         if anomalies or waste_resources:
             send_notification(report, anomalies, waste_resources)
         
-        print(f"Cost analysis completed successfully")
+        print(f"Cost analysis completed successfully ({ce_call_count} Cost Explorer API calls)")
         
         return {
             'statusCode': 200,
@@ -80,42 +153,168 @@ def handler(event, context):
         send_error_notification(str(e))
         raise
 
-def get_cost_and_usage(start_date, end_date) -> Dict[str, Any]:
-    """Get total cost and usage for date range"""
+def ce_request(operation: str, **params) -> Dict[str, Any]:
+    """Call a Cost Explorer operation, counting it against the current run"""
+    global ce_call_count
+    with ce_call_lock:
+        ce_call_count += 1
+    return getattr(ce_client, operation)(**params)
+
+def plan_cost_window(end_date) -> Tuple[Any, Any]:
+    """
+    Plan the single Cost Explorer query for this run.
+    Covers the widest lookback any analysis stage needs.
+    """
+    lookback_days = max(STAGE_LOOKBACK_DAYS.values())
+    return end_date - timedelta(days=lookback_days), end_date
+
+def fetch_cost_dataset(start_date, end_date) -> Dict[str, Any]:
+    """
+    Fetch daily unblended cost per service for the planned window.
+    Reads settled days from the S3 cost history when COST_BUCKET is set.
+    Returns {'start', 'end', 'costs': {service: {day: cost}}}.
+    """
+    costs = {}
+    
     try:
-        response = ce_client.get_cost_and_usage(
-            TimePeriod={
-                'Start': str(start_date),
-                'End': str(end_date)
-            },
-            Granularity='MONTHLY',
-            Metrics=['UnblendedCost', 'UsageQuantity'],
-            GroupBy=[
-                {'Type': 'DIMENSION', 'Key': 'SERVICE'}
+        if COST_BUCKET:
+            history = load_cost_history(
+                s3_client, COST_BUCKET, start_date, end_date, fetch_service_costs,
+                restatement_days=COST_RESTATEMENT_DAYS
+            )
+            print(f"Cost history: {history['stats']}")
+            return {'start': start_date, 'end': end_date, 'costs': history['costs'], 'history': history['stats']}
+        
+        for day, service, cost in fetch_service_costs(start_date, end_date):
+            costs.setdefault(service, {})[day] = cost
+        
+        return {'start': start_date, 'end': end_date, 'costs': costs}
+    except Exception as e:
+        print(f"Error fetching cost dataset: {str(e)}")
+        return {'start': start_date, 'end': end_date, 'costs': costs, 'error': str(e)}
+
+def fetch_service_costs(start_date, end_date):
+    """Yield (day, service, cost) from one paginated DAILY x SERVICE query"""
+    rows = iter_cost_rows(
+        partial(ce_request, 'get_cost_and_usage'),
+        TimePeriod={
+            'Start': str(start_date),
+            'End': str(end_date)
+        },
+        Granularity='DAILY',
+        Metrics=['UnblendedCost'],
+        GroupBy=[
+            {'Type': 'DIMENSION', 'Key': 'SERVICE'}
+        ]
+    )
+    
+    # Fold pages as they stream in; a service can span several pages
+    for (service, day), cost in fold_cost_rows(rows, key=lambda day, keys: (keys[0], day)).items():
+        yield day, service, cost
+
+def sum_service_costs(dataset: Dict[str, Any], start_date, end_date) -> Dict[str, float]:
+    """Sum each service's daily costs over [start_date, end_date)"""
+    start, end = str(start_date), str(end_date)
+    totals = {}
+    for service, days in dataset['costs'].items():
+        totals[service] = sum(cost for day, cost in days.items() if start <= day < end)
+    return totals
+
+def get_cost_and_usage(dataset: Dict[str, Any], start_date, end_date) -> Dict[str, Any]:
+    """Get total cost and daily totals for date range"""
+    if 'error' in dataset:
+        return {'total_cost': 0, 'error': dataset['error']}
+    
+    start, end = str(start_date), str(end_date)
+    daily_totals = {}
+    for days in dataset['costs'].values():
+        for day, cost in days.items():
+            if start <= day < end:
+                daily_totals[day] = daily_totals.get(day, 0) + cost
+    
+    total_cost = sum(daily_totals.values())
+    
+    summary = {
+        'total_cost': round(total_cost, 2),
+        'period': f"{start_date} to {end_date}",
+        'currency': 'USD',
+        'daily_totals': [
+            {'date': day, 'cost': round(cost, 2)}
+            for day, cost in sorted(daily_totals.items())
+        ]
+    }
+    
+    if 'history' in dataset:
+        summary['history'] = dataset['history']
+    
+    return summary
+
+def get_cost_forecast(dataset: Dict[str, Any], end_date, ce_forecast: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Forecast the next FORECAST_DAYS of cost per service from the daily
+    history, refitting the persisted model with newly settled days only.
+    Cost Explorer's forecast is used when NumPy is unavailable and is
+    otherwise attached as an optional cross-check.
+    """
+    if cost_forecast is None or 'error' in dataset:
+        return ce_forecast or {'forecasted_cost': 0, 'error': dataset.get('error', 'No forecast available')}
+    
+    try:
+        settled_end = end_date - timedelta(days=COST_RESTATEMENT_DAYS)
+        if COST_BUCKET:
+            model = cost_forecast.load_model(s3_client, COST_BUCKET, FORECAST_MODEL_KEY, dataset['start'])
+        else:
+            model = cost_forecast.new_model(dataset['start'])
+        model = cost_forecast.update_model(model, dataset['costs'], dataset['start'], settled_end)
+        
+        result = cost_forecast.forecast(model, end_date, FORECAST_DAYS)
+        if result is None:
+            return ce_forecast or {'forecasted_cost': 0, 'error': 'Not enough history to forecast'}
+        
+        if COST_BUCKET:
+            cost_forecast.save_model(s3_client, COST_BUCKET, FORECAST_MODEL_KEY, model)
+            cost_forecast.save_forecast(s3_client, COST_BUCKET, f"cost-forecast/dt={end_date}/forecast.json.gz", result)
+        
+        top_services = sorted(result['series'].items(), key=lambda item: item[1]['total'], reverse=True)[:10]
+        forecast = {
+            'forecasted_cost': round(result['total'], 2),
+            'lower_bound': round(result['total_lower'], 2),
+            'upper_bound': round(result['total_upper'], 2),
+            'confidence': 0.95,
+            'period': f"{end_date} to {end_date + timedelta(days=FORECAST_DAYS)}",
+            'currency': 'USD',
+            'method': 'weekday-linear',
+            'model_last_day': model['last_day'],
+            'top_services': [
+                {
+                    'service': service,
+                    'forecasted_cost': round(f['total'], 2),
+                    'lower_bound': round(sum(f['lower']), 2),
+                    'upper_bound': round(sum(f['upper']), 2)
+                }
+                for service, f in top_services
             ]
-        )
+        }
         
-        total_cost = sum(
-            float(result['Total']['UnblendedCost']['Amount'])
-            for result in response['ResultsByTime']
-        )
+        if ce_forecast and 'error' not in ce_forecast:
+            ce_cost = ce_forecast['forecasted_cost']
+            forecast['ce_cross_check'] = {
+                'forecasted_cost': ce_cost,
+                'difference_pct': round((forecast['forecasted_cost'] - ce_cost) / ce_cost * 100, 2) if ce_cost else None
+            }
         
-        return {
-            'total_cost': round(total_cost, 2),
-            'period': f"{start_date} to {end_date}",
-            'currency': 'USD',
-            'results': response['ResultsByTime']
-        }
+        return forecast
     except Exception as e:
-        print(f"Error getting cost and usage: {str(e)}")
-        return {'total_cost': 0, 'error': str(e)}
+        print(f"Error forecasting costs: {str(e)}")
+        return ce_forecast or {'forecasted_cost': 0, 'error': str(e)}
 
-def get_cost_forecast(start_date) -> Dict[str, Any]:
-    """Get cost forecast for next 30 days"""
+def get_ce_forecast(start_date) -> Dict[str, Any]:
+    """Get Cost Explorer's cost forecast for next 30 days"""
     try:
-        end_date = start_date + timedelta(days=30)
+        end_date = start_date + timedelta(days=FORECAST_DAYS)
         
-        response = ce_client.get_cost_forecast(
+        response = ce_request(
+            'get_cost_forecast',
             TimePeriod={
                 'Start': str(start_date),
                 'End': str(end_date)
@@ -135,107 +334,98 @@ def get_cost_forecast(start_date) -> Dict[str, Any]:
         print(f"Error getting cost forecast: {str(e)}")
         return {'forecasted_cost': 0, 'error': str(e)}
 
-def get_service_breakdown(start_date, end_date) -> List[Dict[str, Any]]:
+def get_service_breakdown(dataset: Dict[str, Any], start_date, end_date) -> List[Dict[str, Any]]:
     """Get cost breakdown by AWS service"""
+    services = []
+    for service, cost in sum_service_costs(dataset, start_date, end_date).items():
+        if cost > 0:
+            services.append({
+                'service': service,
+                'cost': round(cost, 2)
+            })
+    
+    # Sort by cost descending
+    services.sort(key=lambda x: x['cost'], reverse=True)
+    
+    return services
+
+def detect_cost_anomalies(dataset: Dict[str, Any], end_date) -> List[Dict[str, Any]]:
+    """
+    Detect daily cost anomalies per service with the vectorized engine
+    (rolling, weekday-seasonal and robust MAD scores)
+    """
+    if cost_anomaly is None:
+        return detect_period_anomalies(dataset, end_date)
+    
     try:
-        response = ce_client.get_cost_and_usage(
-            TimePeriod={
-                'Start': str(start_date),
-                'End': str(end_date)
-            },
-            Granularity='MONTHLY',
-            Metrics=['UnblendedCost'],
-            GroupBy=[
-                {'Type': 'DIMENSION', 'Key': 'SERVICE'}
-            ]
+        # Days Cost Explorer is still filling in would read as drops; score settled days only
+        settled_end = end_date - timedelta(days=COST_RESTATEMENT_DAYS)
+        start_date = end_date - timedelta(days=STAGE_LOOKBACK_DAYS['anomalies'])
+        flagged = cost_anomaly.detect_anomalies(
+            dataset['costs'], start_date, settled_end,
+            baseline_days=ANOMALY_BASELINE_DAYS,
+            eval_days=ANOMALY_EVAL_DAYS,
+            seasonal_weeks=ANOMALY_SEASONAL_WEEKS,
+            min_change_pct=ANOMALY_THRESHOLD_PCT
         )
         
-        services = []
-        for result in response['ResultsByTime']:
-            for group in result['Groups']:
-                service = group['Keys'][0]
-                cost = float(group['Metrics']['UnblendedCost']['Amount'])
-                
-                if cost > 0:
-                    services.append({
-                        'service': service,
-                        'cost': round(cost, 2)
-                    })
-        
-        # Sort by cost descending
-        services.sort(key=lambda x: x['cost'], reverse=True)
+        anomalies = []
+        for a in flagged:
+            change_pct = a['change_percentage']
+            anomalies.append({
+                'service': a['series'],
+                'date': a['date'],
+                'previous_cost': a['baseline_cost'],
+                'current_cost': a['cost'],
+                'change_percentage': change_pct,
+                'severity': 'high' if change_pct is None or abs(change_pct) > 50 else 'medium',
+                'scores': {
+                    'zscore': a['zscore'],
+                    'seasonal_zscore': a['seasonal_zscore'],
+                    'robust_zscore': a['robust_zscore']
+                }
+            })
         
-        return services
+        return anomalies
     except Exception as e:
-        print(f"Error getting service breakdown: {str(e)}")
+        print(f"Error detecting anomalies: {str(e)}")
         return []
 
-def detect_cost_anomalies(start_date, end_date) -> List[Dict[str, Any]]:
+def detect_period_anomalies(dataset: Dict[str, Any], end_date) -> List[Dict[str, Any]]:
     """
     Detect cost anomalies using simple statistical analysis
-    Compares current period with previous period
+    Compares current period with previous period (used when NumPy is unavailable)
     """
     anomalies = []
     
-    try:
-        # Current period (last 7 days)
-        current_end = end_date
-        current_start = current_end - timedelta(days=7)
-        
-        # Previous period (previous 7 days)
-        previous_end = current_start
-        previous_start = previous_end - timedelta(days=7)
-        
-        # Get costs for both periods
-        current_cost = ce_client.get_cost_and_usage(
-            TimePeriod={'Start': str(current_start), 'End': str(current_end)},
-            Granularity='DAILY',
-            Metrics=['UnblendedCost'],
-            GroupBy=[{'Type': 'DIMENSION', 'Key': 'SERVICE'}]
-        )
-        
-        previous_cost = ce_client.get_cost_and_usage(
-            TimePeriod={'Start': str(previous_start), 'End': str(previous_end)},
-            Granularity='DAILY',
-            Metrics=['UnblendedCost'],
-            GroupBy=[{'Type': 'DIMENSION', 'Key': 'SERVICE'}]
-        )
+    # Current period (last 7 settled days)
+    current_end = end_date - timedelta(days=COST_RESTATEMENT_DAYS)
+    current_start = current_end - timedelta(days=7)
+    
+    # Previous period (previous 7 days)
+    previous_end = current_start
+    previous_start = previous_end - timedelta(days=7)
+    
+    current_services = sum_service_costs(dataset, current_start, current_end)
+    previous_services = sum_service_costs(dataset, previous_start, previous_end)
+    
+    # Detect anomalies (> threshold % increase)
+    for service, current in current_services.items():
+        previous = previous_services.get(service, 0)
         
-        # Calculate service costs
-        current_services = {}
-        for result in current_cost['ResultsByTime']:
-            for group in result['Groups']:
-                service = group['Keys'][0]
-                cost = float(group['Metrics']['UnblendedCost']['Amount'])
-                current_services[service] = current_services.get(service, 0) + cost
-        
-        previous_services = {}
-        for result in previous_cost['ResultsByTime']:
-            for group in result['Groups']:
-                service = group['Keys'][0]
-                cost = float(group['Metrics']['UnblendedCost']['Amount'])
-                previous_services[service] = previous_services.get(service, 0) + cost
-        
-        # Detect anomalies (> threshold % increase)
-        for service, current in current_services.items():
-            previous = previous_services.get(service, 0)
+        if previous > 0:
+            change_pct = ((current - previous) / previous) * 100
             
-            if previous > 0:
-                change_pct = ((current - previous) / previous) * 100
-                
-                if abs(change_pct) > ANOMALY_THRESHOLD_PCT:
-                    anomalies.append({
-                        'service': service,
-                        'previous_cost': round(previous, 2),
-                        'current_cost': round(current, 2),
-                        'change_percentage': round(change_pct, 2),
-                        'severity': 'high' if abs(change_pct) > 50 else 'medium'
-                    })
-        
-        return anomalies
-    except Exception as e:
-        print(f"Error detecting anomalies: {str(e)}")
-        return []
+            if abs(change_pct) > ANOMALY_THRESHOLD_PCT:
+                anomalies.append({
+                    'service': service,
+                    'previous_cost': round(previous, 2),
+                    'current_cost': round(current, 2),
+                    'change_percentage': round(change_pct, 2),
+                    'severity': 'high' if abs(change_pct) > 50 else 'medium'
+                })
+    
+    return anomalies
 
 def identify_waste(service_breakdown: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
@@ -267,19 +457,84 @@ def identify_waste(service_breakdown: List[Dict[str, Any]]) -> List[Dict[str, An
     
     return waste
 
+def attribute_to_resources(waste: List[Dict[str, Any]], anomalies: List[Dict[str, Any]], start_date, end_date) -> Dict[str, Any]:
+    """
+    Attach the CUR resources behind each waste item (top resources by cost)
+    and each dated anomaly (largest increases over the prior week)
+    """
+    if not (ATHENA_DATABASE and CUR_TABLE and COST_BUCKET):
+        return {'enabled': False}
+    
+    stats = {'enabled': True}
+    run = cur_query_runner(stats)
+    
+    try:
+        if waste:
+            by_product = cur_engine.top_resources_by_product(run, CUR_TABLE, start_date, end_date)
+            for item in waste:
+                item['top_resources'] = cur_engine.match_product(item['service'], by_product)
+        
+        for day in sorted({a['date'] for a in anomalies if 'date' in a}):
+            by_product = cur_engine.resource_cost_changes(run, CUR_TABLE, day)
+            for anomaly in anomalies:
+                if anomaly.get('date') == day:
+                    anomaly['top_resources'] = cur_engine.match_product(anomaly['service'], by_product)[:5]
+    except Exception as e:
+        print(f"Error attributing costs to resources: {str(e)}")
+        stats['error'] = str(e)
+    
+    return stats
+
+def refresh_cost_cube(end_date) -> Dict[str, Any]:
+    """Rebuild the monthly cost cubes in COST_BUCKET from the CUR"""
+    if cost_cube is None or not (ATHENA_DATABASE and CUR_TABLE and COST_BUCKET):
+        return {'enabled': False}
+    
+    stats = {'enabled': True}
+    try:
+        stats.update(cost_cube.refresh_cubes(
+            s3_client,
+            COST_BUCKET,
+            cur_query_runner(stats),
+            CUR_TABLE,
+            end_date,
+            months=CUBE_MONTHS,
+            restatement_days=COST_RESTATEMENT_DAYS,
+            tag_column=CUBE_TAG_COLUMN or None
+        ))
+    except Exception as e:
+        print(f"Error refreshing cost cube: {str(e)}")
+        stats['error'] = str(e)
+    
+    return stats
+
+def cur_query_runner(stats: Dict[str, Any]) -> cur_engine.QueryRunner:
+    """Athena runner over the CUR table with a local result cache"""
+    return cur_engine.cached_runner(
+        cur_engine.athena_runner(
+            athena_client, ATHENA_DATABASE, f"s3://{COST_BUCKET}/athena-results/", workgroup=ATHENA_WORKGROUP
+        ),
+        stats=stats
+    )
+
 def get_ri_recommendations() -> Dict[str, Any]:
     """Get Reserved Instance purchase recommendations"""
     try:
-        response = ce_client.get_reservation_purchase_recommendation(
+        recs = iter_items(
+            partial(ce_request, 'get_reservation_purchase_recommendation'),
+            'Recommendations',
             Service='Amazon Elastic Compute Cloud - Compute',
             LookbackPeriodInDays='SIXTY_DAYS',
             TermInYears='ONE_YEAR',
             PaymentOption='NO_UPFRONT'
         )
         
+        # Count every page but only keep the top 5
+        count = 0
         recommendations = []
-        if 'Recommendations' in response:
-            for rec in response['Recommendations']:
+        for rec in recs:
+            count += 1
+            if len(recommendations) < 5:
                 details = rec.get('RecommendationDetails', {})
                 recommendations.append({
                     'instance_type': details.get('InstanceDetails', {}).get('EC2InstanceDetails', {}).get('InstanceType'),
@@ -288,8 +543,8 @@ def get_ri_recommendations() -> Dict[str, Any]:
                 })
         
         return {
-            'count': len(recommendations),
-            'recommendations': recommendations[:5]  # Top 5
+            'count': count,
+            'recommendations': recommendations
         }
     except Exception as e:
         print(f"Error getting RI recommendations: {str(e)}")
@@ -298,54 +553,61 @@ def get_ri_recommendations() -> Dict[str, Any]:
 def get_savings_plans_recommendations() -> Dict[str, Any]:
     """Get Savings Plans purchase recommendations"""
     try:
-        response = ce_client.get_savings_plans_purchase_recommendation(
+        pages = iter_pages(
+            partial(ce_request, 'get_savings_plans_purchase_recommendation'),
             LookbackPeriodInDays='SIXTY_DAYS',
             TermInYears='ONE_YEAR',
             PaymentOption='NO_UPFRONT',
             SavingsPlansType='COMPUTE_SP'
         )
         
+        # Count every page but only keep the top 5
+        count = 0
         recommendations = []
-        if 'SavingsPlansPurchaseRecommendation' in response:
-            details = response['SavingsPlansPurchaseRecommendation'].get('SavingsPlansPurchaseRecommendationDetails', [])
+        for response in pages:
+            details = response.get('SavingsPlansPurchaseRecommendation', {}).get('SavingsPlansPurchaseRecommendationDetails', [])
             for rec in details:
-                recommendations.append({
-                    'hourly_commitment': rec.get('HourlyCommitmentToPurchase'),
-                    'estimated_monthly_savings': rec.get('EstimatedMonthlySavingsAmount'),
-                    'estimated_roi': rec.get('EstimatedROI')
-                })
+                count += 1
+                if len(recommendations) < 5:
+                    recommendations.append({
+                        'hourly_commitment': rec.get('HourlyCommitmentToPurchase'),
+                        'estimated_monthly_savings': rec.get('EstimatedMonthlySavingsAmount'),
+                        'estimated_roi': rec.get('EstimatedROI')
+                    })
         
         return {
-            'count': len(recommendations),
-            'recommendations': recommendations[:5]  # Top 5
+            'count': count,
+            'recommendations': recommendations
         }
     except Exception as e:
         print(f"Error getting Savings Plans recommendations: {str(e)}")
         return {'count': 0, 'recommendations': []}
 
 def publish_cost_metrics(cost_summary: Dict, forecast: Dict, waste: List):
-    """Publish custom cost metrics to CloudWatch"""
+    """Publish custom cost metrics to CloudWatch, skipping costs that could not be computed"""
     try:
         metrics = [
             {
+                'MetricName': 'WasteResourcesCount',
+                'Value': len(waste),
+                'Unit': 'Count',
+                'Timestamp': datetime.now()
+            }
+        ]
+        if 'error' not in cost_summary:
+            metrics.append({
                 'MetricName': 'TotalMonthlyCost',
                 'Value': cost_summary.get('total_cost', 0),
                 'Unit': 'None',
                 'Timestamp': datetime.now()
-            },
-            {
+            })
+        if 'error' not in forecast:
+            metrics.append({
                 'MetricName': 'ForecastedMonthlyCost',
                 'Value': forecast.get('forecasted_cost', 0),
                 'Unit': 'None',
                 'Timestamp': datetime.now()
-            },
-            {
-                'MetricName': 'WasteResourcesCount',
-                'Value': len(waste),
-                'Unit': 'Count',
-                'Timestamp': datetime.now()
-            }
-        ]
+            })
         
         cloudwatch.put_metric_data(
             Namespace=f'{PROJECT_NAME}/{ENVIRONMENT}/FinOps',
@@ -388,7 +650,8 @@ def generate_cost_report(cost_summary, forecast, services, anomalies, waste, ri_
             'forecasted_monthly_cost': forecast.get('forecasted_cost', 0),
             'anomalies_detected': len(anomalies),
             'waste_resources_found': len(waste),
-            'optimization_opportunities': ri_recs['count'] + sp_recs['count']
+            'optimization_opportunities': ri_recs['count'] + sp_recs['count'],
+            'ce_api_calls': ce_call_count
         }
     }
 
@@ -410,7 +673,8 @@ Total Anomalies: {len(anomalies)}
 """
         
         for anomaly in anomalies[:5]:  # Top 5 anomalies
-            message += f"\n- {anomaly['service']}: {anomaly['change_percentage']:+.1f}% change (${anomaly['current_cost']:.2f})"
+            change = f"{anomaly['change_percentage']:+.1f}% change" if anomaly['change_percentage'] is not None else "new spend"
+            message += f"\n- {anomaly['service']}: {change} (${anomaly['current_cost']:.2f})"
         
         message += f"\n\n=== WASTE OPPORTUNITIES ===\nTotal Waste Resources: {len(waste)}\n"
         
@@ -421,6 +685,9 @@ Total Anomalies: {len(anomalies)}
         message += f"Reserved Instance Opportunities: {report['optimization_recommendations']['reserved_instances']['count']}\n"
         message += f"Savings Plans Opportunities: {report['optimization_recommendations']['savings_plans']['count']}\n"
         
+        if report.get('partial_results'):
+            message += f"\nPartial results (timed out or failed): {', '.join(report['partial_results'])}\n"
+        
         message += f"\n\nView full dashboard: AWS Console > CloudWatch > Dashboards > {PROJECT_NAME}-{ENVIRONMENT}-finops-dashboard"
         
         sns_client.publish(
@@ -0,0 +1,216 @@
+"""
+Cost Cube - Precomputed multi-dimension cost cube with slice/dice queries
+One cube per month, built from the CUR and stored in COST_BUCKET as a
+compressed NumPy archive in coordinate form: for each dimension a value
+dictionary plus one integer code per row, and one cost per row.
+
+Dimensions: day x service x account x region x usage_type x tag
+
+Layout:
+    cost-cube/month=YYYY-MM/cube.npz
+    cost-cube/manifest.json          {"months": {month: {"rows", "built_at"}}}
+"""
+
+import io
+import json
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+import cur_engine
+
+DIMENSIONS = ('day', 'service', 'account', 'region', 'usage_type', 'tag')
+PREFIX = 'cost-cube'
+
+# Cubes loaded by this container, keyed by month: (built_at, cube)
+_loaded = {}
+
+def month_key(month: str) -> str:
+    return f"{PREFIX}/month={month}/cube.npz"
+
+def fetch_cube_rows(run: cur_engine.QueryRunner, table: str, month_start: date, tag_column: str = None) -> List[Dict[str, Any]]:
+    """Aggregate one month of the CUR to one row per dimension combination"""
+    month_end = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    partitions, partition_params = cur_engine.partition_filter(month_start, month_start)
+    tag = f"coalesce({cur_engine.table_name(tag_column)}, '')" if tag_column else "''"
+    sql = f"""
+        SELECT CAST(date(line_item_usage_start_date) AS varchar) AS day,
+               product_product_name AS service,
+               line_item_usage_account_id AS account,
+               product_region AS region,
+               line_item_usage_type AS usage_type,
+               {tag} AS tag,
+               sum(line_item_unblended_cost) AS cost
+        FROM {cur_engine.table_name(table)}
+        WHERE {partitions}
+          AND date(line_item_usage_start_date) >= ?
+          AND date(line_item_usage_start_date) < ?
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """
+    return run(sql, partition_params + [month_start, month_end])
+
+def build_cube(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Dictionary-encode rows into {'<dim>_values', '<dim>_codes', 'cost'} arrays"""
+    cube = {'cost': np.array([float(r['cost'] or 0) for r in rows], dtype=np.float64)}
+
+    for dim in DIMENSIONS:
+        values, codes = np.unique(np.array([r[dim] or '' for r in rows], dtype=str), return_inverse=True)
+        cube[f"{dim}_values"] = values
+        cube[f"{dim}_codes"] = codes.astype(np.uint32)
+
+    return cube
+
+def save_cube(s3, bucket: str, month: str, cube: Dict[str, np.ndarray]):
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **cube)
+    s3.put_object(Bucket=bucket, Key=month_key(month), Body=buf.getvalue())
+
+def load_manifest(s3, bucket: str) -> Dict[str, Any]:
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=f"{PREFIX}/manifest.json")['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        return {'months': {}}
+
+def save_manifest(s3, bucket: str, manifest: Dict[str, Any]):
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{PREFIX}/manifest.json",
+        Body=json.dumps(manifest, sort_keys=True).encode(),
+        ContentType='application/json'
+    )
+
+def refresh_cubes(s3, bucket: str, run: cur_engine.QueryRunner, table: str, end_date,
+                  months: int = 3, restatement_days: int = 3, tag_column: str = None) -> Dict[str, Any]:
+    """
+    Rebuild the cubes for months still receiving data (those overlapping the
+    restatement window) and any of the last `months` months not built yet
+    """
+    manifest = load_manifest(s3, bucket)
+    restating_from = end_date - timedelta(days=restatement_days)
+
+    wanted = []
+    month_start = end_date.replace(day=1)
+    for _ in range(months):
+        wanted.append(month_start)
+        month_start = (month_start - timedelta(days=1)).replace(day=1)
+
+    rebuilt = []
+    for month_start in sorted(wanted):
+        month = month_start.strftime('%Y-%m')
+        month_end = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        if month in manifest['months'] and month_end <= restating_from:
+            continue
+
+        rows = fetch_cube_rows(run, table, month_start, tag_column)
+        save_cube(s3, bucket, month, build_cube(rows))
+        manifest['months'][month] = {'rows': len(rows), 'built_at': datetime.utcnow().isoformat()}
+        rebuilt.append(month)
+
+    if rebuilt:
+        save_manifest(s3, bucket, manifest)
+
+    return {'months_rebuilt': rebuilt, 'months_available': sorted(manifest['months'])}
+
+def load_cube(s3, bucket: str, month: str, built_at: str) -> Dict[str, np.ndarray]:
+    """Load a month's cube, reusing the copy held by this container when unchanged"""
+    cached = _loaded.get(month)
+    if cached and cached[0] == built_at:
+        return cached[1]
+
+    body = s3.get_object(Bucket=bucket, Key=month_key(month))['Body'].read()
+    with np.load(io.BytesIO(body), allow_pickle=False) as archive:
+        cube = {name: archive[name] for name in archive.files}
+
+    _loaded[month] = (built_at, cube)
+    return cube
+
+def query_cube(cube: Dict[str, np.ndarray], group_by: Sequence[str], filters: Dict[str, Sequence[str]] = None,
+               start: str = None, end: str = None) -> Dict[tuple, float]:
+    """Sum cost grouped by `group_by` over rows matching every filter and [start, end)"""
+    mask = np.ones(len(cube['cost']), dtype=bool)
+
+    for dim, wanted in (filters or {}).items():
+        if isinstance(wanted, str):
+            wanted = [wanted]
+        codes = np.nonzero(np.isin(cube[f"{dim}_values"], list(wanted)))[0]
+        mask &= np.isin(cube[f"{dim}_codes"], codes)
+
+    if start or end:
+        days = cube['day_values']
+        in_range = np.ones(len(days), dtype=bool)
+        if start:
+            in_range &= days >= start
+        if end:
+            in_range &= days < end
+        mask &= in_range[cube['day_codes']]
+
+    cost = cube['cost'][mask]
+    if not group_by:
+        return {(): float(cost.sum())}
+
+    if not cost.size:
+        return {}
+
+    # One integer per group combination, then sum cost per distinct combination
+    codes = [cube[f"{dim}_codes"][mask].astype(np.int64) for dim in group_by]
+    sizes = [len(cube[f"{dim}_values"]) for dim in group_by]
+    groups, inverse = np.unique(np.ravel_multi_index(codes, sizes), return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=cost, minlength=len(groups))
+
+    labels = [cube[f"{dim}_values"][idx] for dim, idx in zip(group_by, np.unravel_index(groups, sizes))]
+    return {tuple(str(v) for v in key): float(total) for key, total in zip(zip(*labels), totals)}
+
+def normalize_query(group_by, filters) -> Tuple[List[str], Dict[str, List[str]]]:
+    """group_by as a list and filters as lists of values, checked against DIMENSIONS"""
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    if not isinstance(group_by, (list, tuple)):
+        raise ValueError("group_by must be a list of dimensions")
+    if filters is not None and not isinstance(filters, dict):
+        raise ValueError("filters must map dimensions to lists of values")
+
+    normalized = {}
+    for dim, wanted in (filters or {}).items():
+        if isinstance(wanted, str):
+            wanted = [wanted]
+        if not isinstance(wanted, (list, tuple)) or not all(isinstance(v, str) for v in wanted):
+            raise ValueError(f"Filter '{dim}' must be a string or a list of strings")
+        normalized[dim] = list(wanted)
+
+    for dim in list(group_by) + list(normalized):
+        if dim not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension '{dim}'; expected one of {', '.join(DIMENSIONS)}")
+    return list(group_by), normalized
+
+def query(s3, bucket: str, group_by: Sequence[str] = (), filters: Dict[str, Sequence[str]] = None,
+          start: str = None, end: str = None, top: int = None) -> Dict[str, Any]:
+    """
+    Answer a group-by/filter question across the monthly cubes overlapping
+    [start, end). Returns rows sorted by cost descending. A single dimension
+    or filter value may be given as a string; other malformed queries raise
+    ValueError.
+    """
+    group_by, filters = normalize_query(group_by, filters)
+
+    manifest = load_manifest(s3, bucket)
+    totals = {}
+    for month, entry in sorted(manifest['months'].items()):
+        if (start and month < start[:7]) or (end and month > end[:7]):
+            continue
+        cube = load_cube(s3, bucket, month, entry['built_at'])
+        for key, cost in query_cube(cube, group_by, filters, start, end).items():
+            totals[key] = totals.get(key, 0.0) + cost
+
+    rows = [dict(zip(group_by, key), cost=round(cost, 4)) for key, cost in totals.items()]
+    rows.sort(key=lambda r: r['cost'], reverse=True)
+
+    return {
+        'group_by': list(group_by),
+        'filters': filters or {},
+        'start': start,
+        'end': end,
+        'total_cost': round(sum(totals.values()), 2),
+        'row_count': len(rows),
+        'rows': rows[:top] if top else rows
+    }
@@ -0,0 +1,50 @@
+"""
+Cost Cube Query Lambda - Slice/dice queries over the precomputed cost cube
+Answers group-by/filter questions from the cubes cost_analyzer writes to
+COST_BUCKET, without calling Cost Explorer.
+
+Event:
+    {
+        "group_by": ["account", "service"],
+        "filters": {"region": ["us-east-1"], "tag": ["team-a"]},
+        "start": "2024-01-01",          # inclusive, optional
+        "end": "2024-02-01",            # exclusive, optional
+        "top": 20                       # optional
+    }
+
+A single group-by dimension or filter value may be given as a string.
+Unknown dimensions and malformed filters return 400.
+"""
+
+import os
+import json
+import time
+import boto3
+
+import cost_cube
+
+s3_client = boto3.client('s3')
+
+COST_BUCKET = os.environ.get('COST_BUCKET')
+
+def handler(event, context):
+    started = time.perf_counter()
+
+    try:
+        result = cost_cube.query(
+            s3_client,
+            COST_BUCKET,
+            group_by=event.get('group_by', []),
+            filters=event.get('filters'),
+            start=event.get('start'),
+            end=event.get('end'),
+            top=event.get('top')
+        )
+    except ValueError as e:
+        return {'statusCode': 400, 'body': json.dumps({'error': str(e)})}
+    except Exception as e:
+        print(f"Error querying cost cube: {str(e)}")
+        raise
+
+    result['query_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return {'statusCode': 200, 'body': json.dumps(result)}
@@ -0,0 +1,171 @@
+"""
+Cost Forecast - In-process daily cost forecasting per service
+Fits a linear model with trend and day-of-week terms to every service at
+once. The model is stored as exponentially-weighted sufficient statistics
+(X'X shared by all series, X'y and y'y per series), so each run folds in only
+the days settled since the last run instead of refitting from scratch.
+
+Forecasts carry per-day prediction intervals; the interval for a total is
+derived assuming independent per-service errors.
+"""
+
+import gzip
+import json
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+
+# intercept, trend (years since origin), Tuesday..Sunday indicators
+N_FEATURES = 8
+MIN_TRAINING_DAYS = 14
+RIDGE = 1e-6
+Z_95 = 1.96
+
+def design_matrix(days: List[date], origin: date) -> np.ndarray:
+    """One row of regressors per day"""
+    X = np.zeros((len(days), N_FEATURES))
+    X[:, 0] = 1.0
+    X[:, 1] = [(d - origin).days / 365.0 for d in days]
+    weekday = np.array([d.weekday() for d in days])
+    for k in range(1, 7):
+        X[:, 1 + k] = weekday == k
+    return X
+
+def new_model(origin: date) -> Dict[str, Any]:
+    return {
+        'version': 1,
+        'origin': str(origin),
+        'last_day': None,
+        'weight': 0.0,
+        'xtx': np.zeros((N_FEATURES, N_FEATURES)),
+        'series': {}
+    }
+
+def update_model(model: Dict[str, Any], costs: Dict[str, Dict[str, float]], start_date, end_date,
+                 forgetting: float = 0.98) -> Dict[str, Any]:
+    """
+    Fold the days in [start_date, end_date) that come after model['last_day']
+    into the model. Each older day's weight decays by `forgetting` per day.
+    A model whose history does not reach start_date is restarted.
+    """
+    if model['last_day'] is not None:
+        last = date.fromisoformat(model['last_day'])
+        if last < start_date - timedelta(days=1):
+            print(f"Forecast model last updated {last}, older than available history; refitting")
+            model = new_model(start_date)
+        else:
+            start_date = last + timedelta(days=1)
+
+    days = []
+    day = start_date
+    while day < end_date:
+        days.append(day)
+        day += timedelta(days=1)
+    if not days:
+        return model
+
+    origin = date.fromisoformat(model['origin'])
+    X = design_matrix(days, origin)
+    m = len(days)
+
+    keys = sorted(set(model['series']) | set(costs))
+    Y = np.array([[costs.get(k, {}).get(str(d), 0.0) for d in days] for k in keys]).reshape(len(keys), m)
+
+    # Newest day weight 1, older days decayed; existing statistics decay by m days
+    w = forgetting ** np.arange(m - 1, -1, -1)
+    decay = forgetting ** m
+
+    model['xtx'] = decay * model['xtx'] + (X * w[:, None]).T @ X
+    model['weight'] = decay * model['weight'] + w.sum()
+
+    xty_new = (Y * w) @ X
+    yty_new = (Y ** 2) @ w
+    series = {}
+    for i, key in enumerate(keys):
+        old = model['series'].get(key)
+        xty = decay * np.asarray(old['xty']) + xty_new[i] if old else xty_new[i]
+        yty = decay * old['yty'] + yty_new[i] if old else yty_new[i]
+        series[key] = {'xty': xty, 'yty': float(yty)}
+
+    # Drop series whose spend has fully decayed
+    model['series'] = {k: v for k, v in series.items() if v['yty'] > 1e-9}
+    model['last_day'] = str(days[-1])
+    return model
+
+def forecast(model: Dict[str, Any], start_date, days: int, z: float = Z_95) -> Dict[str, Any]:
+    """
+    Daily forecasts with prediction intervals for every series over
+    [start_date, start_date + days). Returns None while the model has
+    fewer than MIN_TRAINING_DAYS of effective history.
+    """
+    if model['weight'] < MIN_TRAINING_DAYS or not model['series']:
+        return None
+
+    keys = list(model['series'])
+    xtx = model['xtx'] + RIDGE * np.eye(N_FEATURES)
+    xtx_inv = np.linalg.inv(xtx)
+    xty = np.array([model['series'][k]['xty'] for k in keys])
+    yty = np.array([model['series'][k]['yty'] for k in keys])
+
+    beta = xty @ xtx_inv  # (S, k); X'X is symmetric
+    sse = yty - 2 * np.einsum('sk,sk->s', beta, xty) + np.einsum('sk,kj,sj->s', beta, model['xtx'], beta)
+    dof = max(model['weight'] - N_FEATURES, 1.0)
+    sigma = np.sqrt(np.maximum(sse, 0) / dof)
+
+    horizon = [start_date + timedelta(days=i) for i in range(days)]
+    X = design_matrix(horizon, date.fromisoformat(model['origin']))
+    leverage = np.sqrt(1 + np.einsum('hk,kj,hj->h', X, xtx_inv, X))
+
+    mean = np.maximum(beta @ X.T, 0)  # (S, H)
+    spread = z * sigma[:, None] * leverage[None, :]
+
+    total = float(mean.sum())
+    total_spread = z * float(np.sqrt((sigma[:, None] ** 2 * leverage[None, :] ** 2).sum()))
+
+    return {
+        'days': [str(d) for d in horizon],
+        'total': total,
+        'total_lower': max(total - total_spread, 0.0),
+        'total_upper': total + total_spread,
+        'series': {
+            key: {
+                'total': float(mean[i].sum()),
+                'daily': np.round(mean[i], 4).tolist(),
+                'lower': np.round(np.maximum(mean[i] - spread[i], 0), 4).tolist(),
+                'upper': np.round(mean[i] + spread[i], 4).tolist()
+            }
+            for i, key in enumerate(keys)
+        }
+    }
+
+def load_model(s3, bucket: str, key: str, origin: date) -> Dict[str, Any]:
+    """Load persisted model state, or a fresh model on first run"""
+    try:
+        state = json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        return new_model(origin)
+
+    state['xtx'] = np.array(state['xtx'])
+    for entry in state['series'].values():
+        entry['xty'] = np.array(entry['xty'])
+    return state
+
+def save_model(s3, bucket: str, key: str, model: Dict[str, Any]):
+    state = dict(model)
+    state['xtx'] = model['xtx'].tolist()
+    state['series'] = {
+        k: {'xty': np.asarray(v['xty']).tolist(), 'yty': v['yty']}
+        for k, v in model['series'].items()
+    }
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(state).encode(), ContentType='application/json')
+
+def save_forecast(s3, bucket: str, key: str, result: Dict[str, Any]):
+    """Store the full per-service daily forecast as gzip JSON"""
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=gzip.compress(json.dumps(result).encode()),
+        ContentType='application/json',
+        ContentEncoding='gzip'
+    )
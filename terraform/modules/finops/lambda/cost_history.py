@@ -0,0 +1,144 @@
+"""
+Cost History Store - Incremental daily cost history in S3
+Keeps one gzip NDJSON partition per day plus a manifest, so each run only
+asks Cost Explorer for days that are missing or still being restated.
+
+Layout:
+    <prefix>/dt=YYYY-MM-DD/costs.ndjson.gz   {"service": ..., "cost": ...} per line
+    <prefix>/manifest.json                   {"days": {day: {"rows", "fetched_at", "final"}}}
+"""
+
+import gzip
+import json
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+DEFAULT_PREFIX = 'cost-history/service-daily'
+MANIFEST_NAME = 'manifest.json'
+
+# Fetches [start, end) and yields (day, service, cost)
+FetchRange = Callable[[Any, Any], Iterable[Tuple[str, str, float]]]
+
+def partition_key(prefix: str, day: str) -> str:
+    return f"{prefix}/dt={day}/costs.ndjson.gz"
+
+def load_manifest(s3, bucket: str, prefix: str = DEFAULT_PREFIX) -> Dict[str, Any]:
+    """Load the store manifest, or an empty one on first run"""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=f"{prefix}/{MANIFEST_NAME}")
+        return json.loads(obj['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        return {'version': 1, 'days': {}}
+
+def save_manifest(s3, bucket: str, manifest: Dict[str, Any], prefix: str = DEFAULT_PREFIX):
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{prefix}/{MANIFEST_NAME}",
+        Body=json.dumps(manifest, sort_keys=True).encode(),
+        ContentType='application/json'
+    )
+
+def write_day(s3, bucket: str, day: str, costs: Dict[str, float], prefix: str = DEFAULT_PREFIX):
+    """Write one day's partition as gzip NDJSON"""
+    lines = [json.dumps({'service': service, 'cost': cost}) for service, cost in sorted(costs.items())]
+    s3.put_object(
+        Bucket=bucket,
+        Key=partition_key(prefix, day),
+        Body=gzip.compress('\n'.join(lines).encode()),
+        ContentType='application/x-ndjson',
+        ContentEncoding='gzip'
+    )
+
+def read_day(s3, bucket: str, day: str, prefix: str = DEFAULT_PREFIX) -> Dict[str, float]:
+    """Read one day's partition back into {service: cost}"""
+    obj = s3.get_object(Bucket=bucket, Key=partition_key(prefix, day))
+    costs = {}
+    for line in gzip.decompress(obj['Body'].read()).splitlines():
+        if line:
+            row = json.loads(line)
+            costs[row['service']] = row['cost']
+    return costs
+
+def plan_fetch_ranges(manifest: Dict[str, Any], start_date, end_date, restatement_days: int) -> List[Tuple[Any, Any]]:
+    """
+    Return contiguous [start, end) ranges that must come from Cost Explorer:
+    days absent from the manifest, not yet final, or inside the trailing
+    restatement window before end_date.
+    """
+    restating_from = end_date - timedelta(days=restatement_days)
+    known = manifest.get('days', {})
+
+    ranges = []
+    day = start_date
+    while day < end_date:
+        entry = known.get(str(day))
+        stale = entry is None or not entry.get('final') or day >= restating_from
+
+        if stale:
+            if ranges and ranges[-1][1] == day:
+                ranges[-1] = (ranges[-1][0], day + timedelta(days=1))
+            else:
+                ranges.append((day, day + timedelta(days=1)))
+        day += timedelta(days=1)
+
+    return ranges
+
+def load_cost_history(s3, bucket: str, start_date, end_date, fetch_range: FetchRange,
+                      restatement_days: int = 3, prefix: str = DEFAULT_PREFIX) -> Dict[str, Any]:
+    """
+    Return {'costs': {service: {day: cost}}, 'stats': {...}} for [start_date, end_date).
+    Stale days are fetched with one fetch_range call per contiguous gap and
+    written back to the store; the rest are read from S3.
+    """
+    manifest = load_manifest(s3, bucket, prefix)
+    ranges = plan_fetch_ranges(manifest, start_date, end_date, restatement_days)
+    restating_from = end_date - timedelta(days=restatement_days)
+    fetched_at = datetime.utcnow().isoformat()
+
+    costs = {}
+    fetched_days = set()
+
+    for range_start, range_end in ranges:
+        by_day = {}
+        day = range_start
+        while day < range_end:
+            by_day[str(day)] = {}
+            day += timedelta(days=1)
+
+        for day, service, cost in fetch_range(range_start, range_end):
+            by_day.setdefault(day, {})[service] = cost
+
+        for day, day_costs in by_day.items():
+            if day_costs:
+                write_day(s3, bucket, day, day_costs, prefix)
+            manifest['days'][day] = {
+                'rows': len(day_costs),
+                'fetched_at': fetched_at,
+                'final': day < str(restating_from)
+            }
+            for service, cost in day_costs.items():
+                costs.setdefault(service, {})[day] = cost
+            fetched_days.add(day)
+
+    cached_days = 0
+    day = start_date
+    while day < end_date:
+        key = str(day)
+        if key not in fetched_days:
+            cached_days += 1
+            if manifest['days'][key]['rows']:
+                for service, cost in read_day(s3, bucket, key, prefix).items():
+                    costs.setdefault(service, {})[key] = cost
+        day += timedelta(days=1)
+
+    if ranges:
+        save_manifest(s3, bucket, manifest, prefix)
+
+    return {
+        'costs': costs,
+        'stats': {
+            'days_fetched': len(fetched_days),
+            'days_from_store': cached_days,
+            'fetch_ranges': len(ranges)
+        }
+    }
@@ -0,0 +1,292 @@
+"""
+CUR Engine - Resource-level cost queries over the Cost and Usage Report
+Runs parameterized, partition-pruned SQL through a pluggable runner:
+
+- athena_runner: Athena over the CUR Glue table, with server-side result reuse
+- sqlite_runner: SQLite over CUR CSV exports, for offline runs
+- cached_runner: wraps either one with a local result cache keyed by query hash
+
+Queries use `?` placeholders and the CUR Athena column names
+(line_item_unblended_cost, product_product_name, ...), which both engines accept.
+
+Offline usage: python cur_engine.py <cur-export.csv> [...]
+"""
+
+import csv
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# (sql, params) -> list of row dicts
+QueryRunner = Callable[[str, Sequence[Any]], List[Dict[str, Any]]]
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def athena_runner(athena, database: str, output_location: str, workgroup: str = None,
+                  reuse_minutes: int = 60, timeout_seconds: int = 120) -> QueryRunner:
+    """Run queries on Athena, reusing identical results up to reuse_minutes old"""
+    def run(sql: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
+        request = {
+            'QueryString': sql,
+            'QueryExecutionContext': {'Database': database},
+            'ResultConfiguration': {'OutputLocation': output_location},
+            'ResultReuseConfiguration': {
+                'ResultReuseByAgeConfiguration': {'Enabled': True, 'MaxAgeInMinutes': reuse_minutes}
+            }
+        }
+        if params:
+            request['ExecutionParameters'] = [athena_literal(p) for p in params]
+        if workgroup:
+            request['WorkGroup'] = workgroup
+
+        execution_id = athena.start_query_execution(**request)['QueryExecutionId']
+        wait_for_query(athena, execution_id, timeout_seconds)
+
+        rows = []
+        columns = None
+        for page in athena.get_paginator('get_query_results').paginate(QueryExecutionId=execution_id):
+            for row in page['ResultSet']['Rows']:
+                values = [cell.get('VarCharValue') for cell in row['Data']]
+                if columns is None:
+                    columns = values  # header row
+                    continue
+                rows.append(dict(zip(columns, values)))
+        return rows
+
+    return run
+
+def wait_for_query(athena, execution_id: str, timeout_seconds: int):
+    """Poll an Athena execution until it finishes, raising on failure or timeout"""
+    deadline = time.monotonic() + timeout_seconds
+    delay = 0.5
+
+    while True:
+        status = athena.get_query_execution(QueryExecutionId=execution_id)['QueryExecution']['Status']
+        state = status['State']
+        if state == 'SUCCEEDED':
+            return
+        if state in ('FAILED', 'CANCELLED'):
+            raise RuntimeError(f"Athena query {execution_id} {state}: {status.get('StateChangeReason', '')}")
+        if time.monotonic() > deadline:
+            athena.stop_query_execution(QueryExecutionId=execution_id)
+            raise TimeoutError(f"Athena query {execution_id} exceeded {timeout_seconds}s")
+
+        time.sleep(delay)
+        delay = min(delay * 2, 5)
+
+def athena_literal(value: Any) -> str:
+    """Render a parameter as the SQL literal Athena substitutes for `?`"""
+    if isinstance(value, datetime):
+        return f"TIMESTAMP '{value.strftime('%Y-%m-%d %H:%M:%S')}'"
+    if isinstance(value, date):
+        return f"DATE '{value.isoformat()}'"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def sqlite_runner(conn: sqlite3.Connection) -> QueryRunner:
+    """Run queries on a SQLite connection (see load_cur_csv)"""
+    conn.row_factory = sqlite3.Row
+
+    def run(sql: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
+        values = [p.isoformat() if isinstance(p, date) else p for p in params]
+        return [dict(row) for row in conn.execute(sql, values)]
+
+    return run
+
+def cached_runner(runner: QueryRunner, cache_dir: str = '/tmp/cur-cache', ttl_seconds: int = 6 * 3600,
+                  stats: Dict[str, int] = None) -> QueryRunner:
+    """
+    Cache results on local disk keyed by sha256(sql, params), so a warm
+    container repeats no query inside ttl_seconds. Hits and misses are
+    counted into `stats` when given.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    stats = stats if stats is not None else {}
+    stats.setdefault('queries', 0)
+    stats.setdefault('cache_hits', 0)
+
+    def run(sql: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
+        digest = query_hash(sql, params)
+        path = os.path.join(cache_dir, f"{digest}.json")
+
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < ttl_seconds:
+            with open(path) as f:
+                stats['cache_hits'] += 1
+                return json.load(f)
+
+        rows = runner(sql, params)
+        stats['queries'] += 1
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(rows, f)
+        os.replace(tmp_path, path)
+        return rows
+
+    return run
+
+def query_hash(sql: str, params: Sequence[Any]) -> str:
+    normalized = ' '.join(sql.split())
+    payload = json.dumps([normalized, [str(p) for p in params]])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def partition_filter(start_date, end_date) -> Tuple[str, List[str]]:
+    """
+    Predicate on the CUR year/month partitions covering [start_date, end_date],
+    so Athena only scans the months in range.
+    """
+    months = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        months.append((str(year), str(month)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    clause = ' OR '.join(['(year = ? AND month = ?)'] * len(months))
+    params = [value for ym in months for value in ym]
+    return f"({clause})", params
+
+def table_name(table: str) -> str:
+    if not IDENTIFIER.match(table):
+        raise ValueError(f"Invalid CUR table name: {table}")
+    return table
+
+def top_resources_by_product(run: QueryRunner, table: str, start_date, end_date,
+                             per_product: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+    """Top resources by unblended cost for each product over [start_date, end_date)"""
+    partitions, partition_params = partition_filter(start_date, end_date)
+    sql = f"""
+        SELECT product, resource_id, cost FROM (
+            SELECT product, resource_id, cost,
+                   row_number() OVER (PARTITION BY product ORDER BY cost DESC) AS cost_rank
+            FROM (
+                SELECT product_product_name AS product,
+                       line_item_resource_id AS resource_id,
+                       sum(line_item_unblended_cost) AS cost
+                FROM {table_name(table)}
+                WHERE {partitions}
+                  AND date(line_item_usage_start_date) >= ?
+                  AND date(line_item_usage_start_date) < ?
+                  AND line_item_resource_id <> ''
+                GROUP BY 1, 2
+            ) r
+        ) t
+        WHERE cost_rank <= {int(per_product)}
+        ORDER BY product, cost DESC
+    """
+    rows = run(sql, partition_params + [start_date, end_date])
+
+    by_product = {}
+    for row in rows:
+        by_product.setdefault(row['product'], []).append({
+            'resource_id': row['resource_id'],
+            'cost': round(float(row['cost']), 2)
+        })
+    return by_product
+
+def resource_cost_changes(run: QueryRunner, table: str, day, baseline_days: int = 7,
+                          limit: int = 50) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Resources whose cost on `day` rose most above their average over the
+    preceding baseline_days, grouped by product.
+    """
+    day = date.fromisoformat(day) if isinstance(day, str) else day
+    baseline_start = day - timedelta(days=baseline_days)
+    partitions, partition_params = partition_filter(baseline_start, day)
+    sql = f"""
+        SELECT product, resource_id, day_cost, baseline_cost, day_cost - baseline_cost AS delta FROM (
+            SELECT product_product_name AS product,
+                   line_item_resource_id AS resource_id,
+                   sum(CASE WHEN date(line_item_usage_start_date) = ? THEN line_item_unblended_cost ELSE 0 END) AS day_cost,
+                   sum(CASE WHEN date(line_item_usage_start_date) < ? THEN line_item_unblended_cost ELSE 0 END) / {int(baseline_days)} AS baseline_cost
+            FROM {table_name(table)}
+            WHERE {partitions}
+              AND date(line_item_usage_start_date) >= ?
+              AND date(line_item_usage_start_date) <= ?
+              AND line_item_resource_id <> ''
+            GROUP BY 1, 2
+        ) r
+        WHERE day_cost > baseline_cost
+        ORDER BY delta DESC
+        LIMIT {int(limit)}
+    """
+    rows = run(sql, [day, day] + partition_params + [baseline_start, day])
+
+    by_product = {}
+    for row in rows:
+        by_product.setdefault(row['product'], []).append({
+            'resource_id': row['resource_id'],
+            'cost': round(float(row['day_cost']), 2),
+            'baseline_cost': round(float(row['baseline_cost']), 2),
+            'increase': round(float(row['delta']), 2)
+        })
+    return by_product
+
+def match_product(service: str, by_product: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Resources for a Cost Explorer SERVICE name. CUR product names drop CE's
+    suffixes (e.g. 'Amazon Elastic Compute Cloud' for '... - Compute').
+    """
+    if service in by_product:
+        return by_product[service]
+    for product, resources in by_product.items():
+        if product and service.startswith(f"{product} - "):
+            return resources
+    return []
+
+def load_cur_csv(paths: Sequence[str], table: str = 'cur', conn: sqlite3.Connection = None) -> sqlite3.Connection:
+    """
+    Load CUR CSV exports into SQLite. Accepts Athena-style column names or the
+    raw CUR headers (lineItem/UnblendedCost -> line_item_unblended_cost), and
+    derives the year/month partition columns from the usage start date.
+    """
+    conn = conn or sqlite3.connect(':memory:')
+    table = table_name(table)
+    created = False
+
+    for path in paths:
+        with open(path, newline='') as f:
+            reader = csv.reader(f)
+            columns = [athena_column(c) for c in next(reader)]
+            start_col = columns.index('line_item_usage_start_date')
+
+            if not created:
+                defs = ', '.join(f"{c} {'REAL' if c.endswith(('_cost', '_amount', '_quantity')) else 'TEXT'}" for c in columns)
+                conn.execute(f"CREATE TABLE {table} ({defs}, year TEXT, month TEXT)")
+                created = True
+
+            placeholders = ', '.join(['?'] * (len(columns) + 2))
+            insert = f"INSERT INTO {table} ({', '.join(columns)}, year, month) VALUES ({placeholders})"
+            rows = []
+            for values in reader:
+                started = values[start_col]
+                rows.append(values + [started[:4], str(int(started[5:7]))])
+            conn.executemany(insert, rows)
+
+    conn.commit()
+    return conn
+
+def athena_column(header: str) -> str:
+    """Convert a raw CUR header (lineItem/UsageStartDate) to its Athena column name"""
+    name = header.strip().replace('/', '_').replace(':', '_')
+    name = re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', name)
+    return re.sub(r'[^A-Za-z0-9_]', '_', name).lower()
+
+if __name__ == '__main__':
+    import sys
+
+    conn = load_cur_csv(sys.argv[1:])
+    stats = {}
+    run = cached_runner(sqlite_runner(conn), cache_dir='/tmp/cur-cache-local', stats=stats)
+    last_day = date.fromisoformat(conn.execute("SELECT max(date(line_item_usage_start_date)) FROM cur").fetchone()[0])
+
+    print(json.dumps({
+        'top_resources': top_resources_by_product(run, 'cur', last_day - timedelta(days=30), last_day + timedelta(days=1)),
+        'cost_changes': resource_cost_changes(run, 'cur', last_day),
+        'stats': stats
+    }, indent=2))
@@ -0,0 +1,60 @@
+"""
+Fan-out - Run independent calls concurrently under the invocation deadline
+Tasks still running when the deadline passes (or that raise) are replaced by
+their fallback value, marked partial, so one slow API cannot fail the run.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Tuple
+
+# name -> (zero-argument callable, fallback dict used if it does not finish)
+Tasks = Dict[str, Tuple[Callable[[], Any], Dict[str, Any]]]
+
+def deadline_from_context(context, reserve_ms: int = 30000, default_ms: int = 300000) -> float:
+    """
+    Monotonic deadline for fanned-out work: the invocation's remaining time
+    minus reserve_ms kept back for reporting and notifications
+    """
+    remaining_ms = context.get_remaining_time_in_millis() if context else default_ms
+    return time.monotonic() + max(remaining_ms - reserve_ms, 0) / 1000
+
+def run_with_deadline(tasks: Tasks, deadline: float, max_workers: int = 4) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Run every task on a bounded thread pool until the deadline.
+    Returns (results, statuses) where status is 'ok', 'timeout' or 'error'.
+    """
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {name: pool.submit(fn) for name, (fn, _) in tasks.items()}
+
+    done, _ = wait(futures.values(), timeout=max(deadline - time.monotonic(), 0))
+
+    # Abandon stragglers; queued tasks are cancelled, running ones are left to finish
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    results, statuses = {}, {}
+    for name, future in futures.items():
+        fallback = tasks[name][1]
+
+        if future in done:
+            try:
+                results[name] = future.result()
+                statuses[name] = 'ok'
+                continue
+            except Exception as e:
+                statuses[name] = 'error'
+                reason = f"Failed: {str(e)}"
+        else:
+            statuses[name] = 'timeout'
+            reason = 'Timed out before the invocation deadline'
+
+        print(f"Task {name} returned a partial result: {reason}")
+        results[name] = partial_result(fallback, reason)
+
+    return results, statuses
+
+def partial_result(fallback: Dict[str, Any], reason: str) -> Dict[str, Any]:
+    result = dict(fallback)
+    result['partial'] = True
+    result['error'] = reason
+    return result
@@ -0,0 +1,214 @@
+"""
+Instance Catalog - EC2 instance type specs and target-type selection
+Built from DescribeInstanceTypes and cached per region in /tmp and in S3
+with a TTL, so a warm container loads it once and a cold start reads one
+small object instead of paging through the API.
+
+Catalog document:
+    {"version": 1, "region": ..., "built_at": epoch seconds,
+     "types": {instance_type: [vcpus, memory_mib, architecture, burstable, current_generation]}}
+
+Types are grouped by class and attributes across generations and processor
+vendors (m5, m5a, m6i, m7i, ...), each family ordered by vCPU and memory.
+Graviton families of the same group (m6g, m7g) are offered separately since
+moving to them needs an arm64 AMI.
+"""
+
+import gzip
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Optional
+
+import price_index
+
+VERSION = 1
+FAMILY_PATTERN = re.compile(r'^([a-z]+)(\d+)([a-z-]*)$')
+# Attribute letters naming the processor rather than the shape of the type
+PROCESSOR_LETTERS = 'agi'
+
+# region -> indexed catalog, kept for the life of the container
+_catalogs = {}
+
+def build_catalog(ec2, region: str) -> Dict[str, Any]:
+    types = {}
+    for page in ec2.get_paginator('describe_instance_types').paginate():
+        for t in page['InstanceTypes']:
+            architectures = t.get('ProcessorInfo', {}).get('SupportedArchitectures', [])
+            types[t['InstanceType']] = [
+                t['VCpuInfo']['DefaultVCpus'],
+                t['MemoryInfo']['SizeInMiB'],
+                'arm64' if 'arm64' in architectures else 'x86_64',
+                t.get('BurstablePerformanceSupported', False),
+                t.get('CurrentGeneration', False)
+            ]
+    return {'version': VERSION, 'region': region, 'built_at': time.time(), 'types': types}
+
+def load_catalog(ec2, s3, bucket: str, region: str, ttl_seconds: int = 86400,
+                 cache_dir: str = '/tmp') -> Dict[str, Any]:
+    """Indexed catalog from memory, /tmp, S3 or the API, whichever is first fresh"""
+    now = time.time()
+    cached = _catalogs.get(region)
+    if cached and now - cached['built_at'] < ttl_seconds:
+        return cached
+
+    path = os.path.join(cache_dir, f"instance-catalog-{region}.json")
+    key = f"rightsizing/catalog/{region}.json.gz"
+    doc = _read_local(path)
+
+    if not _fresh(doc, now, ttl_seconds) and bucket:
+        try:
+            doc = json.loads(gzip.decompress(s3.get_object(Bucket=bucket, Key=key)['Body'].read()))
+        except s3.exceptions.NoSuchKey:
+            doc = None
+        if _fresh(doc, now, ttl_seconds):
+            _write_local(path, doc)
+
+    if not _fresh(doc, now, ttl_seconds):
+        doc = build_catalog(ec2, region)
+        _write_local(path, doc)
+        if bucket:
+            s3.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=gzip.compress(json.dumps(doc, separators=(',', ':')).encode()),
+                ContentType='application/json',
+                ContentEncoding='gzip'
+            )
+
+    _catalogs[region] = index_catalog(doc)
+    return _catalogs[region]
+
+def index_catalog(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Families ordered by vCPU and memory, and family groups for cross-family selection"""
+    types = {name: tuple(spec) for name, spec in doc['types'].items()}
+    families, groups = {}, {}
+    for name in types:
+        family = name.partition('.')[0]
+        families.setdefault(family, []).append(name)
+
+    for family, names in families.items():
+        names.sort(key=lambda n: (types[n][0], types[n][1]))
+        group = family_group(family)
+        if group:
+            groups.setdefault(group, []).append(family)
+
+    return {
+        'region': doc['region'],
+        'built_at': doc['built_at'],
+        'types': types,
+        'families': families,
+        'groups': groups,
+        'candidates': {}
+    }
+
+def family_group(family: str) -> Optional[str]:
+    """'m5' and 'm7g' -> 'm', 'c5d' and 'c6gd' -> 'c:d'; None for unusual names"""
+    match = FAMILY_PATTERN.match(family)
+    if not match:
+        return None
+    cls, _, attrs = match.groups()
+    attrs = ''.join(c for c in attrs if c not in PROCESSOR_LETTERS)
+    return f"{cls}:{attrs}" if attrs else cls
+
+def candidates(catalog: Dict[str, Any], prices, instance_type: str, platform: str, architecture: str) -> list:
+    """Priced current-generation types of the instance's group, cheapest first (cached)"""
+    family = instance_type.partition('.')[0]
+    group = family_group(family)
+    burstable = catalog['types'][instance_type][3]
+
+    # A previous-generation family also lists its own types, so the family is part of the key
+    cache_key = (family, burstable, platform, architecture)
+    if cache_key in catalog['candidates']:
+        return catalog['candidates'][cache_key]
+
+    types = catalog['types']
+    found = []
+    for other in catalog['groups'].get(group, [family]):
+        for name in catalog['families'].get(other, []):
+            vcpus, memory, arch, is_burstable, current = types[name]
+            if arch != architecture or is_burstable != burstable or not (current or other == family):
+                continue
+            hourly = price_index.ec2_instance_hourly(prices, catalog['region'], name, platform)
+            if hourly is not None:
+                found.append((hourly, vcpus, memory, name))
+
+    found.sort()
+    catalog['candidates'][cache_key] = found
+    return found
+
+def select_target(catalog: Dict[str, Any], prices, instance_type: str, cpu_percent: float,
+                  memory_percent: float = None, headroom: float = 0.3,
+                  platform: str = 'Linux/UNIX', architecture: str = None) -> Optional[Dict[str, Any]]:
+    """
+    Cheapest type whose vCPUs (and memory) cover the observed utilization
+    with `headroom` to spare. Without a memory profile the memory-per-vCPU
+    ratio of the current type is kept.
+    """
+    spec = catalog['types'].get(instance_type)
+    if spec is None:
+        return None
+
+    vcpus, memory = spec[0], spec[1]
+    needed_vcpus = vcpus * cpu_percent / 100 / (1 - headroom)
+    if memory_percent is None:
+        needed_memory = memory * needed_vcpus / vcpus
+    else:
+        needed_memory = memory * memory_percent / 100 / (1 - headroom)
+
+    for hourly, cand_vcpus, cand_memory, name in candidates(catalog, prices, instance_type, platform, architecture or spec[2]):
+        if cand_vcpus >= needed_vcpus and cand_memory >= needed_memory:
+            return {'instance_type': name, 'hourly_cost': hourly, 'vcpus': cand_vcpus, 'memory_mib': cand_memory}
+    return None
+
+def _fresh(doc: Optional[Dict[str, Any]], now: float, ttl_seconds: int) -> bool:
+    return bool(doc) and doc.get('version') == VERSION and now - doc['built_at'] < ttl_seconds
+
+def _read_local(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_local(path: str, doc: Dict[str, Any]):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(doc, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def benchmark(instances: int = 10000, path: str = '/tmp/instance-catalog-bench.idx'):
+    """Time target selection over a synthetic catalog and price index"""
+    import random
+
+    sizes = [('large', 2), ('xlarge', 4), ('2xlarge', 8), ('4xlarge', 16), ('8xlarge', 32), ('12xlarge', 48), ('16xlarge', 64)]
+    families = {'m5': 4096, 'm5a': 4096, 'm6i': 4096, 'm7i': 4096, 'm6g': 4096, 'm7g': 4096,
+                'c5': 2048, 'c6i': 2048, 'c7g': 2048, 'r5': 8192, 'r6i': 8192, 'r7g': 8192}
+    types, prices = {}, {}
+    for family, mib_per_vcpu in families.items():
+        arch = 'arm64' if 'g' in family[2:] else 'x86_64'
+        for size, vcpus in sizes:
+            name = f"{family}.{size}"
+            types[name] = [vcpus, vcpus * mib_per_vcpu, arch, False, True]
+            prices[('ec2', 'us-east-1', 'instance', name, 'linux')] = vcpus * mib_per_vcpu / 4096 * 0.048 * random.uniform(0.8, 1.0)
+    price_index.write_index(path, prices, {'sources': []})
+    index = price_index.load_index(path)
+
+    started = time.perf_counter()
+    catalog = index_catalog({'region': 'us-east-1', 'built_at': time.time(), 'types': types})
+    indexed = time.perf_counter()
+
+    names = list(types)
+    rng = random.Random(7)
+    fleet = [(rng.choice(names), rng.uniform(1, 95), rng.choice([None, rng.uniform(10, 90)])) for _ in range(instances)]
+    selected = time.perf_counter()
+    found = sum(1 for name, cpu, mem in fleet if select_target(catalog, index, name, cpu, mem))
+    finished = time.perf_counter()
+
+    print(f"{len(types)} types, {instances} instances, {found} targets")
+    print(f"  index: {(indexed - started) * 1000:.2f} ms")
+    print(f"  select: {(finished - selected) * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,237 @@
+"""
+Price Index - Compact on-demand price lookups from the AWS Price List
+Built offline from Price List bulk offer files (JSON) into a small binary
+file that the Lambdas memory-map on cold start. Lookups hash the key and
+probe an open-addressing table, so they are O(1) and need no parsing.
+
+Keys are (service, region, kind, attributes...), lower-cased:
+    ec2|us-east-1|instance|m5.large|linux        USD per hour
+    ebs|us-east-1|volume|gp3                     USD per GB-month
+    ebs|us-east-1|snapshot|standard              USD per GB-month
+    ec2|us-east-1|eip|idle                       USD per hour
+    elb|us-east-1|application                    USD per hour
+    rds|us-east-1|instance|db.t3.micro|postgresql|single-az    USD per hour
+
+File layout (little-endian):
+    header   '<4sHHI'  magic, version, reserved, slot count (power of two)
+    slots    '<Qd'     64-bit key hash (0 = empty), price
+    trailer  '<I' + JSON metadata (sources, entry count, build time)
+
+Build:
+    python price_index.py build -o prices.idx AmazonEC2.json AmazonRDS.json AWSELB.json
+Inspect:
+    python price_index.py lookup prices.idx ec2 us-east-1 instance m5.large linux
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+MAGIC = b'PIDX'
+VERSION = 1
+HEADER = struct.Struct('<4sHHI')
+SLOT = struct.Struct('<Qd')
+HOURS_PER_MONTH = 730
+
+# EC2 PlatformDetails -> Price List operatingSystem
+PLATFORMS = {
+    'linux/unix': 'linux',
+    'windows': 'windows',
+    'red hat enterprise linux': 'rhel',
+    'suse linux': 'suse'
+}
+
+# RDS API engine -> Price List databaseEngine
+RDS_ENGINES = {
+    'postgres': 'postgresql',
+    'mysql': 'mysql',
+    'mariadb': 'mariadb',
+    'aurora-mysql': 'aurora mysql',
+    'aurora-postgresql': 'aurora postgresql',
+    'oracle-se2': 'oracle',
+    'oracle-ee': 'oracle',
+    'sqlserver-ex': 'sql server',
+    'sqlserver-web': 'sql server',
+    'sqlserver-se': 'sql server',
+    'sqlserver-ee': 'sql server'
+}
+
+LOAD_BALANCER_FAMILIES = {
+    'Load Balancer-Application': 'application',
+    'Load Balancer-Network': 'network',
+    'Load Balancer-Gateway': 'gateway'
+}
+
+def key_hash(parts: Sequence[Any]) -> int:
+    key = '|'.join(str(p) for p in parts).lower().encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+
+def load_index(path: str) -> Optional[Dict[str, Any]]:
+    """Memory-map an index file, or None if it does not exist"""
+    if not path or not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, _, slots = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} price index")
+    return {'mm': mm, 'slots': slots}
+
+def lookup(index: Optional[Dict[str, Any]], *parts) -> Optional[float]:
+    """Price for a key, or None when the index is missing or has no entry"""
+    if index is None:
+        return None
+
+    mm, slots = index['mm'], index['slots']
+    h = key_hash(parts)
+    slot = h & (slots - 1)
+    while True:
+        stored, price = SLOT.unpack_from(mm, HEADER.size + slot * SLOT.size)
+        if stored == h:
+            return price
+        if stored == 0:
+            return None
+        slot = (slot + 1) & (slots - 1)
+
+def metadata(index: Dict[str, Any]) -> Dict[str, Any]:
+    mm = index['mm']
+    offset = HEADER.size + index['slots'] * SLOT.size
+    (length,) = struct.unpack_from('<I', mm, offset)
+    return json.loads(mm[offset + 4:offset + 4 + length])
+
+def write_index(path: str, prices: Dict[Tuple[str, ...], float], meta: Dict[str, Any]):
+    """Write {key parts: price} as an index with load factor <= 0.5"""
+    slots = 1
+    while slots < max(len(prices) * 2, 8):
+        slots *= 2
+
+    table = bytearray(slots * SLOT.size)
+    for parts, price in prices.items():
+        h = key_hash(parts)
+        slot = h & (slots - 1)
+        while True:
+            stored, _ = SLOT.unpack_from(table, slot * SLOT.size)
+            if stored in (0, h):
+                SLOT.pack_into(table, slot * SLOT.size, h, price)
+                break
+            slot = (slot + 1) & (slots - 1)
+
+    trailer = json.dumps(dict(meta, entries=len(prices))).encode()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, slots))
+        f.write(table)
+        f.write(struct.pack('<I', len(trailer)))
+        f.write(trailer)
+    os.replace(tmp_path, path)
+
+def on_demand_price(offer: Dict[str, Any], sku: str) -> Optional[float]:
+    """First-tier USD on-demand price of a SKU"""
+    for term in offer.get('terms', {}).get('OnDemand', {}).get(sku, {}).values():
+        for dimension in term['priceDimensions'].values():
+            if dimension.get('beginRange', '0') == '0' and 'USD' in dimension['pricePerUnit']:
+                return float(dimension['pricePerUnit']['USD'])
+    return None
+
+def product_keys(product: Dict[str, Any]) -> Iterator[Tuple[str, ...]]:
+    """Index keys for one Price List product (none for products we do not price)"""
+    family = product.get('productFamily', '')
+    attrs = product.get('attributes', {})
+    region = attrs.get('regionCode')
+    usage_type = attrs.get('usagetype', '')
+    if not region:
+        return
+
+    if family == 'Compute Instance':
+        if (attrs.get('tenancy') == 'Shared' and attrs.get('preInstalledSw') == 'NA'
+                and attrs.get('capacitystatus') == 'Used' and attrs.get('licenseModel') != 'Bring your own license'):
+            yield ('ec2', region, 'instance', attrs['instanceType'], attrs['operatingSystem'])
+    elif family == 'Storage' and attrs.get('volumeApiName'):
+        yield ('ebs', region, 'volume', attrs['volumeApiName'])
+    elif family == 'Storage Snapshot' and usage_type.endswith('EBS:SnapshotUsage'):
+        yield ('ebs', region, 'snapshot', 'standard')
+    elif family == 'IP Address' and usage_type.endswith(('ElasticIP:IdleAddress', 'PublicIPv4:IdleAddress')):
+        yield ('ec2', region, 'eip', 'idle')
+    elif family in LOAD_BALANCER_FAMILIES and usage_type.endswith('LoadBalancerUsage'):
+        yield ('elb', region, LOAD_BALANCER_FAMILIES[family])
+    elif family == 'Database Instance' and attrs.get('licenseModel') != 'Bring your own license':
+        yield ('rds', region, 'instance', attrs['instanceType'], attrs['databaseEngine'], attrs['deploymentOption'])
+
+def build_index(offer_paths: Sequence[str], output: str) -> Dict[str, Any]:
+    """Build an index from Price List bulk offer files (one per service or service/region)"""
+    prices, sources = {}, []
+    for path in offer_paths:
+        with open(path) as f:
+            offer = json.load(f)
+        sources.append({
+            'file': os.path.basename(path),
+            'offer': offer.get('offerCode'),
+            'publication_date': offer.get('publicationDate')
+        })
+
+        for sku, product in offer.get('products', {}).items():
+            for parts in product_keys(product):
+                price = on_demand_price(offer, sku)
+                if price:
+                    key = tuple(str(p).lower() for p in parts)
+                    # Keep the lowest non-zero price when several SKUs share a key
+                    prices[key] = min(price, prices.get(key, price))
+
+    meta = {'sources': sources, 'built_at': datetime.utcnow().isoformat()}
+    write_index(output, prices, meta)
+    return dict(meta, entries=len(prices))
+
+def ec2_instance_hourly(index, region: str, instance_type: str, platform_details: str = 'Linux/UNIX') -> Optional[float]:
+    platform = PLATFORMS.get((platform_details or 'Linux/UNIX').lower(), 'linux')
+    return lookup(index, 'ec2', region, 'instance', instance_type, platform)
+
+def rds_instance_hourly(index, region: str, instance_class: str, engine: str, multi_az: bool = False) -> Optional[float]:
+    deployment = 'multi-az' if multi_az else 'single-az'
+    return lookup(index, 'rds', region, 'instance', instance_class, RDS_ENGINES.get(engine, engine), deployment)
+
+def benchmark(entries: int = 200000, lookups: int = 100000, path: str = '/tmp/price-index-bench.idx'):
+    """Time writing, mapping and querying a synthetic index"""
+    import random
+    import time
+
+    prices = {('ec2', 'us-east-1', 'instance', f"type{i}", 'linux'): random.random() for i in range(entries)}
+    started = time.perf_counter()
+    write_index(path, prices, {'sources': []})
+    built = time.perf_counter()
+    index = load_index(path)
+    loaded = time.perf_counter()
+    for i in range(lookups):
+        lookup(index, 'ec2', 'us-east-1', 'instance', f"type{i % entries}", 'linux')
+    finished = time.perf_counter()
+
+    print(f"{entries} entries, {os.path.getsize(path) / 1e6:.1f} MB")
+    print(f"  build: {(built - started) * 1000:.0f} ms")
+    print(f"  load: {(loaded - built) * 1000:.3f} ms")
+    print(f"  lookup: {(finished - loaded) / lookups * 1e6:.2f} us each")
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build an index from Price List offer files')
+    build.add_argument('offers', nargs='+')
+    build.add_argument('-o', '--output', default='prices.idx')
+    query = commands.add_parser('lookup', help='look up one key')
+    query.add_argument('index')
+    query.add_argument('parts', nargs='+')
+    commands.add_parser('benchmark', help='time a synthetic index')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print(json.dumps(build_index(args.offers, args.output), indent=2))
+    elif args.command == 'lookup':
+        print(lookup(load_index(args.index), *args.parts))
+    else:
+        benchmark()
@@ -2,12 +2,19 @@
 Rightsizing Advisor Lambda - Automated EC2 rightsizing recommendations
 """
 import os, json, boto3
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+from ce_reader import iter_items
+import instance_catalog
+import metric_fetch
+import price_index
+import utilization_profile
 
 ec2 = boto3.client('ec2')
 cloudwatch = boto3.client('cloudwatch')
 ce = boto3.client('ce')
 sns = boto3.client('sns')
+s3 = boto3.client('s3')
 
 PROJECT_NAME = os.environ['PROJECT_NAME']
 ENVIRONMENT = os.environ['ENVIRONMENT']
@@ -16,6 +23,30 @@ CPU_LOW = float(os.environ.get('CPU_THRESHOLD_LOW', '20'))
 CPU_HIGH = float(os.environ.get('CPU_THRESHOLD_HIGH', '80'))
 AUTO_APPLY = os.environ.get('AUTO_APPLY_RECOMMENDATIONS', 'false').lower() == 'true'
 DRY_RUN = os.environ.get('DRY_RUN', 'true').lower() == 'true'
+MEMORY_HIGH = float(os.environ.get('MEMORY_THRESHOLD_HIGH', '80'))
+SUSTAINED_PEAK_HOURS = float(os.environ.get('SUSTAINED_PEAK_HOURS', '2'))
+COST_BUCKET = os.environ.get('COST_BUCKET', '')
+PROFILE_DAYS = int(os.environ.get('PROFILE_DAYS', '14'))
+PROFILE_PERIOD = int(os.environ.get('PROFILE_PERIOD', '300'))
+HEADROOM = float(os.environ.get('HEADROOM_PERCENT', '30')) / 100
+CATALOG_TTL_HOURS = int(os.environ.get('CATALOG_TTL_HOURS', '24'))
+PRICE_INDEX_PATH = os.environ.get('PRICE_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prices.idx'))
+
+# Instance sizes from smallest to largest
+INSTANCE_SIZES = [
+    'nano', 'micro', 'small', 'medium', 'large', 'xlarge', '2xlarge', '3xlarge', '4xlarge', '6xlarge',
+    '8xlarge', '9xlarge', '10xlarge', '12xlarge', '16xlarge', '18xlarge', '24xlarge', '32xlarge', '48xlarge'
+]
+
+# Profiled metric -> (namespace, metric name, statistic); memory comes from the CloudWatch agent when present
+PROFILE_METRICS = {
+    'cpu': ('AWS/EC2', 'CPUUtilization', 'Average'),
+    'network_in': ('AWS/EC2', 'NetworkIn', 'Sum'),
+    'network_out': ('AWS/EC2', 'NetworkOut', 'Sum')
+}
+
+# On-demand prices from the bundled Price List index, mapped once per container
+prices = price_index.load_index(PRICE_INDEX_PATH)
 
 def handler(event, context):
     print(f"Starting rightsizing analysis for {PROJECT_NAME}-{ENVIRONMENT}")
@@ -26,11 +57,13 @@ def handler(event, context):
         
         # Analyze current instances
         instances = get_all_instances()
+        profiles = update_profiles(instances)
+        catalog = load_instance_catalog()
         custom_recommendations = []
         
         for instance in instances:
-            avg_cpu = get_avg_cpu_utilization(instance['InstanceId'])
-            recommendation = analyze_instance(instance, avg_cpu)
+            profile = utilization_profile.summarize(profiles[instance['InstanceId']])
+            recommendation = analyze_instance(instance, profile, catalog)
             
             if recommendation:
                 custom_recommendations.append(recommendation)
@@ -61,14 +94,22 @@ def handler(event, context):
 
 def get_aws_recommendations():
     try:
-        response = ce.get_rightsizing_recommendation(
+        recs = iter_items(
+            ce.get_rightsizing_recommendation,
+            'RightsizingRecommendations',
             Service='AmazonEC2',
             Configuration={'RecommendationTarget': 'SAME_INSTANCE_FAMILY'}
         )
-        return {
-            'count': len(response.get('RightsizingRecommendations', [])),
-            'recommendations': response.get('RightsizingRecommendations', [])[:10]
-        }
+        
+        # Count every page but only keep the top 10
+        count = 0
+        recommendations = []
+        for rec in recs:
+            count += 1
+            if len(recommendations) < 10:
+                recommendations.append(rec)
+        
+        return {'count': count, 'recommendations': recommendations}
     except:
         return {'count': 0, 'recommendations': []}
 
@@ -79,52 +120,194 @@ def get_all_instances():
         instances.extend(reservation['Instances'])
     return instances
 
-def get_avg_cpu_utilization(instance_id):
-    try:
-        end_time = datetime.now()
-        start_time = end_time - timedelta(days=14)
+def update_profiles(instances):
+    """
+    Add the datapoints since the previous run to each instance's persisted
+    utilization profile; profiles of instances no longer running are dropped
+    """
+    key = f"rightsizing/profiles/{ec2.meta.region_name}.json.gz"
+    running = [instance['InstanceId'] for instance in instances]
+    stored = utilization_profile.load_profiles(s3, COST_BUCKET, key, running) if COST_BUCKET else {}
+    now = datetime.now(timezone.utc)
+    # CloudWatch can take a few minutes to publish the latest period
+    end_time = now - timedelta(minutes=10)
+    
+    profiles = {}
+    windows = {}  # start time -> instances fetched together
+    for instance in instances:
+        instance_id = instance['InstanceId']
+        profile = stored.get(instance_id) or utilization_profile.new_profile()
+        profiles[instance_id] = profile
         
-        response = cloudwatch.get_metric_statistics(
-            Namespace='AWS/EC2',
-            MetricName='CPUUtilization',
-            Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=86400,
-            Statistics=['Average']
+        start_time = now - timedelta(days=PROFILE_DAYS)
+        if profile['last_timestamp']:
+            start_time = max(start_time, datetime.fromtimestamp(profile['last_timestamp'] + PROFILE_PERIOD, timezone.utc))
+        if start_time < end_time:
+            windows.setdefault(start_time, []).append(instance_id)
+    
+    memory_dimensions = get_memory_dimensions() if windows else {}
+    for start_time, instance_ids in windows.items():
+        try:
+            add_latest_window(profiles, instance_ids, memory_dimensions, start_time, end_time)
+        except Exception as e:
+            print(f"Error profiling {len(instance_ids)} instances: {str(e)}")
+    
+    for profile in profiles.values():
+        utilization_profile.prune(profile, PROFILE_DAYS, now)
+    
+    if COST_BUCKET:
+        utilization_profile.save_profiles(s3, COST_BUCKET, key, profiles)
+    return profiles
+
+def add_latest_window(profiles, instance_ids, memory_dimensions, start_time, end_time):
+    """Fetch every metric of the instances in batched requests, then add them to the profiles"""
+    queries = {}
+    for instance_id in instance_ids:
+        dimensions = [{'Name': 'InstanceId', 'Value': instance_id}]
+        for metric, (namespace, metric_name, stat) in PROFILE_METRICS.items():
+            queries[(instance_id, metric)] = metric_fetch.metric_query(namespace, metric_name, dimensions, stat, PROFILE_PERIOD)
+        if instance_id in memory_dimensions:
+            queries[(instance_id, 'memory')] = metric_fetch.metric_query(
+                'CWAgent', 'mem_used_percent', memory_dimensions[instance_id], 'Average', PROFILE_PERIOD
+            )
+    
+    series = metric_fetch.fetch(cloudwatch, queries, start_time, end_time)
+    for (instance_id, metric), (timestamps, values) in series.items():
+        if metric.startswith('network'):
+            values = [v / PROFILE_PERIOD for v in values]  # Bytes per second
+        utilization_profile.add_points(profiles[instance_id], metric, list(zip(timestamps, values)))
+    
+    for instance_id in instance_ids:
+        cpu = metric_fetch.points(series[(instance_id, 'cpu')])
+        utilization_profile.add_peaks(profiles[instance_id], cpu, CPU_HIGH, PROFILE_PERIOD)
+        if cpu:
+            profiles[instance_id]['last_timestamp'] = cpu[-1][0]
+
+def get_memory_dimensions():
+    """instance id -> dimensions of the CloudWatch agent's memory metric, for instances running the agent"""
+    dimensions = {}
+    for page in cloudwatch.get_paginator('list_metrics').paginate(Namespace='CWAgent', MetricName='mem_used_percent'):
+        for metric in page['Metrics']:
+            instance_id = next((d['Value'] for d in metric['Dimensions'] if d['Name'] == 'InstanceId'), None)
+            if instance_id:
+                dimensions.setdefault(instance_id, metric['Dimensions'])
+    return dimensions
+
+def load_instance_catalog():
+    try:
+        return instance_catalog.load_catalog(ec2, s3, COST_BUCKET, ec2.meta.region_name, CATALOG_TTL_HOURS * 3600)
+    except Exception as e:
+        print(f"Error loading instance catalog: {str(e)}")
+        return None
+
+def analyze_instance(instance, profile, catalog=None):
+    """
+    Recommend from the utilization distribution rather than the mean: upsize
+    on a high p95 or sustained peaks, downsize only when p95 is low, p99 stays
+    below the high threshold and memory is not the constraint. With a catalog
+    the recommendation names the cheapest type that fits.
+    """
+    cpu = profile.get('cpu')
+    # Need at least a day of datapoints before recommending anything
+    if not cpu or cpu['samples'] < 86400 // PROFILE_PERIOD:
+        return None
+    
+    peak = profile['peak']
+    memory = profile.get('memory')
+    details = {
+        'instance_id': instance['InstanceId'],
+        'current_type': instance['InstanceType'],
+        'avg_cpu_utilization': cpu['mean'],
+        'cpu_p50': cpu['p50'],
+        'cpu_p95': cpu['p95'],
+        'cpu_p99': cpu['p99'],
+        'cpu_max': cpu['max'],
+        'peak_hours_above_threshold': peak['hours_above'],
+        'longest_peak_hours': peak['longest_run_hours'],
+        'memory_p95': memory['p95'] if memory else None,
+        'network_in_p95': profile.get('network_in', {}).get('p95'),
+        'network_out_p95': profile.get('network_out', {}).get('p95')
+    }
+    
+    sustained = peak['longest_run_hours'] >= SUSTAINED_PEAK_HOURS
+    if cpu['p95'] > CPU_HIGH or sustained:
+        # Size for the peaks themselves when they last for hours
+        target = recommend_target(instance, catalog, cpu['p99'] if sustained else cpu['p95'], memory)
+        return dict(details, **target,
+            recommendation='UPSIZE',
+            reason=f"CPU p95 {cpu['p95']:.1f}%, longest run above {CPU_HIGH}% {peak['longest_run_hours']:.1f}h",
+            suggested_action=f"Consider upsizing to {target['target_type']}" if 'target_type' in target else 'Consider upsizing to larger instance type'
         )
-        
-        if response['Datapoints']:
-            return sum(d['Average'] for d in response['Datapoints']) / len(response['Datapoints'])
-        return 0
-    except:
-        return 0
-
-def analyze_instance(instance, avg_cpu):
-    instance_id = instance['InstanceId']
-    instance_type = instance['InstanceType']
-    
-    if avg_cpu < CPU_LOW:
-        return {
-            'instance_id': instance_id,
-            'current_type': instance_type,
-            'avg_cpu_utilization': round(avg_cpu, 2),
-            'recommendation': 'DOWNSIZE',
-            'reason': f'CPU utilization ({avg_cpu:.1f}%) below threshold ({CPU_LOW}%)',
-            'suggested_action': 'Consider downsizing to smaller instance type',
-            'estimated_savings': 50  # Placeholder
-        }
-    elif avg_cpu > CPU_HIGH:
-        return {
-            'instance_id': instance_id,
-            'current_type': instance_type,
-            'avg_cpu_utilization': round(avg_cpu, 2),
-            'recommendation': 'UPSIZE',
-            'reason': f'CPU utilization ({avg_cpu:.1f}%) above threshold ({CPU_HIGH}%)',
-            'suggested_action': 'Consider upsizing to larger instance type'
-        }
+    
+    if cpu['p95'] < CPU_LOW and cpu['p99'] < CPU_HIGH and not (memory and memory['p95'] >= MEMORY_HIGH):
+        target = recommend_target(instance, catalog, cpu['p95'], memory)
+        if 'target_type' in target:
+            return dict(details, **target,
+                recommendation='DOWNSIZE',
+                reason=f"CPU p95 {cpu['p95']:.1f}% below threshold ({CPU_LOW}%), p99 {cpu['p99']:.1f}%",
+                suggested_action=f"Consider downsizing to {target['target_type']}",
+                estimated_savings=max(-target.get('monthly_cost_change', 0), 0)
+            )
+        if not target.get('best_fit'):
+            return dict(details,
+                recommendation='DOWNSIZE',
+                reason=f"CPU p95 {cpu['p95']:.1f}% below threshold ({CPU_LOW}%), p99 {cpu['p99']:.1f}%",
+                suggested_action='Consider downsizing to smaller instance type',
+                estimated_savings=estimate_downsize_savings(instance)
+            )
     return None
 
+def recommend_target(instance, catalog, cpu_percent, memory):
+    """
+    Cheapest catalog type fitting the profile with HEADROOM to spare, plus
+    the cheapest Graviton type for Linux x86 instances (needs an arm64 AMI).
+    Flags best_fit when no cheaper type fits; empty when nothing can be priced.
+    """
+    if catalog is None or instance['InstanceType'] not in catalog['types']:
+        return {}
+    
+    region = ec2.meta.region_name
+    platform = instance.get('PlatformDetails', 'Linux/UNIX')
+    memory_percent = memory['p95'] if memory else None
+    current = price_index.ec2_instance_hourly(prices, region, instance['InstanceType'], platform)
+    
+    result = {}
+    target = instance_catalog.select_target(catalog, prices, instance['InstanceType'], cpu_percent, memory_percent, HEADROOM, platform)
+    if target and target['instance_type'] == instance['InstanceType']:
+        result['best_fit'] = True
+    elif target:
+        result['target_type'] = target['instance_type']
+        result['target_monthly_cost'] = round(target['hourly_cost'] * price_index.HOURS_PER_MONTH, 2)
+        if current is not None:
+            result['monthly_cost_change'] = round((target['hourly_cost'] - current) * price_index.HOURS_PER_MONTH, 2)
+    
+    if catalog['types'][instance['InstanceType']][2] == 'x86_64' and platform == 'Linux/UNIX':
+        graviton = instance_catalog.select_target(catalog, prices, instance['InstanceType'], cpu_percent, memory_percent, HEADROOM, platform, 'arm64')
+        if graviton and (target is None or graviton['hourly_cost'] < target['hourly_cost']):
+            result['graviton_alternative'] = {
+                'instance_type': graviton['instance_type'],
+                'monthly_cost': round(graviton['hourly_cost'] * price_index.HOURS_PER_MONTH, 2)
+            }
+    return result
+
+def estimate_downsize_savings(instance):
+    """
+    Monthly on-demand saving from moving to the next smaller size in the
+    same family that the price index lists
+    """
+    region = ec2.meta.region_name
+    platform = instance.get('PlatformDetails', 'Linux/UNIX')
+    family, _, size = instance['InstanceType'].partition('.')
+    current = price_index.ec2_instance_hourly(prices, region, instance['InstanceType'], platform)
+    
+    if current is not None and size in INSTANCE_SIZES:
+        for smaller in reversed(INSTANCE_SIZES[:INSTANCE_SIZES.index(size)]):
+            target = price_index.ec2_instance_hourly(prices, region, f"{family}.{smaller}", platform)
+            if target is not None:
+                return round((current - target) * price_index.HOURS_PER_MONTH, 2)
+    
+    return 50  # Placeholder when the price index has no entry
+
 def send_notification(report):
     message = f"""Rightsizing Analysis - {datetime.now().strftime('%Y-%m-%d')}
 Project: {PROJECT_NAME}-{ENVIRONMENT}
@@ -136,7 +319,8 @@ Potential Monthly Savings: ${report['summary']['potential_monthly_savings']:.2f}
 Top Recommendations:
 """
     for rec in report['custom_recommendations'][:5]:
-        message += f"\n- {rec['instance_id']} ({rec['current_type']}): {rec['recommendation']} - {rec['reason']}"
+        target = f" -> {rec['target_type']}" if rec.get('target_type') else ''
+        message += f"\n- {rec['instance_id']} ({rec['current_type']}{target}): {rec['recommendation']} - {rec['reason']}"
     
     sns.publish(TopicArn=SNS_TOPIC_ARN, Subject=f"Rightsizing Report: {PROJECT_NAME}-{ENVIRONMENT}", Message=message)
 
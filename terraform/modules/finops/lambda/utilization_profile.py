@@ -0,0 +1,313 @@
+"""
+Utilization Profiles - Mergeable quantile sketches of instance utilization
+Each metric of each instance keeps one DDSketch per week (starting Monday,
+UTC), so a run only adds the datapoints since the previous run and the
+profile covers a sliding window of whole weeks by merging them. DDSketch
+quantiles are within `alpha` relative error and sketches merge by adding
+bins. CPU and memory use 1%; network throughput spans orders of magnitude
+and gets about one bin per 5-minute sample at 1%, so it uses 5%.
+
+Bins are kept as two sorted arrays (keys and counts) rather than a dict,
+and weeks rather than days bound the sketches per metric, which keeps a
+profile to a few KB however noisy the metric is.
+
+Alongside the sketches, CPU keeps per-day peak statistics (hours at or above
+the peak threshold and the longest consecutive run), carrying an open run
+across runs, which quantiles alone cannot describe.
+
+Profile state, one gzip NDJSON object per region, read and written one
+instance at a time:
+    {"version": 2}
+    {"instance_id": ..., "last_timestamp": epoch seconds,
+     "metrics": {metric: {week start day: sketch}},
+     "peak": {"run": minutes, "last_timestamp": ..., "days": {day: {"minutes_above": n, "longest_run": n}}}}
+Version 1 (one JSON document of daily sketches) is merged into weeks on load.
+"""
+
+import gzip
+import io
+import json
+import math
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+VERSION = 2
+DEFAULT_ALPHA = 0.01
+METRIC_ALPHA = {'network_in': 0.05, 'network_out': 0.05}
+MIN_POSITIVE = 1e-9
+MAX_BINS = 2048
+
+def new_sketch(alpha: float = DEFAULT_ALPHA) -> Dict[str, Any]:
+    return {'alpha': alpha, 'keys': array('i'), 'counts': array('I'), 'zero': 0, 'count': 0, 'sum': 0.0, 'min': None, 'max': None}
+
+def _gamma(alpha: float) -> float:
+    return (1 + alpha) / (1 - alpha)
+
+def _key(value: float, alpha: float) -> int:
+    return math.ceil(math.log(value) / math.log(_gamma(alpha)))
+
+def _add_bins(sketch: Dict[str, Any], bins: Dict[int, int]):
+    """Add {key: count} into the sketch's sorted bin arrays"""
+    if not bins:
+        return
+    combined = dict(zip(sketch['keys'], sketch['counts']))
+    for key, count in bins.items():
+        combined[key] = combined.get(key, 0) + count
+
+    keys = sorted(combined)
+    if len(keys) > MAX_BINS:
+        # Fold the lowest bins together to bound memory; upper quantiles stay exact to alpha
+        excess = len(keys) - MAX_BINS
+        combined[keys[excess]] += sum(combined[k] for k in keys[:excess])
+        keys = keys[excess:]
+    sketch['keys'] = array('i', keys)
+    sketch['counts'] = array('I', [combined[k] for k in keys])
+
+def add_values(sketch: Dict[str, Any], values: Iterable[float]):
+    """Add non-negative values to the sketch"""
+    alpha, bins = sketch['alpha'], {}
+    for value in values:
+        value = max(value, 0.0)
+        if value < MIN_POSITIVE:
+            sketch['zero'] += 1
+        else:
+            key = _key(value, alpha)
+            bins[key] = bins.get(key, 0) + 1
+
+        sketch['count'] += 1
+        sketch['sum'] += value
+        sketch['min'] = value if sketch['min'] is None else min(sketch['min'], value)
+        sketch['max'] = value if sketch['max'] is None else max(sketch['max'], value)
+    _add_bins(sketch, bins)
+
+def rebin(sketch: Dict[str, Any], alpha: float) -> Dict[str, Any]:
+    """The sketch at another accuracy, re-adding each bin at its representative value"""
+    if sketch['alpha'] == alpha:
+        return sketch
+    gamma, bins = _gamma(sketch['alpha']), {}
+    for key, count in zip(sketch['keys'], sketch['counts']):
+        new_key = _key(2 * gamma ** key / (gamma + 1), alpha)
+        bins[new_key] = bins.get(new_key, 0) + count
+
+    result = dict(new_sketch(alpha), zero=sketch['zero'], count=sketch['count'], sum=sketch['sum'], min=sketch['min'], max=sketch['max'])
+    _add_bins(result, bins)
+    return result
+
+def merge(target: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """Add other's counts into target (both must share alpha)"""
+    if other['alpha'] != target['alpha']:
+        raise ValueError('Cannot merge sketches with different accuracy')
+
+    _add_bins(target, dict(zip(other['keys'], other['counts'])))
+    target['zero'] += other['zero']
+    target['count'] += other['count']
+    target['sum'] += other['sum']
+    for bound, pick in (('min', min), ('max', max)):
+        if other[bound] is not None:
+            target[bound] = other[bound] if target[bound] is None else pick(target[bound], other[bound])
+    return target
+
+def quantile(sketch: Dict[str, Any], q: float) -> Optional[float]:
+    if not sketch['count']:
+        return None
+
+    rank = q * (sketch['count'] - 1)
+    seen = sketch['zero']
+    if rank < seen:
+        return 0.0
+
+    gamma = _gamma(sketch['alpha'])
+    for key, count in zip(sketch['keys'], sketch['counts']):
+        seen += count
+        if seen > rank:
+            value = 2 * gamma ** key / (gamma + 1)
+            return min(max(value, sketch['min']), sketch['max'])
+    return sketch['max']
+
+def sketch_to_json(sketch: Dict[str, Any]) -> Dict[str, Any]:
+    data = {k: v for k, v in sketch.items() if k not in ('keys', 'counts')}
+    data['bins'] = {'k': sketch['keys'].tolist(), 'n': sketch['counts'].tolist()}
+    return data
+
+def sketch_from_json(data: Dict[str, Any]) -> Dict[str, Any]:
+    bins = data.pop('bins')
+    return dict(data, keys=array('i', bins['k']), counts=array('I', bins['n']))
+
+def new_profile() -> Dict[str, Any]:
+    return {'last_timestamp': None, 'metrics': {}, 'peak': {'run': 0, 'last_timestamp': None, 'days': {}}}
+
+def add_points(profile: Dict[str, Any], metric: str, points: Sequence[Tuple[float, float]], alpha: float = None):
+    """Add (epoch seconds, value) datapoints to the metric's weekly sketches"""
+    alpha = alpha or METRIC_ALPHA.get(metric, DEFAULT_ALPHA)
+    weeks = profile['metrics'].setdefault(metric, {})
+    by_week = {}
+    for timestamp, value in points:
+        by_week.setdefault(_week(timestamp), []).append(value)
+
+    for week, values in by_week.items():
+        sketch = weeks.get(week)
+        weeks[week] = sketch = new_sketch(alpha) if sketch is None else rebin(sketch, alpha)
+        add_values(sketch, values)
+
+def add_peaks(profile: Dict[str, Any], points: Sequence[Tuple[float, float]], threshold: float, period_seconds: int):
+    """
+    Track minutes at or above `threshold` and the longest consecutive run per
+    day. A gap in the datapoints ends the current run.
+    """
+    peak = profile['peak']
+    minutes = period_seconds / 60
+
+    for timestamp, value in sorted(points):
+        if peak['last_timestamp'] is not None and timestamp - peak['last_timestamp'] > period_seconds * 1.5:
+            peak['run'] = 0
+        peak['last_timestamp'] = timestamp
+
+        stats = peak['days'].setdefault(_day(timestamp), {'minutes_above': 0, 'longest_run': 0})
+        if value >= threshold:
+            peak['run'] += minutes
+            stats['minutes_above'] += minutes
+            stats['longest_run'] = max(stats['longest_run'], peak['run'])
+        else:
+            peak['run'] = 0
+
+def prune(profile: Dict[str, Any], keep_days: int, now: datetime = None):
+    """Drop weekly sketches that ended, and peak stats from, more than keep_days ago"""
+    cutoff = ((now or datetime.now(timezone.utc)) - timedelta(days=keep_days)).timestamp()
+    # A week is kept while its last day is inside the window
+    week_cutoff, day_cutoff = _day(cutoff - 6 * 86400), _day(cutoff)
+    for weeks in profile['metrics'].values():
+        for week in [w for w in weeks if w < week_cutoff]:
+            del weeks[week]
+    days = profile['peak']['days']
+    for day in [d for d in days if d < day_cutoff]:
+        del days[day]
+
+def summarize(profile: Dict[str, Any], quantiles: Sequence[float] = (0.5, 0.95, 0.99)) -> Dict[str, Any]:
+    """Merge each metric's weekly sketches into quantiles, mean and max, plus peak statistics"""
+    summary = {}
+    for metric, weeks in profile['metrics'].items():
+        if not weeks:
+            continue
+        alpha = METRIC_ALPHA.get(metric, DEFAULT_ALPHA)
+        merged = new_sketch(alpha)
+        for sketch in weeks.values():
+            merge(merged, rebin(sketch, alpha))
+
+        stats = {f"p{int(q * 100)}": _round(quantile(merged, q)) for q in quantiles}
+        stats.update({
+            'mean': _round(merged['sum'] / merged['count']) if merged['count'] else None,
+            'max': _round(merged['max']),
+            'samples': merged['count']
+        })
+        summary[metric] = stats
+
+    peak_days = profile['peak']['days'].values()
+    summary['peak'] = {
+        'hours_above': round(sum(d['minutes_above'] for d in peak_days) / 60, 2),
+        'longest_run_hours': round(max((d['longest_run'] for d in peak_days), default=0) / 60, 2),
+        'days_with_peaks': sum(1 for d in peak_days if d['minutes_above'])
+    }
+    return summary
+
+def _profile_from_json(data: Dict[str, Any]) -> Dict[str, Any]:
+    data['metrics'] = {
+        metric: {week: sketch_from_json(sketch) for week, sketch in weeks.items()}
+        for metric, weeks in data['metrics'].items()
+    }
+    return data
+
+def _migrate_v1(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge a version 1 profile's daily sketches into weekly ones"""
+    metrics = {}
+    for metric, days in profile['metrics'].items():
+        alpha = METRIC_ALPHA.get(metric, DEFAULT_ALPHA)
+        weeks = metrics[metric] = {}
+        for day, sketch in days.items():
+            week = _week(datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+            bins = sorted((int(k), n) for k, n in sketch.pop('bins').items())
+            sketch = dict(sketch, keys=array('i', [k for k, _ in bins]), counts=array('I', [n for _, n in bins]))
+            merge(weeks.setdefault(week, new_sketch(alpha)), rebin(sketch, alpha))
+    profile['metrics'] = metrics
+    return profile
+
+def load_profiles(s3, bucket: str, key: str, instance_ids: Iterable[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Profiles of instance_ids (all when None), parsed one instance at a time"""
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    except s3.exceptions.NoSuchKey:
+        return {}
+
+    wanted = set(instance_ids) if instance_ids is not None else None
+    profiles = {}
+    with gzip.GzipFile(fileobj=body) as lines:
+        header = json.loads(next(lines, b'{}'))
+        if header.get('version') == 1:
+            for instance_id, profile in header['instances'].items():
+                if wanted is None or instance_id in wanted:
+                    profiles[instance_id] = _migrate_v1(profile)
+            return profiles
+        if header.get('version') != VERSION:
+            return {}
+
+        for line in lines:
+            # Skip the parse for instances no longer running
+            data = json.loads(line)
+            instance_id = data.pop('instance_id')
+            if wanted is None or instance_id in wanted:
+                profiles[instance_id] = _profile_from_json(data)
+    return profiles
+
+def save_profiles(s3, bucket: str, key: str, profiles: Dict[str, Dict[str, Any]]):
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as out:
+        out.write(json.dumps({'version': VERSION}).encode() + b'\n')
+        for instance_id, profile in profiles.items():
+            data = dict(profile, instance_id=instance_id, metrics={
+                metric: {week: sketch_to_json(sketch) for week, sketch in weeks.items()}
+                for metric, weeks in profile['metrics'].items()
+            })
+            out.write(json.dumps(data, separators=(',', ':')).encode() + b'\n')
+
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=buffer.getvalue(),
+        ContentType='application/x-ndjson',
+        ContentEncoding='gzip'
+    )
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+def _week(timestamp: float) -> str:
+    """Monday (UTC) starting the timestamp's week"""
+    day = datetime.fromtimestamp(timestamp, timezone.utc).date()
+    return str(day - timedelta(days=day.weekday()))
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+def benchmark(n: int = 100000, seed: int = 7):
+    """Compare sketch quantiles with exact quantiles on a skewed CPU-like series"""
+    import random
+    import time
+
+    rng = random.Random(seed)
+    values = [min(100.0, rng.lognormvariate(2.5, 0.8)) for _ in range(n)]
+
+    started = time.perf_counter()
+    halves = [new_sketch(), new_sketch()]
+    for i in range(0, n, 288):
+        add_values(halves[i // 288 % 2], values[i:i + 288])
+    sketch = merge(halves[0], halves[1])
+    elapsed = time.perf_counter() - started
+
+    exact = sorted(values)
+    print(f"{n} values into {len(sketch['keys'])} bins in {elapsed * 1000:.0f} ms")
+    for q in (0.5, 0.95, 0.99):
+        true = exact[int(q * (n - 1))]
+        print(f"  p{int(q * 100)}: sketch {quantile(sketch, q):.3f} exact {true:.3f}")
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,78 @@
+"""
+Waste Checkpoint - Incremental waste classification
+Keeps each resource's last classification with a fingerprint of the fields
+it depends on (state, attachment, create time, size, ...) and the time it
+must be re-checked (age threshold crossing, or metric re-check interval).
+Unchanged resources reuse their stored classification instead of being
+evaluated again.
+
+Stored per region as gzip JSON:
+    waste-checkpoint/<region>.json.gz
+    {"version": 1, "categories": {category: {resource_id: [fingerprint, result, recheck_at]}}}
+
+`result` is falsy for resources that are not waste, otherwise a JSON value
+describing why they are; `recheck_at` is epoch seconds or null.
+"""
+
+import gzip
+import hashlib
+import json
+from typing import Any, Callable, Dict, Tuple
+
+VERSION = 1
+
+def fingerprint(*fields) -> str:
+    return hashlib.blake2b(json.dumps(fields, default=str).encode(), digest_size=8).hexdigest()
+
+def new_state(previous: Dict[str, list] = None) -> Dict[str, Any]:
+    """Per-category classification state for one run"""
+    return {'previous': previous or {}, 'current': {}, 'evaluated': 0, 'skipped': 0}
+
+def lookup(state: Dict[str, Any], resource_id: str, fp: str, now: float) -> Tuple[bool, Any]:
+    """(True, result) when the stored classification is still valid, else (False, None)"""
+    entry = state['previous'].get(resource_id)
+    if entry and entry[0] == fp and (entry[2] is None or now < entry[2]):
+        state['skipped'] += 1
+        state['current'][resource_id] = entry
+        return True, entry[1]
+    return False, None
+
+def store(state: Dict[str, Any], resource_id: str, fp: str, result: Any, recheck_at: float = None):
+    state['evaluated'] += 1
+    state['current'][resource_id] = [fp, result, recheck_at]
+
+def classify(state: Dict[str, Any], resource_id: str, fp: str, now: float,
+             evaluate: Callable[[], Tuple[Any, float]]) -> Any:
+    """Stored result for an unchanged resource, otherwise evaluate() and store it"""
+    hit, result = lookup(state, resource_id, fp, now)
+    if hit:
+        return result
+
+    result, recheck_at = evaluate()
+    store(state, resource_id, fp, result, recheck_at)
+    return result
+
+def load_checkpoint(s3, bucket: str, key: str) -> Dict[str, Dict[str, list]]:
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except s3.exceptions.NoSuchKey:
+        return {}
+
+    checkpoint = json.loads(gzip.decompress(body))
+    if checkpoint.get('version') != VERSION:
+        return {}
+    return checkpoint['categories']
+
+def save_checkpoint(s3, bucket: str, key: str, states: Dict[str, Dict[str, Any]]):
+    """Persist the classifications seen this run; resources no longer listed are dropped"""
+    checkpoint = {
+        'version': VERSION,
+        'categories': {category: state['current'] for category, state in states.items()}
+    }
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=gzip.compress(json.dumps(checkpoint, separators=(',', ':')).encode()),
+        ContentType='application/json',
+        ContentEncoding='gzip'
+    )
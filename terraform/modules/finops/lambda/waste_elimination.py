@@ -1,14 +1,19 @@
 """
 Waste Elimination Lambda - Detect and clean up unused AWS resources
 """
-import os, json, boto3
+import os, json, time, boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+import cleanup_executor
+import metric_fetch
+import price_index
+import waste_checkpoint
+from fanout import deadline_from_context
+
 ec2 = boto3.client('ec2')
-elb = boto3.client('elbv2')
-rds = boto3.client('rds')
 s3 = boto3.client('s3')
-cloudwatch = boto3.client('cloudwatch')
 sns = boto3.client('sns')
 
 PROJECT_NAME = os.environ['PROJECT_NAME']
@@ -17,38 +22,72 @@ SNS_TOPIC_ARN = os.environ['SNS_TOPIC_ARN']
 AUTO_DELETE = os.environ.get('AUTO_DELETE_RESOURCES', 'false').lower() == 'true'
 DRY_RUN = os.environ.get('DRY_RUN', 'true').lower() == 'true'
 UNUSED_DAYS = int(os.environ.get('UNUSED_DAYS_THRESHOLD', '30'))
+MAX_REPORTED_RESOURCES = int(os.environ.get('MAX_REPORTED_RESOURCES', '100'))
+HEALTH_CHECK_WORKERS = int(os.environ.get('HEALTH_CHECK_WORKERS', '8'))
+SCAN_REGIONS = os.environ.get('WASTE_SCAN_REGIONS', '')
+REGION_WORKERS = int(os.environ.get('REGION_WORKERS', '9'))
+COST_BUCKET = os.environ.get('COST_BUCKET')
+CLEANUP_WORKERS = int(os.environ.get('CLEANUP_WORKERS', '8'))
+CLEANUP_REQUESTS_PER_SECOND = float(os.environ.get('CLEANUP_REQUESTS_PER_SECOND', '5'))
+DEADLINE_RESERVE_MS = int(os.environ.get('DEADLINE_RESERVE_MS', '30000'))
+CHECKPOINT_RECHECK_DAYS = float(os.environ.get('CHECKPOINT_RECHECK_DAYS', '7'))
+PRICE_INDEX_PATH = os.environ.get('PRICE_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prices.idx'))
+DESCRIBE_PAGE_SIZE = 1000
+
+LOAD_BALANCER_TYPES = {
+    'application': 'Application Load Balancer',
+    'network': 'Network Load Balancer',
+    'gateway': 'Gateway Load Balancer'
+}
+# Fallback estimates used when the price index has no entry.
+# Hourly charge only: ~$0.025/hour for ALB and NLB, ~$0.0125/hour for GWLB
+LOAD_BALANCER_MONTHLY_COST = {
+    'application': 22.50,
+    'network': 22.50,
+    'gateway': 9.13
+}
+
+# On-demand prices from the bundled Price List index, mapped once per container
+prices = price_index.load_index(PRICE_INDEX_PATH)
 
 def handler(event, context):
     print(f"Starting waste detection for {PROJECT_NAME}-{ENVIRONMENT}")
     
     try:
-        waste_resources = {
-            'unattached_volumes': find_unattached_volumes(),
-            'unused_elastic_ips': find_unused_elastic_ips(),
-            'old_snapshots': find_old_snapshots(),
-            'unused_load_balancers': find_unused_load_balancers(),
-            'idle_rds_instances': find_idle_rds_instances()
-        }
+        # Delete resources as they are found if auto-delete enabled and not in dry-run mode
+        cleanup = AUTO_DELETE and not DRY_RUN
+        deadline = deadline_from_context(context, reserve_ms=DEADLINE_RESERVE_MS)
         
-        total_waste = sum(len(v) for v in waste_resources.values())
+        # Scan every region concurrently, each with its own clients
+        regions = get_scan_regions()
+        with ThreadPoolExecutor(max_workers=max(min(REGION_WORKERS, len(regions)), 1)) as pool:
+            region_results = list(pool.map(lambda region: scan_region(region, cleanup, deadline), regions))
+        
+        waste_resources = merge_region_results(region_results)
+        total_waste = sum(w['count'] for w in waste_resources.values())
         estimated_savings = calculate_savings(waste_resources)
         
         report = {
             'scan_date': str(datetime.now()),
             'project': f"{PROJECT_NAME}-{ENVIRONMENT}",
             'waste_resources': waste_resources,
+            'regions': {
+                r['region']: {k: v for k, v in r.items() if k not in ('region', 'waste_resources')}
+                for r in region_results
+            },
             'summary': {
                 'total_waste_resources': total_waste,
                 'estimated_monthly_savings': estimated_savings,
+                'regions_scanned': len(regions),
+                'resources_evaluated': sum(r['resources_evaluated'] for r in region_results),
+                'resources_skipped': sum(r['resources_skipped'] for r in region_results),
                 'dry_run_mode': DRY_RUN,
                 'auto_delete_enabled': AUTO_DELETE
             }
         }
         
-        # Delete resources if auto-delete enabled and not in dry-run mode
-        if AUTO_DELETE and not DRY_RUN:
-            cleanup_results = cleanup_waste(waste_resources)
-            report['cleanup_results'] = cleanup_results
+        if cleanup:
+            report['cleanup_results'] = merge_cleanup_results([r['cleanup_results'] for r in region_results])
         
         # Send notification if waste detected
         if total_waste > 0:
@@ -61,143 +100,368 @@ def handler(event, context):
         send_error_notification(str(e))
         raise
 
-def find_unattached_volumes():
-    volumes = ec2.describe_volumes(Filters=[{'Name': 'status', 'Values': ['available']}])['Volumes']
-    waste = []
-    for vol in volumes:
-        age_days = (datetime.now(vol['CreateTime'].tzinfo) - vol['CreateTime']).days
-        if age_days > UNUSED_DAYS:
-            waste.append({
-                'resource_id': vol['VolumeId'],
-                'type': 'EBS Volume',
-                'size_gb': vol['Size'],
-                'age_days': age_days,
-                'estimated_monthly_cost': vol['Size'] * 0.10  # $0.10 per GB-month
-            })
-    return waste
-
-def find_unused_elastic_ips():
-    addresses = ec2.describe_addresses()['Addresses']
-    waste = []
-    for addr in addresses:
-        if 'InstanceId' not in addr:
-            waste.append({
+def get_scan_regions():
+    """
+    Regions to sweep: WASTE_SCAN_REGIONS as a comma-separated list, 'all' for
+    every region enabled for the account, or empty for the Lambda's own region
+    """
+    if SCAN_REGIONS == 'all':
+        return sorted(r['RegionName'] for r in ec2.describe_regions()['Regions'])
+    if SCAN_REGIONS:
+        return [r.strip() for r in SCAN_REGIONS.split(',') if r.strip()]
+    return [ec2.meta.region_name]
+
+def region_clients(region):
+    """Clients scoped to one region, from a session private to the calling worker"""
+    session = boto3.session.Session(region_name=region)
+    return {
+        'ec2': session.client('ec2'),
+        'elb': session.client('elbv2', config=Config(retries={'mode': 'adaptive', 'max_attempts': 10})),
+        'rds': session.client('rds'),
+        'cloudwatch': session.client('cloudwatch')
+    }
+
+def scan_region(region, cleanup=False, deadline=None):
+    """Run every finder in one region; a failing finder is recorded, not raised"""
+    started = time.monotonic()
+    clients = region_clients(region)
+    submit, finish = start_region_cleanup(region, clients, deadline) if cleanup else (None, None)
+    waste_resources, errors = {}, {}
+    
+    # Classifications from the previous run, reused for unchanged resources
+    checkpoint_key = f"waste-checkpoint/{region}.json.gz"
+    previous = waste_checkpoint.load_checkpoint(s3, COST_BUCKET, checkpoint_key) if COST_BUCKET else {}
+    states = {category: waste_checkpoint.new_state(previous.get(category)) for category in FINDERS}
+    
+    for category, finder in FINDERS.items():
+        try:
+            waste_resources[category] = collect_waste(category, finder(clients, states[category]), submit)
+        except Exception as e:
+            print(f"Error scanning {category} in {region}: {str(e)}")
+            errors[category] = str(e)
+            waste_resources[category] = collect_waste(category, [])
+            # Keep the previous classifications of resources the scan did not reach
+            states[category]['current'] = {**states[category]['previous'], **states[category]['current']}
+    
+    if COST_BUCKET:
+        waste_checkpoint.save_checkpoint(s3, COST_BUCKET, checkpoint_key, states)
+    
+    result = {
+        'region': region,
+        'waste_resources': waste_resources,
+        'total_waste_resources': sum(w['count'] for w in waste_resources.values()),
+        'estimated_monthly_savings': calculate_savings(waste_resources),
+        'resources_evaluated': sum(state['evaluated'] for state in states.values()),
+        'resources_skipped': sum(state['skipped'] for state in states.values()),
+        'errors': errors
+    }
+    if cleanup:
+        result['cleanup_results'] = finish()
+    result['scan_seconds'] = round(time.monotonic() - started, 2)
+    return result
+
+def start_region_cleanup(region, clients, deadline):
+    """Start a cleanup executor for one region, resuming from its progress log in COST_BUCKET"""
+    ec2_client = clients['ec2']
+    actions = {
+        category: (api, lambda record, action=action: action(ec2_client, record))
+        for category, (api, action) in CLEANUP_ACTIONS.items()
+    }
+    
+    save = None
+    progress = {}
+    if COST_BUCKET:
+        key = f"waste-cleanup/progress/{region}.json"
+        progress = cleanup_executor.load_progress(s3, COST_BUCKET, key)
+        save = lambda log: cleanup_executor.save_progress(s3, COST_BUCKET, key, log)
+    
+    return cleanup_executor.start_cleanup(
+        actions,
+        progress,
+        save=save,
+        max_workers=CLEANUP_WORKERS,
+        rate=CLEANUP_REQUESTS_PER_SECOND,
+        deadline=deadline
+    )
+
+def merge_cleanup_results(results):
+    merged = {'deleted': 0, 'already_deleted': 0, 'skipped': 0, 'pending': 0, 'throttled': 0, 'failed': []}
+    for result in results:
+        for key in merged:
+            merged[key] += result[key]
+    return merged
+
+def merge_region_results(region_results):
+    """Combine per-region category summaries, tagging reported resources with their region"""
+    merged = {}
+    for category in FINDERS:
+        summary = {'count': 0, 'estimated_monthly_cost': 0.0, 'resources': [], 'truncated': False}
+        for result in region_results:
+            part = result['waste_resources'][category]
+            summary['count'] += part['count']
+            summary['estimated_monthly_cost'] += part['estimated_monthly_cost']
+            summary['truncated'] |= part['truncated']
+            summary['resources'].extend(dict(r, region=result['region']) for r in part['resources'])
+        
+        if len(summary['resources']) > MAX_REPORTED_RESOURCES:
+            summary['resources'] = summary['resources'][:MAX_REPORTED_RESOURCES]
+            summary['truncated'] = True
+        summary['estimated_monthly_cost'] = round(summary['estimated_monthly_cost'], 2)
+        merged[category] = summary
+    return merged
+
+def collect_waste(category, records, submit_cleanup=None):
+    """
+    Fold a stream of waste records into a count and cost total, keeping only
+    the first MAX_REPORTED_RESOURCES records for the report. When
+    submit_cleanup is given each record is queued for deletion as it streams past.
+    """
+    summary = {'count': 0, 'estimated_monthly_cost': 0.0, 'resources': [], 'truncated': False}
+    
+    for record in records:
+        summary['count'] += 1
+        summary['estimated_monthly_cost'] += record.get('estimated_monthly_cost', 0)
+        if len(summary['resources']) < MAX_REPORTED_RESOURCES:
+            summary['resources'].append(record)
+        else:
+            summary['truncated'] = True
+        
+        if submit_cleanup and category in CLEANUP_ACTIONS:
+            submit_cleanup(category, record)
+    
+    summary['estimated_monthly_cost'] = round(summary['estimated_monthly_cost'], 2)
+    return summary
+
+def find_unattached_volumes(clients, state):
+    """Yield available (unattached) EBS volumes older than UNUSED_DAYS"""
+    now = time.time()
+    region = clients['ec2'].meta.region_name
+    pages = clients['ec2'].get_paginator('describe_volumes').paginate(
+        Filters=[{'Name': 'status', 'Values': ['available']}],
+        PaginationConfig={'PageSize': DESCRIBE_PAGE_SIZE}
+    )
+    for page in pages:
+        for vol in page['Volumes']:
+            created = vol['CreateTime'].timestamp()
+            eligible_at = created + (UNUSED_DAYS + 1) * 86400
+            fp = waste_checkpoint.fingerprint(vol['State'], len(vol.get('Attachments', [])), vol['Size'], created, UNUSED_DAYS)
+            
+            # Not waste until the volume passes the age threshold
+            if waste_checkpoint.classify(
+                state, vol['VolumeId'], fp, now,
+                lambda: (True, None) if now >= eligible_at else (False, eligible_at)
+            ):
+                per_gb = price_index.lookup(prices, 'ebs', region, 'volume', vol['VolumeType'])
+                yield {
+                    'resource_id': vol['VolumeId'],
+                    'type': 'EBS Volume',
+                    'volume_type': vol['VolumeType'],
+                    'size_gb': vol['Size'],
+                    'age_days': int((now - created) // 86400),
+                    'estimated_monthly_cost': priced(per_gb, vol['Size'], vol['Size'] * 0.10)  # ~$0.10 per GB-month
+                }
+
+def find_unused_elastic_ips(clients, state):
+    """Yield Elastic IPs not associated with an instance (describe_addresses is not paginated)"""
+    now = time.time()
+    hourly = price_index.lookup(prices, 'ec2', clients['ec2'].meta.region_name, 'eip', 'idle')
+    for addr in clients['ec2'].describe_addresses()['Addresses']:
+        fp = waste_checkpoint.fingerprint(addr.get('InstanceId'), addr.get('AssociationId'), addr.get('NetworkInterfaceId'))
+        
+        if waste_checkpoint.classify(state, addr['AllocationId'], fp, now, lambda: ('InstanceId' not in addr, None)):
+            yield {
                 'resource_id': addr['AllocationId'],
                 'type': 'Elastic IP',
                 'public_ip': addr['PublicIp'],
-                'estimated_monthly_cost': 3.60  # $0.005 per hour = ~$3.60/month
-            })
-    return waste
-
-def find_old_snapshots():
-    cutoff_date = datetime.now(datetime.now().astimezone().tzinfo) - timedelta(days=365)
-    snapshots = ec2.describe_snapshots(OwnerIds=['self'])['Snapshots']
-    waste = []
-    for snap in snapshots:
-        if snap['StartTime'] < cutoff_date:
-            waste.append({
-                'resource_id': snap['SnapshotId'],
-                'type': 'EBS Snapshot',
-                'age_days': (datetime.now(snap['StartTime'].tzinfo) - snap['StartTime']).days,
-                'size_gb': snap['VolumeSize'],
-                'estimated_monthly_cost': snap['VolumeSize'] * 0.05
-            })
-    return waste
-
-def find_unused_load_balancers():
-    lbs = elb.describe_load_balancers()['LoadBalancers']
-    waste = []
+                'estimated_monthly_cost': priced(hourly, price_index.HOURS_PER_MONTH, 3.60)  # ~$0.005 per hour
+            }
+
+def find_old_snapshots(clients, state):
+    """Yield completed snapshots owned by this account that are over a year old"""
+    now = time.time()
+    per_gb = price_index.lookup(prices, 'ebs', clients['ec2'].meta.region_name, 'snapshot', 'standard')
+    pages = clients['ec2'].get_paginator('describe_snapshots').paginate(
+        OwnerIds=['self'],
+        Filters=[{'Name': 'status', 'Values': ['completed']}],
+        PaginationConfig={'PageSize': DESCRIBE_PAGE_SIZE}
+    )
+    for page in pages:
+        for snap in page['Snapshots']:
+            started = snap['StartTime'].timestamp()
+            eligible_at = started + 365 * 86400
+            fp = waste_checkpoint.fingerprint(snap['State'], snap['VolumeSize'], started)
+            
+            if waste_checkpoint.classify(
+                state, snap['SnapshotId'], fp, now,
+                lambda: (True, None) if now >= eligible_at else (False, eligible_at)
+            ):
+                yield {
+                    'resource_id': snap['SnapshotId'],
+                    'type': 'EBS Snapshot',
+                    'age_days': int((now - started) // 86400),
+                    'size_gb': snap['VolumeSize'],
+                    'estimated_monthly_cost': priced(per_gb, snap['VolumeSize'], snap['VolumeSize'] * 0.05)
+                }
+
+def find_unused_load_balancers(clients, state):
+    """
+    Yield application, network and gateway load balancers with no listeners,
+    no target groups, or no registered targets in any target group.
+    Unchanged load balancers are re-checked every CHECKPOINT_RECHECK_DAYS.
+    """
+    now = time.time()
+    elb = clients['elb']
+    lbs = [lb for page in elb.get_paginator('describe_load_balancers').paginate() for lb in page['LoadBalancers']]
+    if not lbs:
+        return
+    
+    # One sweep over every target group, indexed by the load balancers using it
+    target_groups = {}
+    for page in elb.get_paginator('describe_target_groups').paginate(PaginationConfig={'PageSize': 400}):
+        for tg in page['TargetGroups']:
+            for lb_arn in tg['LoadBalancerArns']:
+                target_groups.setdefault(lb_arn, []).append(tg['TargetGroupArn'])
+    
+    reasons, pending = {}, []
     for lb in lbs:
-        target_groups = elb.describe_target_groups(LoadBalancerArn=lb['LoadBalancerArn'])['TargetGroups']
+        lb_arn = lb['LoadBalancerArn']
+        fp = waste_checkpoint.fingerprint(lb['State']['Code'], lb['Type'], sorted(target_groups.get(lb_arn, [])))
+        hit, reason = waste_checkpoint.lookup(state, lb_arn, fp, now)
+        if hit:
+            reasons[lb_arn] = reason
+        else:
+            pending.append((lb, fp))
+    
+    # Check target health concurrently for the load balancers being evaluated;
+    # the client's adaptive retry mode rate-limits requests when ELB starts throttling
+    tg_arns = sorted({arn for lb, _ in pending for arn in target_groups.get(lb['LoadBalancerArn'], [])})
+    with ThreadPoolExecutor(max_workers=HEALTH_CHECK_WORKERS) as pool:
+        has_targets = dict(zip(tg_arns, pool.map(lambda arn: target_group_has_targets(elb, arn), tg_arns)))
+    
+    for lb, fp in pending:
+        lb_arn = lb['LoadBalancerArn']
+        lb_target_groups = target_groups.get(lb_arn, [])
         
-        has_targets = False
-        for tg in target_groups:
-            targets = elb.describe_target_health(TargetGroupArn=tg['TargetGroupArn'])['TargetHealthDescriptions']
-            if targets:
-                has_targets = True
-                break
+        if any(has_targets[arn] for arn in lb_target_groups):
+            reason = None
+        elif lb_target_groups:
+            reason = 'no_registered_targets'
+        elif not any(page['Listeners'] for page in elb.get_paginator('describe_listeners').paginate(LoadBalancerArn=lb_arn)):
+            reason = 'no_listeners'
+        else:
+            reason = 'no_target_groups'
         
-        if not has_targets:
-            waste.append({
+        waste_checkpoint.store(state, lb_arn, fp, reason, now + CHECKPOINT_RECHECK_DAYS * 86400)
+        reasons[lb_arn] = reason
+    
+    for lb in lbs:
+        reason = reasons[lb['LoadBalancerArn']]
+        if reason:
+            yield {
                 'resource_id': lb['LoadBalancerName'],
-                'type': 'Application Load Balancer',
+                'type': LOAD_BALANCER_TYPES.get(lb['Type'], 'Load Balancer'),
                 'arn': lb['LoadBalancerArn'],
-                'estimated_monthly_cost': 22.50  # ~$0.025 per hour
-            })
-    return waste
+                'reason': reason,
+                'estimated_monthly_cost': priced(
+                    price_index.lookup(prices, 'elb', elb.meta.region_name, lb['Type']),
+                    price_index.HOURS_PER_MONTH,
+                    LOAD_BALANCER_MONTHLY_COST.get(lb['Type'], 22.50)
+                )
+            }
 
-def find_idle_rds_instances():
-    instances = rds.describe_db_instances()['DBInstances']
-    waste = []
+def target_group_has_targets(elb, tg_arn):
+    return bool(elb.describe_target_health(TargetGroupArn=tg_arn)['TargetHealthDescriptions'])
+
+def find_idle_rds_instances(clients, state):
+    """
+    Yield available RDS instances averaging under one connection over the
+    last 7 days. Unchanged instances are re-checked every CHECKPOINT_RECHECK_DAYS;
+    the rest have their connections fetched together in batched requests.
+    """
+    now = time.time()
+    instances = clients['rds'].describe_db_instances()['DBInstances']
     
+    results, unchecked = {}, {}
     for db in instances:
         if db['DBInstanceStatus'] == 'available':
-            # Check connections metric
-            try:
-                end_time = datetime.now()
-                start_time = end_time - timedelta(days=7)
-                
-                metrics = cloudwatch.get_metric_statistics(
-                    Namespace='AWS/RDS',
-                    MetricName='DatabaseConnections',
-                    Dimensions=[{'Name': 'DBInstanceIdentifier', 'Value': db['DBInstanceIdentifier']}],
-                    StartTime=start_time,
-                    EndTime=end_time,
-                    Period=86400,
-                    Statistics=['Average']
-                )
-                
-                avg_connections = sum(d['Average'] for d in metrics['Datapoints']) / len(metrics['Datapoints']) if metrics['Datapoints'] else 0
-                
-                if avg_connections < 1:  # Less than 1 connection per day on average
-                    waste.append({
-                        'resource_id': db['DBInstanceIdentifier'],
-                        'type': 'RDS Instance',
-                        'instance_class': db['DBInstanceClass'],
-                        'avg_connections': round(avg_connections, 2),
-                        'estimated_monthly_cost': 50  # Placeholder
-                    })
-            except:
-                pass
-    
-    return waste
-
-def calculate_savings(waste_resources):
-    total = 0
-    for category, resources in waste_resources.items():
-        for resource in resources:
-            total += resource.get('estimated_monthly_cost', 0)
-    return round(total, 2)
-
-def cleanup_waste(waste_resources):
-    results = {'deleted': [], 'failed': []}
+            fp = waste_checkpoint.fingerprint(db['DBInstanceStatus'], db['DBInstanceClass'], db['Engine'], db.get('InstanceCreateTime'))
+            hit, idle = waste_checkpoint.lookup(state, db['DBInstanceIdentifier'], fp, now)
+            if hit:
+                results[db['DBInstanceIdentifier']] = idle
+            else:
+                unchecked[db['DBInstanceIdentifier']] = fp
     
-    # Delete unattached volumes
-    for vol in waste_resources['unattached_volumes']:
+    if unchecked:
         try:
-            ec2.delete_volume(VolumeId=vol['resource_id'])
-            results['deleted'].append(vol['resource_id'])
+            connections = idle_rds_connections(clients['cloudwatch'], list(unchecked))
+            for db_identifier, fp in unchecked.items():
+                results[db_identifier] = connections[db_identifier]
+                waste_checkpoint.store(state, db_identifier, fp, connections[db_identifier], now + CHECKPOINT_RECHECK_DAYS * 86400)
         except Exception as e:
-            results['failed'].append({'resource': vol['resource_id'], 'error': str(e)})
+            print(f"Error checking RDS connections: {str(e)}")
     
-    # Release unused Elastic IPs
-    for eip in waste_resources['unused_elastic_ips']:
-        try:
-            ec2.release_address(AllocationId=eip['resource_id'])
-            results['deleted'].append(eip['resource_id'])
-        except Exception as e:
-            results['failed'].append({'resource': eip['resource_id'], 'error': str(e)})
+    for db in instances:
+        idle = results.get(db['DBInstanceIdentifier'])
+        if idle:
+            yield {
+                'resource_id': db['DBInstanceIdentifier'],
+                'type': 'RDS Instance',
+                'instance_class': db['DBInstanceClass'],
+                'avg_connections': idle['avg_connections'],
+                'estimated_monthly_cost': priced(
+                    price_index.rds_instance_hourly(
+                        prices, clients['rds'].meta.region_name, db['DBInstanceClass'], db['Engine'], db.get('MultiAZ', False)
+                    ),
+                    price_index.HOURS_PER_MONTH,
+                    50  # Placeholder when the instance class is not in the price index
+                )
+            }
+
+def idle_rds_connections(cloudwatch, db_identifiers):
+    """
+    identifier -> {'avg_connections': ...} for instances averaging below one
+    connection per day, else None
+    """
+    end_time = datetime.now()
+    start_time = end_time - timedelta(days=7)
     
-    # Delete old snapshots
-    for snap in waste_resources['old_snapshots']:
-        try:
-            ec2.delete_snapshot(SnapshotId=snap['resource_id'])
-            results['deleted'].append(snap['resource_id'])
-        except Exception as e:
-            results['failed'].append({'resource': snap['resource_id'], 'error': str(e)})
+    series = metric_fetch.fetch(cloudwatch, {
+        db_identifier: metric_fetch.metric_query(
+            'AWS/RDS', 'DatabaseConnections', [{'Name': 'DBInstanceIdentifier', 'Value': db_identifier}], 'Average', 86400
+        )
+        for db_identifier in db_identifiers
+    }, start_time, end_time)
     
+    results = {}
+    for db_identifier, daily in series.items():
+        avg_connections = metric_fetch.mean(daily, 0)
+        # Less than 1 connection per day on average
+        results[db_identifier] = {'avg_connections': round(avg_connections, 2)} if avg_connections < 1 else None
     return results
 
+def priced(price, quantity, fallback):
+    """price x quantity from the price index, or the fallback estimate when it has no entry"""
+    return round(price * quantity, 2) if price is not None else fallback
+
+def calculate_savings(waste_resources):
+    return round(sum(w['estimated_monthly_cost'] for w in waste_resources.values()), 2)
+
+# Waste category -> finder(clients, checkpoint state) yielding waste records
+FINDERS = {
+    'unattached_volumes': find_unattached_volumes,
+    'unused_elastic_ips': find_unused_elastic_ips,
+    'old_snapshots': find_old_snapshots,
+    'unused_load_balancers': find_unused_load_balancers,
+    'idle_rds_instances': find_idle_rds_instances
+}
+
+# Waste category -> (rate-limited API, cleanup(ec2 client, record))
+CLEANUP_ACTIONS = {
+    'unattached_volumes': ('DeleteVolume', lambda ec2, r: ec2.delete_volume(VolumeId=r['resource_id'])),
+    'unused_elastic_ips': ('ReleaseAddress', lambda ec2, r: ec2.release_address(AllocationId=r['resource_id'])),
+    'old_snapshots': ('DeleteSnapshot', lambda ec2, r: ec2.delete_snapshot(SnapshotId=r['resource_id']))
+}
+
 def send_notification(report):
     total = report['summary']['total_waste_resources']
     savings = report['summary']['estimated_monthly_savings']
@@ -209,18 +473,31 @@ WASTE RESOURCES DETECTED: {total}
 Estimated Monthly Savings: ${savings:.2f}
 
 Breakdown:
-- Unattached EBS Volumes: {len(report['waste_resources']['unattached_volumes'])}
-- Unused Elastic IPs: {len(report['waste_resources']['unused_elastic_ips'])}
-- Old Snapshots (>1 year): {len(report['waste_resources']['old_snapshots'])}
-- Unused Load Balancers: {len(report['waste_resources']['unused_load_balancers'])}
-- Idle RDS Instances: {len(report['waste_resources']['idle_rds_instances'])}
+- Unattached EBS Volumes: {report['waste_resources']['unattached_volumes']['count']}
+- Unused Elastic IPs: {report['waste_resources']['unused_elastic_ips']['count']}
+- Old Snapshots (>1 year): {report['waste_resources']['old_snapshots']['count']}
+- Unused Load Balancers: {report['waste_resources']['unused_load_balancers']['count']}
+- Idle RDS Instances: {report['waste_resources']['idle_rds_instances']['count']}
+Unchanged since last scan (not re-evaluated): {report['summary']['resources_skipped']}
 
 Mode: {'DRY RUN' if DRY_RUN else 'ACTIVE'}
 Auto-Delete: {'ENABLED' if AUTO_DELETE else 'DISABLED'}
 """
     
+    if len(report['regions']) > 1:
+        message += "\nBy Region:\n" + "\n".join(
+            f"- {region}: {r['total_waste_resources']} resources, ${r['estimated_monthly_savings']:.2f}/month"
+            + (f" (errors: {', '.join(r['errors'])})" if r['errors'] else "")
+            for region, r in report['regions'].items()
+        )
+    
     if 'cleanup_results' in report:
-        message += f"\n\nCleanup Results:\n- Deleted: {len(report['cleanup_results']['deleted'])}\n- Failed: {len(report['cleanup_results']['failed'])}"
+        cleanup = report['cleanup_results']
+        message += (
+            f"\n\nCleanup Results:\n- Deleted: {cleanup['deleted'] + cleanup['already_deleted']}"
+            f"\n- Failed: {len(cleanup['failed'])}\n- Skipped (done or given up earlier): {cleanup['skipped']}"
+            f"\n- Pending (resumes next run): {cleanup['pending']}"
+        )
     
     sns.publish(TopicArn=SNS_TOPIC_ARN, Subject=f"Waste Detection: {PROJECT_NAME}", Message=message)
 
@@ -259,6 +259,86 @@ resource "aws_glue_catalog_database" "cost_analytics" {
   })
 }
 
+# Crawls the Parquet CUR into the table the Lambdas query (CUR_TABLE): named
+# after the report folder, partitioned by year and month
+resource "aws_glue_crawler" "cur" {
+  name          = "${var.project_name}-${var.environment}-cur-crawler"
+  database_name = aws_glue_catalog_database.cost_analytics.name
+  role          = aws_iam_role.cur_crawler.arn
+  schedule      = "cron(0 6 * * ? *)"
+
+  s3_target {
+    path       = "s3://${aws_s3_bucket.cost_reports.id}/cur/${aws_cur_report_definition.finops.report_name}/${aws_cur_report_definition.finops.report_name}/"
+    exclusions = ["**.json", "**.yml", "**.sql", "**.csv", "**.gz", "**.zip"]
+  }
+
+  schema_change_policy {
+    update_behavior = "UPDATE_IN_DATABASE"
+    delete_behavior = "LOG"
+  }
+
+  tags = merge(var.tags, {
+    Name    = "${var.project_name}-${var.environment}-cur-crawler"
+    Purpose = "FinOps CUR table for Athena"
+  })
+}
+
+resource "aws_iam_role" "cur_crawler" {
+  name = "${var.project_name}-${var.environment}-cur-crawler"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Action = "sts:AssumeRole"
+      Effect = "Allow"
+      Principal = {
+        Service = "glue.amazonaws.com"
+      }
+    }]
+  })
+
+  tags = merge(var.tags, {
+    Name = "${var.project_name}-${var.environment}-cur-crawler-role"
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "cur_crawler_service" {
+  role       = aws_iam_role.cur_crawler.name
+  policy_arn = "arn:aws:iam::aws:policy/service-role/AWSGlueServiceRole"
+}
+
+resource "aws_iam_role_policy" "cur_crawler" {
+  name = "cur-crawler-policy"
+  role = aws_iam_role.cur_crawler.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject"
+        ]
+        Resource = "${aws_s3_bucket.cost_reports.arn}/cur/*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = aws_s3_bucket.cost_reports.arn
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "kms:Decrypt"
+        ]
+        Resource = aws_kms_key.finops.arn
+      }
+    ]
+  })
+}
+
 # ============================================================
 # Lambda: Cost Analyzer - Advanced Cost Analysis
 # ============================================================
@@ -272,6 +352,7 @@ resource "aws_lambda_function" "cost_analyzer" {
   runtime          = "python3.11"
   timeout          = 300
   memory_size      = 512
+  layers           = var.numpy_layer_arn != "" ? [var.numpy_layer_arn] : []
 
   environment {
     variables = {
@@ -279,9 +360,11 @@ resource "aws_lambda_function" "cost_analyzer" {
       ENVIRONMENT           = var.environment
       COST_BUCKET           = aws_s3_bucket.cost_reports.id
       ATHENA_DATABASE       = aws_glue_catalog_database.cost_analytics.name
+      CUR_TABLE             = replace(aws_cur_report_definition.finops.report_name, "-", "_")
       SNS_TOPIC_ARN         = aws_sns_topic.finops_alerts.arn
       WASTE_THRESHOLD_USD   = var.waste_threshold_usd
       ANOMALY_THRESHOLD_PCT = var.anomaly_threshold_percentage
+      CUBE_TAG_COLUMN       = var.cost_cube_tag_column
     }
   }
 
@@ -354,12 +437,40 @@ resource "aws_iam_role_policy" "cost_analyzer_lambda" {
           "${aws_s3_bucket.cost_reports.arn}/*"
         ]
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject"
+        ]
+        Resource = [
+          "${aws_s3_bucket.cost_reports.arn}/cost-history/*",
+          "${aws_s3_bucket.cost_reports.arn}/cost-forecast/*",
+          "${aws_s3_bucket.cost_reports.arn}/cost-cube/*",
+          "${aws_s3_bucket.cost_reports.arn}/athena-results/*"
+        ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetBucketLocation"
+        ]
+        Resource = aws_s3_bucket.cost_reports.arn
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "kms:Decrypt",
+          "kms:GenerateDataKey"
+        ]
+        Resource = aws_kms_key.finops.arn
+      },
       {
         Effect = "Allow"
         Action = [
           "athena:StartQueryExecution",
           "athena:GetQueryExecution",
-          "athena:GetQueryResults"
+          "athena:GetQueryResults",
+          "athena:StopQueryExecution"
         ]
         Resource = "*"
       },
@@ -402,6 +513,103 @@ resource "aws_iam_role_policy" "cost_analyzer_lambda" {
   })
 }
 
+# ============================================================
+# Lambda: Cost Cube Query - Slice/Dice Cost Queries
+# ============================================================
+
+# The cube is NumPy-only, so the query Lambda is deployed only with the layer
+resource "aws_lambda_function" "cost_cube_query" {
+  count = var.numpy_layer_arn != "" ? 1 : 0
+
+  filename         = "${path.module}/lambda/cost_cube_query.zip"
+  function_name    = "${var.project_name}-${var.environment}-cost-cube-query"
+  role             = aws_iam_role.cost_cube_query_lambda[0].arn
+  handler          = "cost_cube_query.handler"
+  source_code_hash = filebase64sha256("${path.module}/lambda/cost_cube_query.zip")
+  runtime          = "python3.11"
+  timeout          = 30
+  memory_size      = 512
+  layers           = [var.numpy_layer_arn]
+
+  environment {
+    variables = {
+      PROJECT_NAME = var.project_name
+      ENVIRONMENT  = var.environment
+      COST_BUCKET  = aws_s3_bucket.cost_reports.id
+    }
+  }
+
+  tags = merge(var.tags, {
+    Name    = "${var.project_name}-${var.environment}-cost-cube-query"
+    Purpose = "FinOps cost cube queries for dashboards and chargeback"
+  })
+}
+
+# IAM role for cost cube query Lambda
+resource "aws_iam_role" "cost_cube_query_lambda" {
+  count = var.numpy_layer_arn != "" ? 1 : 0
+
+  name = "${var.project_name}-${var.environment}-cost-cube-query-lambda"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Action = "sts:AssumeRole"
+      Effect = "Allow"
+      Principal = {
+        Service = "lambda.amazonaws.com"
+      }
+    }]
+  })
+
+  tags = merge(var.tags, {
+    Name = "${var.project_name}-${var.environment}-cost-cube-query-lambda-role"
+  })
+}
+
+resource "aws_iam_role_policy" "cost_cube_query_lambda" {
+  count = var.numpy_layer_arn != "" ? 1 : 0
+
+  name = "cost-cube-query-policy"
+  role = aws_iam_role.cost_cube_query_lambda[0].id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject"
+        ]
+        Resource = "${aws_s3_bucket.cost_reports.arn}/cost-cube/*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = aws_s3_bucket.cost_reports.arn
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "kms:Decrypt"
+        ]
+        Resource = aws_kms_key.finops.arn
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "logs:CreateLogGroup",
+          "logs:CreateLogStream",
+          "logs:PutLogEvents"
+        ]
+        Resource = "arn:aws:logs:*:*:*"
+      }
+    ]
+  })
+}
+
 # ============================================================
 # Lambda: Rightsizing Advisor - Automated Rightsizing
 # ============================================================
@@ -423,8 +631,10 @@ resource "aws_lambda_function" "rightsizing_advisor" {
       SNS_TOPIC_ARN            = aws_sns_topic.finops_alerts.arn
       CPU_THRESHOLD_LOW        = var.rightsizing_cpu_threshold_low
       CPU_THRESHOLD_HIGH       = var.rightsizing_cpu_threshold_high
+      HEADROOM_PERCENT         = var.rightsizing_headroom_percent
       AUTO_APPLY_RECOMMENDATIONS = var.auto_apply_rightsizing
       DRY_RUN                  = var.rightsizing_dry_run
+      COST_BUCKET              = aws_s3_bucket.cost_reports.id
     }
   }
 
@@ -493,10 +703,34 @@ resource "aws_iam_role_policy" "rightsizing_lambda" {
           "ec2:DescribeInstanceTypes",
           "cloudwatch:GetMetricStatistics",
           "cloudwatch:GetMetricData",
+          "cloudwatch:ListMetrics",
           "ce:GetRightsizingRecommendation"
         ]
         Resource = "*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject"
+        ]
+        Resource = "${aws_s3_bucket.cost_reports.arn}/rightsizing/*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = aws_s3_bucket.cost_reports.arn
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "kms:Decrypt",
+          "kms:GenerateDataKey"
+        ]
+        Resource = aws_kms_key.finops.arn
+      },
       {
         Effect = "Allow"
         Action = [
@@ -553,6 +787,8 @@ resource "aws_lambda_function" "waste_elimination" {
       AUTO_DELETE_RESOURCES = var.auto_delete_waste
       DRY_RUN               = var.waste_cleanup_dry_run
       UNUSED_DAYS_THRESHOLD = var.unused_resource_days
+      WASTE_SCAN_REGIONS    = join(",", var.waste_scan_regions)
+      COST_BUCKET           = aws_s3_bucket.cost_reports.id
     }
   }
 
@@ -621,12 +857,16 @@ resource "aws_iam_role_policy" "waste_elimination_lambda" {
           "ec2:DescribeSnapshots",
           "ec2:DescribeImages",
           "ec2:DescribeAddresses",
-          "elb:DescribeLoadBalancers",
+          "ec2:DescribeRegions",
+          "elasticloadbalancing:DescribeLoadBalancers",
+          "elasticloadbalancing:DescribeTargetGroups",
+          "elasticloadbalancing:DescribeTargetHealth",
+          "elasticloadbalancing:DescribeListeners",
           "rds:DescribeDBInstances",
           "s3:ListAllMyBuckets",
           "s3:GetBucketLocation",
           "s3:GetBucketTagging",
-          "cloudwatch:GetMetricStatistics"
+          "cloudwatch:GetMetricData"
         ]
         Resource = "*"
       },
@@ -640,6 +880,32 @@ resource "aws_iam_role_policy" "waste_elimination_lambda" {
         ]
         Resource = "*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject"
+        ]
+        Resource = [
+          "${aws_s3_bucket.cost_reports.arn}/waste-cleanup/*",
+          "${aws_s3_bucket.cost_reports.arn}/waste-checkpoint/*"
+        ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = aws_s3_bucket.cost_reports.arn
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "kms:Decrypt",
+          "kms:GenerateDataKey"
+        ]
+        Resource = aws_kms_key.finops.arn
+      },
       {
         Effect = "Allow"
         Action = [
@@ -726,6 +992,17 @@ resource "aws_cloudwatch_log_group" "cost_analyzer" {
   })
 }
 
+resource "aws_cloudwatch_log_group" "cost_cube_query" {
+  count = var.numpy_layer_arn != "" ? 1 : 0
+
+  name              = "/aws/lambda/${aws_lambda_function.cost_cube_query[0].function_name}"
+  retention_in_days = 30
+
+  tags = merge(var.tags, {
+    Name = "${var.project_name}-${var.environment}-cost-cube-query-logs"
+  })
+}
+
 resource "aws_cloudwatch_log_group" "rightsizing_advisor" {
   name              = "/aws/lambda/${aws_lambda_function.rightsizing_advisor.function_name}"
   retention_in_days = 30
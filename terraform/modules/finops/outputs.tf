@@ -66,6 +66,16 @@ output "cost_analyzer_lambda_name" {
   value       = aws_lambda_function.cost_analyzer.function_name
 }
 
+output "cost_cube_query_lambda_arn" {
+  description = "ARN of the cost cube query Lambda function"
+  value       = var.numpy_layer_arn != "" ? aws_lambda_function.cost_cube_query[0].arn : null
+}
+
+output "cost_cube_query_lambda_name" {
+  description = "Name of the cost cube query Lambda function"
+  value       = var.numpy_layer_arn != "" ? aws_lambda_function.cost_cube_query[0].function_name : null
+}
+
 output "rightsizing_advisor_lambda_arn" {
   description = "ARN of the rightsizing advisor Lambda function"
   value       = aws_lambda_function.rightsizing_advisor.arn
@@ -130,6 +130,17 @@ variable "rightsizing_cpu_threshold_high" {
   }
 }
 
+variable "rightsizing_headroom_percent" {
+  description = "Spare capacity a recommended instance type must keep above the observed p95 utilization"
+  type        = number
+  default     = 30
+
+  validation {
+    condition     = var.rightsizing_headroom_percent >= 0 && var.rightsizing_headroom_percent < 90
+    error_message = "Rightsizing headroom must be between 0 and 89."
+  }
+}
+
 variable "auto_apply_rightsizing" {
   description = "Automatically apply rightsizing recommendations (use with caution)"
   type        = bool
@@ -180,6 +191,33 @@ variable "waste_cleanup_dry_run" {
   default     = true
 }
 
+variable "waste_scan_regions" {
+  description = "Regions swept for waste in parallel. Empty scans the Lambda's own region; [\"all\"] scans every region enabled for the account"
+  type        = list(string)
+  default     = []
+}
+
+# ============================================================
+# Lambda Runtime Configuration
+# ============================================================
+
+variable "numpy_layer_arn" {
+  description = "ARN of a Lambda layer providing NumPy (e.g. the AWS SDK for pandas layer). Enables the vectorized cost analysis engines and deploys the cost cube query Lambda; without it the other Lambdas fall back to pure-Python analysis"
+  type        = string
+  default     = ""
+}
+
+variable "cost_cube_tag_column" {
+  description = "CUR Athena column of the cost allocation tag used as the cost cube's tag dimension (e.g. resource_tags_user_team). Leave empty to omit the tag dimension"
+  type        = string
+  default     = ""
+
+  validation {
+    condition     = can(regex("^([A-Za-z_][A-Za-z0-9_]*)?$", var.cost_cube_tag_column))
+    error_message = "Cost cube tag column must be a valid CUR column name."
+  }
+}
+
 # ============================================================
 # Notification Configuration
 # ============================================================
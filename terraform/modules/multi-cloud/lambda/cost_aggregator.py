@@ -2,6 +2,8 @@
 import os, json, boto3
 from datetime import datetime, timedelta
 
+from ce_reader import iter_cost_rows, fold_cost_rows
+
 dynamodb = boto3.resource('dynamodb')
 ce = boto3.client('ce')  # Cost Explorer
 cloudwatch = boto3.client('cloudwatch')
@@ -71,7 +73,8 @@ def handler(event, context):
 def get_aws_costs(start_date, end_date):
     """Get AWS costs via Cost Explorer"""
     try:
-        response = ce.get_cost_and_usage(
+        rows = iter_cost_rows(
+            ce.get_cost_and_usage,
             TimePeriod={
                 'Start': start_date.strftime('%Y-%m-%d'),
                 'End': end_date.strftime('%Y-%m-%d')
@@ -80,10 +83,8 @@ def get_aws_costs(start_date, end_date):
             Metrics=['UnblendedCost']
         )
         
-        if response['ResultsByTime']:
-            amount = float(response['ResultsByTime'][0]['Total']['UnblendedCost']['Amount'])
-            return round(amount, 2)
-        return 0.0
+        amount = sum(fold_cost_rows(rows).values())
+        return round(amount, 2)
     except Exception as e:
         print(f"AWS cost error: {e}")
         return 0.0
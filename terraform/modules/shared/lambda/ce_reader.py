@@ -0,0 +1,60 @@
+"""
+Cost Explorer Reader - Stream paginated Cost Explorer results
+Follows NextPageToken and folds rows into running per-key aggregates,
+so totals are exact and no page is held in memory after it is consumed.
+"""
+
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+
+CostRow = Tuple[str, Tuple[str, ...], Decimal]
+
+def iter_pages(request: Callable[..., Dict[str, Any]], **params) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every response page of a Cost Explorer operation.
+    `request` is the bound client method (or a wrapper around it).
+    """
+    params = dict(params)
+    while True:
+        page = request(**params)
+        yield page
+
+        token = page.get('NextPageToken')
+        if not token:
+            return
+        params['NextPageToken'] = token
+
+def iter_items(request: Callable[..., Dict[str, Any]], items_key: str, **params) -> Iterator[Dict[str, Any]]:
+    """Yield the items listed under `items_key` across all pages"""
+    for page in iter_pages(request, **params):
+        yield from page.get(items_key, [])
+
+def iter_cost_rows(request: Callable[..., Dict[str, Any]], metric: str = 'UnblendedCost', **params) -> Iterator[CostRow]:
+    """
+    Yield (period_start, group_keys, amount) for every row of a
+    get_cost_and_usage query. Ungrouped queries yield one row per
+    period with empty group_keys.
+    """
+    grouped = bool(params.get('GroupBy'))
+
+    for page in iter_pages(request, **params):
+        for result in page['ResultsByTime']:
+            period = result['TimePeriod']['Start']
+
+            if grouped:
+                for group in result.get('Groups', []):
+                    yield period, tuple(group['Keys']), Decimal(group['Metrics'][metric]['Amount'])
+            elif metric in result.get('Total', {}):
+                yield period, (), Decimal(result['Total'][metric]['Amount'])
+
+def fold_cost_rows(rows: Iterable[CostRow], key: Callable[[str, Tuple[str, ...]], Any] = None) -> Dict[Any, float]:
+    """
+    Fold cost rows into exact running totals per key.
+    `key(period, group_keys)` picks the aggregate; defaults to the group keys.
+    """
+    totals = {}
+    for period, group_keys, amount in rows:
+        k = key(period, group_keys) if key else group_keys
+        totals[k] = totals.get(k, Decimal(0)) + amount
+
+    return {k: float(v) for k, v in totals.items()}
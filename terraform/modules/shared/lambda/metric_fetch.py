@@ -0,0 +1,92 @@
+"""
+Metric Fetch - Batched CloudWatch GetMetricData reads
+Packs up to 500 metric queries into each GetMetricData request, follows
+NextToken, and runs the requests concurrently, so reading one metric for
+thousands of resources takes a handful of calls instead of one
+GetMetricStatistics call per resource and metric.
+
+Queries are keyed by any hashable value, typically (resource_id, metric).
+Each key maps to an aligned pair of lists, timestamps (epoch seconds)
+ascending and their values.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, List, Sequence, Tuple
+
+MAX_QUERIES_PER_REQUEST = 500
+
+Series = Tuple[List[float], List[float]]
+
+def metric_query(namespace: str, metric_name: str, dimensions: Sequence[Dict[str, str]],
+                 stat: str = 'Average', period: int = 300) -> Dict[str, Any]:
+    """MetricStat for one series; dimensions as in GetMetricStatistics"""
+    return {
+        'Metric': {
+            'Namespace': namespace,
+            'MetricName': metric_name,
+            'Dimensions': list(dimensions)
+        },
+        'Period': period,
+        'Stat': stat
+    }
+
+def fetch(cloudwatch, queries: Dict[Hashable, Dict[str, Any]], start_time, end_time,
+          max_workers: int = 4) -> Dict[Hashable, Series]:
+    """
+    Run {key: metric_query(...)} between start_time and end_time. Every key
+    is present in the result; series without datapoints are empty.
+    """
+    keys = list(queries)
+    results = {key: ([], []) for key in keys}
+    batches = [keys[i:i + MAX_QUERIES_PER_REQUEST] for i in range(0, len(keys), MAX_QUERIES_PER_REQUEST)]
+
+    def run(batch):
+        # Query ids must start with a lower-case letter
+        ids = {f"q{i}": key for i, key in enumerate(batch)}
+        request = {
+            'MetricDataQueries': [
+                {'Id': query_id, 'MetricStat': queries[key], 'ReturnData': True}
+                for query_id, key in ids.items()
+            ],
+            'StartTime': start_time,
+            'EndTime': end_time,
+            'ScanBy': 'TimestampAscending'
+        }
+
+        while True:
+            response = cloudwatch.get_metric_data(**request)
+            for series in response['MetricDataResults']:
+                timestamps, values = results[ids[series['Id']]]
+                timestamps.extend(t.timestamp() for t in series['Timestamps'])
+                values.extend(series['Values'])
+                if series.get('StatusCode') == 'InternalError':
+                    print(f"Error fetching {ids[series['Id']]}: {series.get('Messages')}")
+
+            token = response.get('NextToken')
+            if not token:
+                return
+            request['NextToken'] = token
+
+    if len(batches) == 1:
+        run(batches[0])
+    elif batches:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+            list(pool.map(run, batches))
+
+    # Pages of one series arrive in order, but sort in case CloudWatch interleaves them
+    for key, (timestamps, values) in results.items():
+        if any(b < a for a, b in zip(timestamps, timestamps[1:])):
+            ordered = sorted(zip(timestamps, values))
+            results[key] = ([t for t, _ in ordered], [v for _, v in ordered])
+    return results
+
+def points(series: Series) -> List[Tuple[float, float]]:
+    """(timestamp, value) pairs of a fetched series"""
+    return list(zip(*series))
+
+def mean(series: Series, default: float = None) -> float:
+    values = series[1]
+    return sum(values) / len(values) if values else default
+
+def latest(series: Series, default: float = None) -> float:
+    return series[1][-1] if series[1] else default